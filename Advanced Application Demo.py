@@ -1,35 +1,45 @@
-# dash-bootstrap-components : Makes it easier to manage layout of application. 
-# Pandas Datareader : Retrieves data via an API. 
+# dash-bootstrap-components : Makes it easier to manage layout of application.
+# wb_fetch / wb_snapshot : Retrieve data via the World Bank API.
 from dash import Dash, html, dcc, Input, Output, State
 import plotly.express as px
 import dash_bootstrap_components as dbc
-import pandas as pd
-from pandas_datareader import wb
+from wb_fetch import WB_API_URL, fetch_pages, make_session
+from wb_snapshot import clean_countries, indicator_frame, merge_snapshot
 
 app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
 
-countries = wb.get_countries()
-countries["CapitalCity"].replace({"" : None}, inplace = True)
-countries.dropna(subset = ["CapitalCity"], inplace = True)
-countries = countries[["name", "iso3c"]]
-countries = countries[countries["name"] != "Kosovo"]
-countries.rename(colums = {"name":"country"})
+indicators = {
+    "IT.NET.USER.ZS" : "Individuals using the Internet (% of population)",
+    "SG.GEN.PARL.ZS" : "Proportion of seats held by women in national parliments (%)",
+    "EN.ATM.CO2E.KT" : "CO2 emissions (kt)"
+}
+
+session = make_session()
+
+# Countries with a capital city (no aggregates), without Kosovo, as country/iso3c
+countries = clean_countries(
+    fetch_pages(session, f"{WB_API_URL}/country", {"per_page" : 1000})[0]
+)
 
 def update_wb_data():
-    """ Retreives updaetd data from API connection. """
-    df = wb.download(
-        indicator = (list(indicators)), country = countries['is03'],
-        start = 2005, end = 2016
-    )
-    df = df.reset_index()
-    df.year = df.year.astype(int)
-    
-    # Add country ISO3 to main df
-    df = pd.merge(df, countries, on="country")
-    df = df.rename(columns=indicators)
-    return df
+    """ Retrieves the indicators for 2005-2016 from the API. """
+    frames = [
+        indicator_frame(
+            fetch_pages(
+                session, f"{WB_API_URL}/country/all/indicator/{indicator}",
+                {"date" : "2005:2016", "per_page" : 20000},
+            )[0],
+            indicator,
+        )
+        for indicator in indicators
+    ]
+    # Add country names to the data, keeping only the countries above
+    return merge_snapshot(countries, frames, indicators)
+
+# Annual data: downloaded once when the app starts, not per browser tab
+data = update_wb_data()
 
-applayout = dbc.Container(
+app.layout = dbc.Container(
     [
         dbc.Row(
             dbc.Col(
@@ -42,10 +52,10 @@ applayout = dbc.Container(
                 width=12
             )
         ),
-        dbc.row(
-            dbc.col(
+        dbc.Row(
+            dbc.Col(
                 [
-                    dbc.label("Select Data Set:",
+                    dbc.Label("Select Data Set:",
                         className="fw-bold",
                         style={"textDecoration": "underline", "fontSize": 20},),
                     dbc.RadioItems(
@@ -58,11 +68,11 @@ applayout = dbc.Container(
                 width = 4,
             )
         ),
-        dbc.row(
+        dbc.Row(
             [
-                dbc.col(
+                dbc.Col(
                     [
-                        dbc.label(
+                        dbc.Label(
                             "Select Years:",
                             className="fw-bold",
                             style={"textDecoration": "underline", "fontSize": 20},),
@@ -71,20 +81,20 @@ applayout = dbc.Container(
                             min = 2005,
                             max = 2016,
                             step = 1,
-                            values=[2005,2006],
+                            value=[2005,2006],
                             marks={
                                 2005 : "2005",
-                                2005 : "'06",
-                                2005 : "'07",
-                                2005 : "'08",
-                                2005 : "'09",
-                                2005 : "'10",
-                                2005 : "'11",
-                                2005 : "'12",
-                                2005 : "'13",
-                                2005 : "'14",
-                                2005 : "'15",
-                                2005 : "2016",
+                                2006 : "'06",
+                                2007 : "'07",
+                                2008 : "'08",
+                                2009 : "'09",
+                                2010 : "'10",
+                                2011 : "'11",
+                                2012 : "'12",
+                                2013 : "'13",
+                                2014 : "'14",
+                                2015 : "'15",
+                                2016 : "2016",
                             },
                             ),
                         dbc.Button(
@@ -99,74 +109,37 @@ applayout = dbc.Container(
                 ),
             ]
         ),
-        dcc.Store(id = "storage", storage_type="local", data = {}),
-        dcc.Interval(id = "time", interval = 1000 * 60, n_intervals = 0),
     ]
 )
 
-
-indicators = {
-    "IT.NET.USER.ZS" : "Individuals using the Internet (% of population)",
-    "SG.GEN.PARL.ZS" : "Proportion of seats held by women in national parliments (%)",
-    "EN.ATM.CO2E.KT" : "CO2 emissions (kt)"
-}
-
-@app.callback(Output("storage","data"), input("timer","n_intervals"))
-def store_data(n_time):
-    dataframe = update_wb_data()
-    return dataframe.to_dict("records")
-
 @app.callback(
-    Output("my_choropleth", "figure"),
-    Input("my_button", "n_clicks"),
-    Input("storage", "data"),
+    Output("my-choropleth", "figure"),
+    Input("my-button", "n_clicks"),
     State("years-range","value"),
     State("radio-indicator", "value"),
 )
-def update_graph(n_clicks, stored_dataframe, years_chosen, indct_chosen):
-    dff = pd.DataFrame.from_records(stored_dataframe)
-    print(years_chosen)
-    
-    if years_chosen[0] != years_chosen[1]:
-        dff = dff[dff.year.between(years_chosen[0], years_chosen[1])]
-        dff = dff.groupby(["iso3c", "country"])[indct_chosen].mean()
-        dff.reset_index(inplace = True)
-        
-        fig = px.choropleth(
-            data_frame=dff, 
-            location = "iso3c",
-            color=indct_chosen,
-            scope="world",
-            hover_data={"iso3c" : False, "country" : True},
-            labels = {
-                indicators["SG.GEN.PARL.ZS"] : "% parliment women",
-                indicators["IT.NET.USER.ZS"] : "pop % using interet",
-            },
-        )
-        fig.update_layout(
-            geo = {"projection" : {"type" : "natural earth"}},
-            margin = dict(l=50, r = 50, t = 50, b = 50),
-        )
-        return fig
-    
-    if years_chosen[0] == years_chosen[1]:
-        dff = dff[dff["year"].isin(years_chosen)]
-        fig = px.choropleth(
-            data_frame=dff, 
-            location = "iso3c",
-            color=indct_chosen,
-            scope="world",
-            hover_data={"iso3c" : False, "country" : True},
-            labels = {
-                indicators["SG.GEN.PARL.ZS"] : "% parliment women",
-                indicators["IT.NET.USER.ZS"] : "pop % using interet",
-            },
-        )
-        fig.update_layout(
-            geo = {"projection" : {"type" : "natural earth"}},
-            margin = dict(l=50, r = 50, t = 50, b = 50),
-        )
-        return fig
-    
+def update_graph(n_clicks, years_chosen, indct_chosen):
+    # Mean of each country over the chosen years (a single year when equal)
+    dff = data[data.year.between(years_chosen[0], years_chosen[1])]
+    dff = dff.groupby(["iso3c", "country"])[indct_chosen].mean()
+    dff = dff.reset_index()
+
+    fig = px.choropleth(
+        data_frame=dff,
+        locations = "iso3c",
+        color=indct_chosen,
+        scope="world",
+        hover_data={"iso3c" : False, "country" : True},
+        labels = {
+            indicators["SG.GEN.PARL.ZS"] : "% parliment women",
+            indicators["IT.NET.USER.ZS"] : "pop % using interet",
+        },
+    )
+    fig.update_layout(
+        geo = {"projection" : {"type" : "natural earth"}},
+        margin = dict(l=50, r = 50, t = 50, b = 50),
+    )
+    return fig
+
 if __name__ == "__main__":
-    app.run_server(debug = True)
\ No newline at end of file
+    app.run_server(debug = True)
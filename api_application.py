@@ -1,171 +1,247 @@
 # dash-bootstrap-components : Makes it easier to manage layout of application. 
-# Pandas Datareader : Retrieves data via an API. 
+import os
+import threading
+
 from dash import Dash, html, dcc, Input, Output, State
-import plotly.express as px
 import dash_bootstrap_components as dbc
-import pandas as pd
-from pandas_datareader import wb
-
-app = Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
-
-countries = wb.get_countries()
-countries["capitalCity"].replace({"" : None}, inplace = True)
-countries.dropna(subset = ["capitalCity"], inplace = True)
-countries = countries[["name", "iso3c"]]
-countries = countries[countries["name"] != "Kosovo"]
-countries.rename(columns = {"name":"country"}, inplace = True)
-
-indicators = {
-    "IT.NET.USER.ZS" : "Individuals using the Internet (% of population)",
-    "SG.GEN.PARL.ZS" : "Proportion of seats held by women in national parliments (%)",
-    "EN.ATM.CO2E.KT" : "CO2 emissions (kt)"
-}
-
-def update_wb_data():
-    """ Retreives updaetd data from API connection. """
-    df = wb.download(
-        indicator = (list(indicators)), country = countries['iso3c'],
-        start = 2005, end = 2016
-    )
-    df = df.reset_index()
-    df.year = df.year.astype(int)
-    
-    # Add country ISO3 to main df
-    df = pd.merge(df, countries, on="country")
-    df = df.rename(columns=indicators)
-    return df
-
-app.layout = dbc.Container(
-    [
-        dbc.Row(
-            dbc.Col(
-                [
-                    html.H1(
-                        "Comparison of World Bank Country Data",
-                        style={"textAlign": "center"},),
-                    dcc.Graph(id="my_choropleth", figure={})
-                ],
-                width=12
-            )
-        ),
-        dbc.Row(
-            dbc.Col(
-                [
-                    dbc.Label("Select Data Set:",
-                        className="fw-bold",
-                        style={"textDecoration": "underline", "fontSize": 20},),
-                    dbc.RadioItems(
-                        id = "radio-indicator",
-                        options = [{"label" : i, "value" : i} for i in indicators.values()],
-                        value = list(indicators.values())[0],
-                        input_class_name="me-2",
-                        ),
-                ],
-                width = 4,
-            )
-        ),
-        dbc.Row(
-            [
+from callback_metrics import instrument, phase
+from figure_cache import FigureCache, make_key
+from figure_encoding import (
+    COMPRESS_RESPONSES, ENCODING, compress_responses, plotly_scripts
+)
+from figure_templates import FigureTemplate
+from snapshot_events import CLIENT_SCRIPT, EVENTS_PATH, VersionBroadcaster, register
+from static_figures import LOADER_SCRIPT, StaticViews
+from wb_cube import get_cube
+from wb_snapshot import (
+    INDICATOR_LABELS,
+    INDICATORS,
+    SnapshotWriter,
+    get_snapshot,
+    read_latest,
+)
+
+app = Dash(
+    __name__,
+    external_stylesheets=[dbc.themes.BOOTSTRAP],
+    external_scripts=plotly_scripts(),
+)
+if COMPRESS_RESPONSES:
+    compress_responses(app.server)
+
+# Built figures are shared between workers through the on-disk cache
+figure_cache = FigureCache()
+
+# Latency, payload size and cache hit metrics of every callback, on /metrics
+metrics = instrument(app)
+metrics.watch_cache(figure_cache)
+
+# Data comes from the snapshot published by the wb_snapshot.py refresher.
+# The indicators are configured in indicators.json
+indicators = INDICATORS
+
+# Landing view: the first indicator over the first two years
+DEFAULT_INDICATOR = list(indicators.values())[0]
+DEFAULT_YEARS = [2005, 2006]
+
+# WB_REFRESH_IN_APP=1 runs the refresher in a background thread instead of a
+# separate process. Startup never waits on the network either way; the file
+# lock keeps it to one refresher across workers.
+if os.environ.get("WB_REFRESH_IN_APP"):
+    threading.Thread(target=SnapshotWriter().run_forever, daemon=True).start()
+
+# New snapshot versions are pushed to the browser over server-sent events
+snapshot_events = register(app.server, VersionBroadcaster())
+
+# The landing view is prebuilt per snapshot version and served as static JSON
+static_views = StaticViews(
+    app.server, lambda: (read_latest() or {}).get("version"), ENCODING
+)
+
+def serve_layout():
+    """Builds the layout, pointing it at the landing view of the current
+    snapshot."""
+    version = (read_latest() or {}).get("version")
+    return dbc.Container(
+        [
+            dbc.Row(
                 dbc.Col(
                     [
-                        dbc.Label(
-                            "Select Years:",
+                        html.H1(
+                            "Comparison of World Bank Country Data",
+                            style={"textAlign": "center"},),
+                        dcc.Graph(id="my_choropleth", figure={})
+                    ],
+                    width=12
+                )
+            ),
+            dbc.Row(
+                dbc.Col(
+                    [
+                        dbc.Label("Select Data Set:",
                             className="fw-bold",
                             style={"textDecoration": "underline", "fontSize": 20},),
-                        dcc.RangeSlider(
-                            id = "years-range",
-                            min = 2005,
-                            max = 2016,
-                            step = 1,
-                            value=[2005,2006],
-                            marks={
-                                2005 : "2005",
-                                2005 : "'06",
-                                2005 : "'07",
-                                2005 : "'08",
-                                2005 : "'09",
-                                2005 : "'10",
-                                2005 : "'11",
-                                2005 : "'12",
-                                2005 : "'13",
-                                2005 : "'14",
-                                2005 : "'15",
-                                2005 : "2016",
-                            },
+                        dbc.RadioItems(
+                            id = "radio-indicator",
+                            options = [{"label" : i, "value" : i} for i in indicators.values()],
+                            value = DEFAULT_INDICATOR,
+                            input_class_name="me-2",
                             ),
-                        dbc.Button(
-                            id="my_button",
-                            children="Submit",
-                            n_clicks=0,
-                            color="primary",
-                            className="mt-4",
-                        )
                     ],
-                    width = 6,
-                ),
-            ]
-        ),
-        dcc.Store(id = "storage", storage_type="local", data = {}),
-        dcc.Interval(id = "timer", interval = 1000 * 60, n_intervals = 0),
-    ]
+                    width = 4,
+                )
+            ),
+            dbc.Row(
+                [
+                    dbc.Col(
+                        [
+                            dbc.Label(
+                                "Select Years:",
+                                className="fw-bold",
+                                style={"textDecoration": "underline", "fontSize": 20},),
+                            dcc.RangeSlider(
+                                id = "years-range",
+                                min = 2005,
+                                max = 2016,
+                                step = 1,
+                                value=DEFAULT_YEARS,
+                                marks={
+                                    2005 : "2005",
+                                    2005 : "'06",
+                                    2005 : "'07",
+                                    2005 : "'08",
+                                    2005 : "'09",
+                                    2005 : "'10",
+                                    2005 : "'11",
+                                    2005 : "'12",
+                                    2005 : "'13",
+                                    2005 : "'14",
+                                    2005 : "'15",
+                                    2005 : "2016",
+                                },
+                                ),
+                            dbc.Button(
+                                id="my_button",
+                                children="Submit",
+                                n_clicks=0,
+                                color="primary",
+                                className="mt-4",
+                            )
+                        ],
+                        width = 6,
+                    ),
+                ]
+            ),
+            # Only the snapshot version, starting with the one the page shows;
+            # the server holds the data itself
+            dcc.Store(id = "storage", storage_type="memory", data = version),
+            # The prebuilt landing view; "render" when the callbacks must draw it
+            dcc.Store(id = "default-view-url", data = static_views.url("choropleth")),
+            dcc.Store(id = "default-view"),
+        ]
+    )
+
+app.layout = serve_layout
+
+# Trace and layout skeleton of the choropleth, as plotly.express draws it
+CHOROPLETH = FigureTemplate(
+    {"type": "choropleth", "coloraxis": "coloraxis", "geo": "geo", "name": ""},
+    {
+        "geo": {
+            "domain": {"x": [0, 1], "y": [0, 1]},
+            "center": {},
+            "scope": "world",
+            "projection": {"type": "natural earth"},
+        },
+        "coloraxis": {"colorscale": "Plasma"},
+        "legend": {"tracegroupgap": 0},
+        "margin": {"l": 50, "r": 50, "t": 50, "b": 50},
+    },
 )
 
-@app.callback(Output("storage","data"), Input("timer","n_intervals"))
-def store_data(n_time):
-    dataframe = update_wb_data()
-    return dataframe.to_dict("records")
+def make_choropleth(dff, indct_chosen):
+    """ Builds the choropleth from one value per country. """
+    label = INDICATOR_LABELS.get(indct_chosen, indct_chosen)
+    trace = {
+        "locations": dff["iso3c"].to_numpy(),
+        "z": dff[indct_chosen].to_numpy(),
+        "customdata": dff[["iso3c", "country"]].to_numpy(),
+        "hovertemplate": f"country=%{{customdata[1]}}<br>{label}=%{{z}}<extra></extra>",
+    }
+    return CHOROPLETH.figure(
+        [trace], {"coloraxis": {"colorbar": {"title": {"text": label}}}}
+    )
+
+# The Store only holds the snapshot version, pushed by the server when a new
+# one is published. The data itself stays on the server and is looked up by
+# version in update_graph
+app.clientside_callback(
+    CLIENT_SCRIPT % EVENTS_PATH,
+    Output("storage", "data"),
+    Input("storage", "id"),
+    State("storage", "data"),
+)
+
+app.clientside_callback(
+    LOADER_SCRIPT,
+    Output("default-view", "data"),
+    Input("default-view-url", "data"),
+)
+
+def choropleth(version, indct_chosen, years_chosen):
+    """Returns the choropleth of one indicator's range mean, through the
+    figure cache."""
+    dff = get_snapshot(version) if isinstance(version, str) else None
+    if dff is None:
+        # No version yet, or it was pruned since the page loaded: use the
+        # latest data
+        latest = read_latest()
+        if latest is None:
+            return {}
+        version = latest["version"]
+        dff = get_snapshot(version)
+    
+    # Indicators added to the config since this snapshot was published
+    available = [i for i in indicators.values() if i in dff]
+    if indct_chosen not in available:
+        return {}
+    
+    # Range means come from the prefix-sum cube, no groupby per click
+    cube = get_cube(version, dff, available)
+    
+    key = make_key(
+        "choropleth", version, ENCODING, indct_chosen, years_chosen[0], years_chosen[1]
+    )
+    with phase("figure"):
+        return figure_cache.get_or_build(
+            key,
+            lambda: make_choropleth(
+                cube.mean(indct_chosen, years_chosen[0], years_chosen[1]), indct_chosen
+            ),
+        )
 
+# Nothing runs on page load, the landing figure comes from the prebuilt view
 @app.callback(
     Output("my_choropleth", "figure"),
     Input("my_button", "n_clicks"),
     Input("storage", "data"),
+    Input("default-view", "data"),
     State("years-range","value"),
     State("radio-indicator", "value"),
+    prevent_initial_call=True,
 )
-def update_graph(n_clicks, stored_dataframe, years_chosen, indct_chosen):
-    dff = pd.DataFrame.from_records(stored_dataframe)
-    print(years_chosen)
-    
-    if years_chosen[0] != years_chosen[1]:
-        dff = dff[dff.year.between(years_chosen[0], years_chosen[1])]
-        dff = dff.groupby(["iso3c", "country"])[indct_chosen].mean()
-        dff = dff.reset_index()
-        
-        fig = px.choropleth(
-            data_frame=dff, 
-            locations = "iso3c",
-            color=indct_chosen,
-            scope="world",
-            hover_data={"iso3c" : False, "country" : True},
-            labels = {
-                indicators["SG.GEN.PARL.ZS"] : "% parliment women",
-                indicators["IT.NET.USER.ZS"] : "pop % using interet",
-            },
-        )
-        fig.update_layout(
-            geo = {"projection" : {"type" : "natural earth"}},
-            margin = dict(l=50, r = 50, t = 50, b = 50),
-        )
-        return fig
-    
-    if years_chosen[0] == years_chosen[1]:
-        dff = dff[dff["year"].isin(years_chosen)]
-        fig = px.choropleth(
-            data_frame=dff, 
-            locations = "iso3c",
-            color=indct_chosen,
-            scope="world",
-            hover_data={"iso3c" : False, "country" : True},
-            labels = {
-                indicators["SG.GEN.PARL.ZS"] : "% parliment women",
-                indicators["IT.NET.USER.ZS"] : "pop % using interet",
-            },
-        )
-        fig.update_layout(
-            geo = {"projection" : {"type" : "natural earth"}},
-            margin = dict(l=50, r = 50, t = 50, b = 50),
-        )
-        return fig
+def update_graph(n_clicks, stored_version, default_view, years_chosen, indct_chosen):
+    return choropleth(stored_version, indct_chosen, years_chosen)
+
+@static_views.view("choropleth")
+def default_view(version):
+    return {"my_choropleth": {"figure": choropleth(version, DEFAULT_INDICATOR, DEFAULT_YEARS)}}
+
+@static_views.warm
+def warm_indicators(version):
+    # The other indicators over the default years are the next most viewed
+    for indicator in indicators.values():
+        choropleth(version, indicator, DEFAULT_YEARS)
     
 if __name__ == "__main__":
-    app.run_server(debug = True)
\ No newline at end of file
+    app.run_server(debug = True)
@@ -1,13 +1,42 @@
 # -*- coding: utf-8 -*-
-from dash import Dash, dcc, html, dash_table, Input, Output, State, callback_context
+import os
+import sys
+from functools import lru_cache
+
+from dash import (
+    Dash,
+    dcc,
+    html,
+    dash_table,
+    Input,
+    Output,
+    State,
+    Patch,
+    callback_context,
+    no_update,
+)
 import dash_bootstrap_components as dbc
 import plotly.graph_objects as go
+import numpy as np
 import pandas as pd
 
+# callback_metrics.py is at the top of the repository, one level up
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from callback_metrics import instrument, phase
+from figure_encoding import (
+    COMPRESS_RESPONSES, compress_responses, encode_array, plotly_scripts
+)
+
 app = Dash(
     __name__,
     external_stylesheets=[dbc.themes.SPACELAB, dbc.icons.FONT_AWESOME],
+    external_scripts=plotly_scripts(),
 )
+if COMPRESS_RESPONSES:
+    compress_responses(app.server)
+
+# Latency and payload size metrics of every callback, on /metrics
+metrics = instrument(app)
 
 #  make dataframe from  spreadsheet:
 df = pd.read_csv("assets/historic.csv")
@@ -18,7 +47,7 @@ START_YR = 2007
 
 # since data is as of year end, need to add start year
 df = (
-    df.append({"Year": MIN_YR - 1}, ignore_index=True)
+    pd.concat([df, pd.DataFrame({"Year": [MIN_YR - 1]})], ignore_index=True)
     .sort_values("Year", ignore_index=True)
     .fillna(0)
 )
@@ -177,28 +206,75 @@ Figures
 """
 
 
-def make_pie(slider_input, title):
-    fig = go.Figure(
+def _skeleton(fig):
+    """Returns fig as a plain dict, validated by plotly once, with the theme
+    trimmed to the trace types it draws. The figures below are this skeleton
+    with only the data filled in."""
+    fig_dict = fig.to_dict()
+    template = fig_dict["layout"].get("template", {})
+    if "data" in template:
+        types = {trace["type"] for trace in fig_dict["data"]}
+        template["data"] = {t: v for t, v in template["data"].items() if t in types}
+    return fig_dict
+
+
+PIE_CHART = _skeleton(
+    go.Figure(
         data=[
             go.Pie(
                 labels=["Cash", "Bonds", "Stocks"],
-                values=slider_input,
                 textinfo="label+percent",
                 textposition="inside",
                 marker={"colors": [COLORS["cash"], COLORS["bonds"], COLORS["stocks"]]},
                 sort=False,
                 hoverinfo="none",
             )
-        ]
+        ],
+        layout=dict(
+            title_x=0.5,
+            margin=dict(b=25, t=75, l=35, r=25),
+            height=325,
+            paper_bgcolor=COLORS["background"],
+        ),
     )
-    fig.update_layout(
-        title_text=title,
-        title_x=0.5,
-        margin=dict(b=25, t=75, l=35, r=25),
-        height=325,
-        paper_bgcolor=COLORS["background"],
+)
+
+
+def make_pie(slider_input, title):
+    layout = PIE_CHART["layout"]
+    return {
+        "data": [dict(PIE_CHART["data"][0], values=slider_input)],
+        "layout": dict(layout, title=dict(layout["title"], text=title)),
+    }
+
+
+# dff columns plotted by make_line_chart, in trace order
+LINE_CHART_COLUMNS = ["all_cash", "all_bonds", "all_stocks", "Total", "inflation_only"]
+
+LINE_CHART = _skeleton(
+    go.Figure(
+        data=[
+            go.Scatter(name="All Cash", marker_color=COLORS["cash"]),
+            go.Scatter(name="All Bonds (10yr T.Bonds)", marker_color=COLORS["bonds"]),
+            go.Scatter(name="All Stocks (S&P500)", marker_color=COLORS["stocks"]),
+            go.Scatter(
+                name="My Portfolio",
+                marker_color="black",
+                line=dict(width=6, dash="dot"),
+            ),
+            go.Scatter(name="Inflation", visible=True, marker_color=COLORS["inflation"]),
+        ],
+        layout=dict(
+            template="none",
+            showlegend=True,
+            legend=dict(x=0.01, y=0.99),
+            height=400,
+            margin=dict(l=40, r=10, t=60, b=55),
+            yaxis=dict(tickprefix="$", fixedrange=True),
+            xaxis=dict(title="Year Ended", fixedrange=True),
+        ),
     )
-    return fig
+)
 
 
 def make_line_chart(dff):
@@ -206,60 +282,19 @@ def make_line_chart(dff):
     yrs = dff["Year"].size - 1
     dtick = 1 if yrs < 16 else 2 if yrs in range(16, 30) else 5
 
-    fig = go.Figure()
-    fig.add_trace(
-        go.Scatter(
-            x=dff["Year"],
-            y=dff["all_cash"],
-            name="All Cash",
-            marker_color=COLORS["cash"],
-        )
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=dff["Year"],
-            y=dff["all_bonds"],
-            name="All Bonds (10yr T.Bonds)",
-            marker_color=COLORS["bonds"],
-        )
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=dff["Year"],
-            y=dff["all_stocks"],
-            name="All Stocks (S&P500)",
-            marker_color=COLORS["stocks"],
-        )
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=dff["Year"],
-            y=dff["Total"],
-            name="My Portfolio",
-            marker_color="black",
-            line=dict(width=6, dash="dot"),
-        )
-    )
-    fig.add_trace(
-        go.Scatter(
-            x=dff["Year"],
-            y=dff["inflation_only"],
-            name="Inflation",
-            visible=True,
-            marker_color=COLORS["inflation"],
-        )
-    )
-    fig.update_layout(
-        title=f"Returns for {yrs} years starting {start}",
-        template="none",
-        showlegend=True,
-        legend=dict(x=0.01, y=0.99),
-        height=400,
-        margin=dict(l=40, r=10, t=60, b=55),
-        yaxis=dict(tickprefix="$", fixedrange=True),
-        xaxis=dict(title="Year Ended", fixedrange=True, dtick=dtick),
-    )
-    return fig
+    years = encode_array(dff["Year"].to_numpy())
+    layout = LINE_CHART["layout"]
+    return {
+        "data": [
+            dict(trace, x=years, y=encode_array(dff[col].to_numpy()))
+            for trace, col in zip(LINE_CHART["data"], LINE_CHART_COLUMNS)
+        ],
+        "layout": dict(
+            layout,
+            title={"text": f"Returns for {yrs} years starting {start}"},
+            xaxis=dict(layout["xaxis"], dtick=dtick),
+        ),
+    }
 
 
 """
@@ -474,74 +509,167 @@ Helper functions to calculate investment results, cagr and worst periods
 """
 
 
-def backtest(stocks, cash, start_bal, nper, start_yr):
-    """calculates the investment returns for user selected asset allocation,
-    rebalanced annually and returns a dataframe
-    """
+# single asset (and inflation) columns of backtest and the returns they follow
+BENCHMARK_COLUMNS = ["all_cash", "all_bonds", "all_stocks", "inflation_only"]
+BENCHMARK_RETURNS = ["3-mon T.Bill", "10yr T.Bond", "S&P 500", "Inflation"]
 
+
+@lru_cache(maxsize=256)
+def backtest_period(nper, start_yr):
+    """rows of df for a backtest period, the yearly growth of cash, bonds and
+    stocks, and the growth of $1 held in a single asset or following
+    inflation. Shared between calls, do not modify.
+    """
     end_yr = start_yr + nper - 1
-    cash_allocation = cash / 100
-    stocks_allocation = stocks / 100
-    bonds_allocation = (100 - stocks - cash) / 100
 
     # Select time period - since data is for year end, include year prior
     # for start ie year[0]
-    dff = df[(df.Year >= start_yr - 1) & (df.Year <= end_yr)].set_index(
-        "Year", drop=False
-    )
+    dff = df[(df.Year >= start_yr - 1) & (df.Year <= end_yr)].reset_index(drop=True)
     dff["Year"] = dff["Year"].astype(int)
 
-    # add columns for My Portfolio returns
-    dff["Cash"] = cash_allocation * start_bal
-    dff["Bonds"] = bonds_allocation * start_bal
-    dff["Stocks"] = stocks_allocation * start_bal
-    dff["Total"] = start_bal
-    dff["Rebalance"] = True
+    growth = 1 + dff[["3-mon T.Bill", "10yr T.Bond", "S&P 500"]].to_numpy(dtype=float)
+    growth[0] = 1  # year[0] only holds the starting balance
 
-    # calculate My Portfolio returns
-    for yr in dff.Year + 1:
-        if yr <= end_yr:
-            # Rebalance at the beginning of the period by reallocating
-            # last period's total ending balance
-            if dff.loc[yr, "Rebalance"]:
-                dff.loc[yr, "Cash"] = dff.loc[yr - 1, "Total"] * cash_allocation
-                dff.loc[yr, "Stocks"] = dff.loc[yr - 1, "Total"] * stocks_allocation
-                dff.loc[yr, "Bonds"] = dff.loc[yr - 1, "Total"] * bonds_allocation
-
-            # calculate this period's  returns
-            dff.loc[yr, "Cash"] = dff.loc[yr, "Cash"] * (
-                1 + dff.loc[yr, "3-mon T.Bill"]
-            )
-            dff.loc[yr, "Stocks"] = dff.loc[yr, "Stocks"] * (1 + dff.loc[yr, "S&P 500"])
-            dff.loc[yr, "Bonds"] = dff.loc[yr, "Bonds"] * (
-                1 + dff.loc[yr, "10yr T.Bond"]
-            )
-            dff.loc[yr, "Total"] = dff.loc[yr, ["Cash", "Bonds", "Stocks"]].sum()
-
-    dff = dff.reset_index(drop=True)
-    columns = ["Cash", "Stocks", "Bonds", "Total"]
-    dff[columns] = dff[columns].round(0)
-
-    # create columns for when portfolio is all cash, all bonds or  all stocks,
-    #   include inflation too
-    #
-    # create new df that starts in yr 1 rather than yr 0
-    dff1 = (dff[(dff.Year >= start_yr) & (dff.Year <= end_yr)]).copy()
-    #
-    # calculate the returns in new df:
-    columns = ["all_cash", "all_bonds", "all_stocks", "inflation_only"]
-    annual_returns = ["3-mon T.Bill", "10yr T.Bond", "S&P 500", "Inflation"]
-    for col, return_pct in zip(columns, annual_returns):
-        dff1[col] = round(start_bal * (1 + (1 + dff1[return_pct]).cumprod() - 1), 0)
-    #
-    # select columns in the new df to merge with original
-    dff1 = dff1[["Year"] + columns]
-    dff = dff.merge(dff1, how="left")
-    # fill in the starting balance for year[0]
-    dff.loc[0, columns] = start_bal
+    # starting in yr 1 rather than yr 0
+    benchmarks = np.column_stack(
+        [(1 + (1 + dff[col].iloc[1:]).cumprod() - 1).to_numpy() for col in BENCHMARK_RETURNS]
+    )
+    return dff, growth, benchmarks
+
+
+def rebalance(total, weights, growth):
+    """the total at the end of a year, from last year's total rebalanced to
+    the (cash, bonds, stocks) weights and grown by the year's growth.
+
+    Works on floats and on numpy arrays. The products and the sum are in the
+    order of the original loop, so the totals round to the same dollars; a
+    cumprod of the weights dotted with the growth is off by $1 in about 1% of
+    the backtests.
+    """
+    return (
+        total * weights[0] * growth[0]
+        + total * weights[1] * growth[1]
+        + total * weights[2] * growth[2]
+    )
+
+
+def backtest_series(stocks, cash, start_bal, nper, start_yr):
+    """the columns backtest adds to the period's rows, as rounded arrays"""
+    cash_allocation = cash / 100
+    stocks_allocation = stocks / 100
+    bonds_allocation = (100 - stocks - cash) / 100
+    _, growth, benchmarks = backtest_period(nper, start_yr)
+
+    # calculate My Portfolio returns, year by year on floats; everything
+    # else is computed on whole columns
+    weights = (cash_allocation, bonds_allocation, stocks_allocation)
+    total = None
+    if backtest_grid is not None:
+        total = backtest_grid.totals(stocks, cash, start_bal, start_yr, len(growth) - 1)
+    if total is None:
+        total = [start_bal]
+        for year_growth in growth[1:].tolist():
+            total.append(rebalance(total[-1], weights, year_growth))
+        total = np.array(total)
+    balances = (np.r_[start_bal, total[:-1]][:, None] * np.array(weights)) * growth
+
+    series = {
+        "Cash": np.round(balances[:, 0], 0),
+        "Bonds": np.round(balances[:, 1], 0),
+        "Stocks": np.round(balances[:, 2], 0),
+        "Total": np.round(total, 0),
+    }
+    # the single asset columns are start_bal times the growth of $1, with the
+    # starting balance in year[0]
+    for i, col in enumerate(BENCHMARK_COLUMNS):
+        series[col] = np.r_[start_bal, np.round(start_bal * benchmarks[:, i], 0)]
+    return series
+
+
+def backtest(stocks, cash, start_bal, nper, start_yr):
+    """calculates the investment returns for user selected asset allocation,
+    rebalanced annually and returns a dataframe
+    """
+    dff = backtest_period(nper, start_yr)[0].copy()
+    series = backtest_series(stocks, cash, start_bal, nper, start_yr)
+    for col in ["Cash", "Bonds", "Stocks", "Total"]:
+        dff[col] = series[col]
+    dff["Rebalance"] = True
+    for col in BENCHMARK_COLUMNS:
+        dff[col] = series[col]
     return dff
 
 
+# every position of the cash and stock sliders (5% steps, the rest is bonds)
+ALLOCATION_GRID = [
+    (cash, stocks) for cash in range(0, 101, 5) for stocks in range(0, 101 - cash, 5)
+]
+
+
+def batch_backtest(allocations, start_yrs, horizons, start_bal=1):
+    """calculates the ending balance of start_bal for every combination of
+    allocation, start year and horizon in one vectorized pass.
+
+    allocations is a sequence of (cash, stocks) percentages. Returns an array
+    of shape (allocations, start years, horizons); periods that run past the
+    data are NaN. The default start_bal of 1 gives the growth of $1.
+    """
+    alloc = np.asarray(allocations, dtype=float).reshape(-1, 2)
+    cash, stocks = alloc[:, 0], alloc[:, 1]
+    weights = [w[:, None] for w in (cash / 100, (100 - stocks - cash) / 100, stocks / 100)]
+    horizons = np.asarray(horizons, dtype=int)
+
+    # Row 0 is the year before the data starts
+    growth = 1 + df[["3-mon T.Bill", "10yr T.Bond", "S&P 500"]].to_numpy(dtype=float)
+    years = df["Year"].to_numpy(dtype=int)
+    start_pos = np.asarray(start_yrs, dtype=int) - years[0]
+
+    # every allocation and start year takes the same rebalance steps as
+    # backtest, so each balance is the one backtest rounds
+    total = np.full((len(alloc), len(start_pos)), float(start_bal))
+    totals = np.empty((horizons.max(initial=0), len(alloc), len(start_pos)))
+    for year in range(len(totals)):
+        year_growth = growth[np.clip(start_pos + year, 0, len(years) - 1)].T
+        total = rebalance(total, weights, year_growth)
+        totals[year] = total
+
+    result = totals[np.clip(horizons - 1, 0, None)].transpose(1, 2, 0)
+    valid = (start_pos[:, None] >= 1) & (
+        (start_pos[:, None] + horizons[None, :] - 1 < len(years)) & (horizons[None, :] >= 1)
+    )
+    result[:, ~valid] = np.nan
+    return result
+
+
+class BacktestGrid:
+    """batch_backtest results for every slider position, start year and
+    horizon of some starting balances, so a backtest of one of them becomes
+    a table lookup with the same balances as backtest.
+    """
+
+    def __init__(self, start_bals=(10000,), allocations=ALLOCATION_GRID):
+        self.allocations = {alloc: i for i, alloc in enumerate(allocations)}
+        self.start_yrs = np.arange(MIN_YR, MAX_YR + 1)
+        self.horizons = np.arange(1, MAX_YR - MIN_YR + 2)
+        self.values = {
+            start_bal: batch_backtest(allocations, self.start_yrs, self.horizons, start_bal)
+            for start_bal in start_bals
+        }
+
+    def totals(self, stocks, cash, start_bal, start_yr, nper):
+        """ending balances of year[0] .. year[nper], or None when the grid
+        does not hold that allocation or starting balance"""
+        if start_bal not in self.values or (cash, stocks) not in self.allocations:
+            return None
+        row = self.values[start_bal][self.allocations[(cash, stocks)], start_yr - MIN_YR, :nper]
+        return np.r_[start_bal, row]
+
+
+# set PRECOMPUTE_BACKTESTS=1 to fill the grid of the default starting
+# amount at startup; other amounts are computed on demand
+backtest_grid = BacktestGrid() if os.environ.get("PRECOMPUTE_BACKTESTS") else None
+
+
 def cagr(dff):
     """calculate Compound Annual Growth Rate for a series and returns a formated string"""
 
@@ -620,7 +748,8 @@ def update_pie(stocks, cash):
         investment_style = "Conservative"
     else:
         investment_style = "Moderate"
-    figure = make_pie(slider_input, investment_style + " Asset Allocation")
+    with phase("figure"):
+        figure = make_pie(slider_input, investment_style + " Asset Allocation")
     return figure
 
 
@@ -634,6 +763,9 @@ def update_pie(stocks, cash):
 def update_stock_slider(cash, initial_stock_value):
     max_slider = 100 - int(cash)
     stocks = min(max_slider, initial_stock_value)
+    # leave the value alone if it still fits, so update_totals doesn't fire twice
+    if stocks == initial_stock_value:
+        stocks = no_update
 
     # formats the slider scale
     if max_slider > 50:
@@ -658,12 +790,16 @@ def update_time_period(planning_time, start_yr, period_number):
     ctx = callback_context
     input_id = ctx.triggered[0]["prop_id"].split(".")[0]
 
+    # only send back the values that changed, anything else would trigger
+    # update_totals again for nothing
     if input_id == "time_period":
         planning_time = time_period_data[period_number]["planning_time"]
         start_yr = time_period_data[period_number]["start_yr"]
+        return planning_time, start_yr, no_update
 
     if input_id in ["planning_time", "start_yr"]:
-        period_number = None
+        period_number = no_update if period_number is None else None
+        return no_update, no_update, period_number
 
     return planning_time, start_yr, period_number
 
@@ -681,6 +817,9 @@ def update_time_period(planning_time, start_yr, period_number):
     Input("start_yr", "value"),
 )
 def update_totals(stocks, cash, start_bal, planning_time, start_yr):
+    ctx = callback_context
+    input_ids = {t["prop_id"].split(".")[0] for t in ctx.triggered}
+
     # set defaults for invalid inputs
     start_bal = 10 if start_bal is None else start_bal
     planning_time = 1 if planning_time is None else planning_time
@@ -692,20 +831,34 @@ def update_totals(stocks, cash, start_bal, planning_time, start_yr):
     if start_yr + planning_time > MAX_YR:
         start_yr = min(df.iloc[-planning_time, 0], MAX_YR)  # 0 is Year column
 
-    # create investment returns dataframe
-    dff = backtest(stocks, cash, start_bal, planning_time, start_yr)
-
-    # create data for DataTable
-    data = dff.to_dict("records")
+    if input_ids == {"starting_amount"}:
+        # only the balance changed: reuse the period's cached rows and growth
+        # of $1, scaled to the new balance, instead of building the backtest
+        # frame again, and patch the y values of the chart in place. The
+        # summary table and CAGR are rates of return, but of balances rounded
+        # to whole dollars, so they are recomputed from the new balances.
+        series = backtest_series(stocks, cash, start_bal, planning_time, start_yr)
+        dff = backtest_period(planning_time, start_yr)[0].assign(**series)
+        with phase("figure"):
+            fig = Patch()
+            for i, col in enumerate(LINE_CHART_COLUMNS):
+                fig["data"][i]["y"] = encode_array(np.asarray(series[col]))
+    else:
+        # create investment returns dataframe
+        dff = backtest(stocks, cash, start_bal, planning_time, start_yr)
 
-    # create the line chart
-    fig = make_line_chart(dff)
+        # create the line chart
+        with phase("figure"):
+            fig = make_line_chart(dff)
 
-    summary_table = make_summary_table(dff)
+    # create data for DataTable, only the columns it displays
+    data = dff[["Year", "Cash", "Bonds", "Stocks", "Total"]].to_dict("records")
 
     # format ending balance
     ending_amount = f"${dff['Total'].iloc[-1]:0,.0f}"
 
+    summary_table = make_summary_table(dff)
+
     # calcluate cagr
     ending_cagr = cagr(dff["Total"])
 
@@ -0,0 +1,414 @@
+# Latency benchmark for the Dash callbacks.
+# Each app is imported in its own process against local fixtures: the sample
+# Air_Quality.csv with synthetic boundary files, a World Bank snapshot
+# downloaded from fake_wb_server.py, and a synthetic assets/historic.csv
+# (1928 to 2023) for the Advanced Application. The callbacks are then called
+# directly, as Dash would, over a matrix of inputs; every case reports its
+# p50/p95 latency, peak allocated memory and the size of the JSON response.
+# The calls are timed in --rounds rounds of --repeat calls; p50 is the
+# fastest round's median, p95 is over every call.
+# Figures are built from scratch on every call (an empty figure cache) unless
+# the case name says "cache hit".
+#
+#     python bench_callbacks.py                       # compare with the baselines
+#     python bench_callbacks.py --update-baseline     # record new baselines
+#
+# A case regresses when its p50 is slower than the baseline by more than
+# --tolerance, or when its allocations or payload grow; the run then exits
+# with status 1. The p95 of a few dozen calls moves with whatever else the
+# machine is doing, so it is printed but not checked. Baselines depend on the machine, record them where the
+# check runs.
+import argparse
+import importlib
+import importlib.util
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(REPO_DIR, "bench_baselines.json")
+SAMPLE_CSV = os.path.join(REPO_DIR, "Input", "Air_Quality.csv")
+ADVANCED_APP = os.path.join(REPO_DIR, "assets", "Advanced_Application.py")
+APPS = ["pollution_app", "api_application", "Advanced_Application"]
+
+# Allowed growth before a case counts as a regression, besides --tolerance
+ALLOC_TOLERANCE = 0.25
+PAYLOAD_TOLERANCE = 0.02
+# Latency changes below this many milliseconds are noise
+MIN_REGRESSION_MS = 2.0
+
+Case = namedtuple("Case", "name trigger call cached", defaults=(False,))
+
+
+def make_historic(path, first=1928, last=2023, seed=0):
+    """Writes yearly returns shaped like the Damodaran data set."""
+    rng = np.random.default_rng(seed)
+    years = np.arange(first, last + 1)
+    inflation = rng.normal(0.03, 0.03, len(years))
+    pd.DataFrame(
+        {
+            "Year": years,
+            "S&P 500": rng.normal(0.11, 0.19, len(years)),
+            "3-mon T.Bill": np.abs(rng.normal(0.035, 0.03, len(years))),
+            "10yr T.Bond": rng.normal(0.05, 0.08, len(years)),
+            "Inflation": inflation,
+        }
+    ).round(4).to_csv(path, index=False)
+
+
+def _wiggle(x, y):
+    # A function of the position only, so neighbours share identical borders
+    return 0.0004 * np.sin(37 * x + 53 * y), 0.0004 * np.cos(41 * x - 29 * y)
+
+
+def make_boundaries(geo_dir, points_per_edge=40):
+    """Writes a grid of jagged cells per geography type, one per Geo Join ID
+    of the sample, so the map has a realistic number of vertices."""
+    os.makedirs(geo_dir, exist_ok=True)
+    sample = pd.read_csv(SAMPLE_CSV, usecols=["Geo Type Name", "Geo Join ID"])
+    for geo_type, ids in sample.groupby("Geo Type Name")["Geo Join ID"]:
+        ids = sorted(ids.unique())
+        columns = int(np.ceil(np.sqrt(len(ids))))
+        size = 0.3 / columns
+        steps = np.linspace(0, 1, points_per_edge, endpoint=False)
+        features = []
+        for i, geo_id in enumerate(ids):
+            x0 = -74.2 + (i % columns) * size
+            y0 = 40.5 + (i // columns) * size
+            corners = [(x0, y0), (x0 + size, y0), (x0 + size, y0 + size), (x0, y0 + size)]
+            ring = []
+            for (ax, ay), (bx, by) in zip(corners, corners[1:] + corners[:1]):
+                for t in steps:
+                    x, y = round(ax + t * (bx - ax), 9), round(ay + t * (by - ay), 9)
+                    dx, dy = _wiggle(x, y)
+                    ring.append([x + dx, y + dy])
+            ring.append(ring[0])
+            features.append(
+                {
+                    "type": "Feature",
+                    "id": str(geo_id),
+                    "properties": {},
+                    "geometry": {"type": "Polygon", "coordinates": [ring]},
+                }
+            )
+        with open(os.path.join(geo_dir, f"{geo_type}.geojson"), "w") as f:
+            json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def make_snapshot(snapshot_dir):
+    """Publishes a World Bank snapshot downloaded from the fake API."""
+    from fake_wb_server import FakeWorldBank
+    from wb_snapshot import SnapshotWriter
+
+    server = FakeWorldBank(("127.0.0.1", 0))
+    try:
+        SnapshotWriter(snapshot_dir, base_url=server.start()).refresh()
+    finally:
+        server.shutdown()
+
+
+def make_fixtures(fixture_dir):
+    os.makedirs(os.path.join(fixture_dir, "assets"), exist_ok=True)
+    make_historic(os.path.join(fixture_dir, "assets", "historic.csv"))
+    make_boundaries(os.path.join(fixture_dir, "geo"))
+    make_snapshot(os.path.join(fixture_dir, "wb"))
+
+
+def fixture_env(fixture_dir):
+    env = dict(
+        os.environ,
+        # An empty store, so the pollution app reads the sample CSV
+        AIR_QUALITY_STORE=os.path.join(fixture_dir, "store"),
+        NYC_GEO_DIR=os.path.join(fixture_dir, "geo"),
+        GEO_CACHE_DIR=os.path.join(fixture_dir, "geo-cache"),
+        WB_SNAPSHOT_DIR=os.path.join(fixture_dir, "wb"),
+        FIGURE_CACHE_DIR=os.path.join(fixture_dir, "figures"),
+        STATIC_FIGURE_DIR=os.path.join(fixture_dir, "static"),
+    )
+    env.pop("WB_REFRESH_IN_APP", None)
+    return env
+
+
+def load_app(app_name, fixture_dir):
+    if app_name != "Advanced_Application":
+        return importlib.import_module(app_name)
+    # The app reads assets/historic.csv relative to the working directory
+    os.chdir(fixture_dir)
+    spec = importlib.util.spec_from_file_location(app_name, ADVANCED_APP)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[app_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def pollution_cases(app):
+    version, partition_store = app.dataset.get()
+    name, measure, geo_type, periods, locations = app.default_filters(partition_store)
+    default = (name, measure, geo_type, *periods[0])
+    largest = max(
+        partition_store.partitions,
+        key=lambda key: len(partition_store.partitions[key].frame),
+    )
+    winter = next(
+        (key for key in partition_store.partitions if key[3] == "Winter"), largest
+    )
+    zoom = {"xaxis.range[0]": "2012-01-01", "xaxis.range[1]": "2016-12-31"}
+
+    cases = []
+    for label, partition in [("default", default), ("largest", largest), ("winter", winter)]:
+        period = app.period_value(*partition[3:])
+        every = partition_store.get(*partition).locations()
+        filters = (1200, *partition[:3], period)
+        cases += [
+            Case(f"update_graph {label}, all {len(every)} locations", "filter-dropdown.value",
+                 lambda every=every, filters=filters: app.update_graph(every, None, None, *filters)),
+            Case(f"update_graph {label}, one location", "filter-dropdown.value",
+                 lambda every=every, filters=filters: app.update_graph(every[:1], None, None, *filters)),
+            Case(f"update_graph {label}, all locations zoomed to 2012-2016", "chart-zoom.data",
+                 lambda every=every, filters=filters: app.update_graph(every, zoom, None, *filters)),
+        ]
+    period = app.period_value(*default[3:])
+    cases.append(
+        Case("update_graph default, all locations (cache hit)", "filter-dropdown.value",
+             lambda: app.update_graph(locations, None, None, 1200, *default[:3], period),
+             cached=True)
+    )
+
+    for label, partition in [("default", default), ("largest", largest)]:
+        period = app.period_value(*partition[3:])
+        years = partition_store.years[partition]
+        state = {"key": app.geometry(partition[2], None)[1], "zoom": None}
+        cases += [
+            Case(f"update_map {label}, new geometry", "map-year-slider.value",
+                 lambda years=years, partition=partition, period=period: app.update_map(
+                     years[-1], None, None, *partition[:3], period, None)),
+            Case(f"update_map {label}, another year", "map-year-slider.value",
+                 lambda years=years, partition=partition, period=period, state=state: app.update_map(
+                     years[0], None, None, *partition[:3], period, state)),
+            Case(f"update_map {label}, zoomed in", "map-zoom.data",
+                 lambda years=years, partition=partition, period=period, state=state: app.update_map(
+                     years[-1], 12, None, *partition[:3], period, state)),
+        ]
+
+    cases += [
+        Case("update_measures", "name-dropdown.value", lambda: app.update_measures(name, None)),
+        Case("update_geo_types", "measure-dropdown.value",
+             lambda: app.update_geo_types(name, measure, None)),
+        Case("update_periods", "geo-type-dropdown.value",
+             lambda: app.update_periods(name, measure, geo_type, None)),
+        Case("update_locations", "period-dropdown.value",
+             lambda: app.update_locations(name, measure, geo_type, period)),
+        Case("update_map_years", "period-dropdown.value",
+             lambda: app.update_map_years(name, measure, geo_type, period, None)),
+        Case("default_view", None,
+             lambda: app.default_view(version)),
+    ]
+    return cases
+
+
+def api_cases(app):
+    version = app.read_latest()["version"]
+    cases = []
+    for indicator in app.indicators.values():
+        short = app.INDICATOR_LABELS.get(indicator, indicator)
+        for years in ([2005, 2006], [2010, 2012], [2005, 2016]):
+            cases.append(
+                Case(f"update_graph {short} {years[0]}-{years[1]}", "my_button.n_clicks",
+                     lambda indicator=indicator, years=years: app.update_graph(
+                         1, version, None, years, indicator))
+            )
+    cases += [
+        Case("update_graph default (cache hit)", "my_button.n_clicks",
+             lambda: app.update_graph(1, version, None, app.DEFAULT_YEARS, app.DEFAULT_INDICATOR),
+             cached=True),
+        Case("update_graph new snapshot version", "storage.data",
+             lambda: app.update_graph(0, version, None, app.DEFAULT_YEARS, app.DEFAULT_INDICATOR)),
+        Case("default_view", None, lambda: app.default_view(version)),
+    ]
+    # store_data was replaced by the server-sent snapshot events, there is no
+    # server callback for the Store any more
+    return cases
+
+
+def advanced_cases(app):
+    cases = []
+    windows = [
+        (f"{app.MIN_YR}-{app.MAX_YR}", app.MIN_YR, app.MAX_YR - app.MIN_YR + 1),
+        ("30 years from 1970", 1970, 30),
+        (f"{app.START_YR}-{app.MAX_YR}", app.START_YR, app.MAX_YR - app.START_YR + 1),
+    ]
+    for stocks, cash in [(10, 20), (60, 10), (100, 0)]:
+        for label, start_yr, planning_time in windows:
+            cases.append(
+                Case(f"update_totals {stocks}% stocks {cash}% cash, {label}", "stock_bond.value",
+                     lambda stocks=stocks, cash=cash, start_yr=start_yr, planning_time=planning_time:
+                     app.update_totals(stocks, cash, 10000, planning_time, start_yr))
+            )
+    label, start_yr, planning_time = windows[0]
+    cases += [
+        Case(f"update_totals new starting amount, {label}", "starting_amount.value",
+             lambda: app.update_totals(60, 10, 25000, planning_time, start_yr)),
+        Case("update_pie", "stock_bond.value", lambda: app.update_pie(60, 10)),
+        Case("update_stock_slider, value fits", "cash.value",
+             lambda: app.update_stock_slider(10, 60)),
+        Case("update_stock_slider, value clamped", "cash.value",
+             lambda: app.update_stock_slider(90, 60)),
+        Case("update_time_period", "time_period.value",
+             lambda: app.update_time_period(None, None, 2)),
+    ]
+    return cases
+
+
+CASES = {
+    "pollution_app": pollution_cases,
+    "api_application": api_cases,
+    "Advanced_Application": advanced_cases,
+}
+
+
+def set_trigger(prop_id, value=None):
+    """Sets the callback context Dash would give a callback fired by prop_id."""
+    from dash._callback_context import context_value
+    from dash._utils import AttributeDict
+
+    triggered = [] if prop_id is None else [{"prop_id": prop_id, "value": value}]
+    context_value.set(AttributeDict(triggered_inputs=triggered))
+
+
+def response_json(output):
+    """The JSON response Dash would send for output, "" if nothing changed."""
+    from dash import no_update
+    from dash._utils import to_json
+
+    outputs = list(output) if isinstance(output, tuple) else [output]
+    outputs = [o for o in outputs if o is not no_update]
+    return to_json(outputs) if outputs else ""
+
+
+def payload_size(output):
+    """Bytes of the JSON response Dash would send for output."""
+    return len(response_json(output).encode())
+
+
+def measure(app, case, repeat, rounds):
+    from figure_cache import FigureCache
+
+    def call():
+        # Cold cases start from an empty, memory only figure cache
+        if not case.cached and hasattr(app, "figure_cache"):
+            app.figure_cache = FigureCache(cache_dir=None)
+        set_trigger(case.trigger)
+        return case.call()
+
+    output = call()
+    timings = np.empty((rounds, repeat))
+    for i in range(rounds):
+        for j in range(repeat):
+            start = time.perf_counter()
+            call()
+            timings[i, j] = 1000 * (time.perf_counter() - start)
+
+    tracemalloc.start()
+    call()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return {
+        "p50_ms": round(float(np.median(timings, axis=1).min()), 3),
+        "p95_ms": round(float(np.percentile(timings, 95)), 3),
+        "alloc_kib": round(peak / 1024, 1),
+        "payload_bytes": payload_size(output),
+    }
+
+
+def run_worker(app_name, fixture_dir, repeat, rounds, out_path):
+    app = load_app(app_name, fixture_dir)
+    results = {}
+    for case in CASES[app_name](app):
+        results[f"{app_name}: {case.name}"] = measure(app, case, repeat, rounds)
+    with open(out_path, "w") as f:
+        json.dump(results, f)
+
+
+def run_app(app_name, fixture_dir, repeat, rounds):
+    out_path = os.path.join(fixture_dir, f"{app_name}.json")
+    subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--worker", app_name,
+         fixture_dir, str(repeat), str(rounds), out_path],
+        cwd=REPO_DIR, env=fixture_env(fixture_dir), check=True,
+    )
+    with open(out_path) as f:
+        return json.load(f)
+
+
+def regressions(result, baseline, tolerance):
+    """Returns the reasons result is worse than baseline."""
+    found = []
+    p50, base_p50 = result["p50_ms"], baseline["p50_ms"]
+    if p50 > base_p50 * (1 + tolerance) and p50 - base_p50 > MIN_REGRESSION_MS:
+        found.append(f"p50 {base_p50:.1f} -> {p50:.1f} ms")
+    if result["alloc_kib"] > baseline["alloc_kib"] * (1 + ALLOC_TOLERANCE):
+        found.append(f"alloc {baseline['alloc_kib']:.0f} -> {result['alloc_kib']:.0f} KiB")
+    if result["payload_bytes"] > baseline["payload_bytes"] * (1 + PAYLOAD_TOLERANCE):
+        found.append(f"payload {baseline['payload_bytes']} -> {result['payload_bytes']} B")
+    return found
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], sys.argv[3], int(sys.argv[4]), int(sys.argv[5]), sys.argv[6])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Benchmark the Dash callbacks.")
+    parser.add_argument("--apps", nargs="+", choices=APPS, default=APPS)
+    parser.add_argument("--repeat", type=int, default=30, help="timed calls per round")
+    parser.add_argument("--rounds", type=int, default=5, help="timed rounds per case")
+    parser.add_argument("--tolerance", type=float, default=0.5,
+                        help="allowed p50 slowdown, as a fraction of the baseline")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="write these results as the new baselines")
+    args = parser.parse_args()
+
+    try:
+        with open(args.baseline) as f:
+            baselines = json.load(f)
+    except FileNotFoundError:
+        baselines = {}
+
+    results = {}
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        make_fixtures(fixture_dir)
+        for app_name in args.apps:
+            results.update(run_app(app_name, fixture_dir, args.repeat, args.rounds))
+
+    width = max(len(name) for name in results)
+    print(f"{'case':<{width}}{'p50 ms':>9}{'p95 ms':>9}{'alloc KiB':>11}{'payload KiB':>13}  check")
+    failed = 0
+    for name, result in results.items():
+        if name not in baselines:
+            status = "new"
+        else:
+            found = regressions(result, baselines[name], args.tolerance)
+            failed += bool(found)
+            status = "; ".join(found) or "ok"
+        print(f"{name:<{width}}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+              f"{result['alloc_kib']:>11.0f}{result['payload_bytes'] / 1024:>13.1f}  {status}")
+
+    if args.update_baseline:
+        baselines.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump(baselines, f, indent=1, sort_keys=True)
+            f.write("\n")
+        print(f"Baselines written to {args.baseline}")
+    elif failed:
+        print(f"{failed} case(s) regressed")
+        sys.exit(1)
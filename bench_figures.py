@@ -0,0 +1,326 @@
+# Compares the template figure builders with plotly.express / go.Figure.
+# Every case is built twice, with the builder the app uses and with the
+# plotly.express or go.Figure code it replaced, against the same fixtures as
+# bench_callbacks.py. Both figures are serialized as Dash sends them and
+# compared after normalization: typed arrays decoded, dates written the same
+# way, empty objects dropped, numbers compared with a tolerance and the theme
+# trimmed to the drawn trace types. The run prints the build time and JSON
+# size of both and exits with status 1 if any pair differs.
+#
+#     python bench_figures.py
+import argparse
+import base64
+import json
+import os
+import re
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bench_callbacks import APPS, fixture_env, load_app, make_fixtures
+from figure_templates import trim_theme
+
+DATE_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})(?:[T ]00:00(?::00(?:\.0+)?)?)?$")
+
+
+# The builders the apps used before figure_templates.py
+def px_line_chart(app, partition_store, partition, locations, x_range=None, width=1200):
+    import plotly.express as px
+
+    start, end = x_range if x_range else (None, None)
+    location_index = partition_store.get(*partition)
+    years = partition_store.years[partition]
+    span = str(years[0]) if years[0] == years[-1] else f"{years[0]}-{years[-1]}"
+    filtered_pollution = location_index.select(
+        locations, start=start, end=end, max_points=width, downsample=app.DOWNSAMPLE
+    )
+    fig = px.line(
+        data_frame=filtered_pollution,
+        x="Period Start",
+        y="Data Value",
+        color="Geo Place Name",
+        log_y=True,
+        labels={
+            "Period Start": "Reading Date",
+            "Data Value": f"{partition[1]} ({partition_store.units[partition]})",
+            "Geo Name Place": "Location",
+        },
+        render_mode="webgl" if len(filtered_pollution) > app.WEBGL_THRESHOLD else "svg",
+        title=f"{partition[0]} by {partition[2]}, {app.period_label(*partition[3:])} {span}",
+    )
+    fig.update_layout(uirevision=",".join([*partition, *locations]))
+    if x_range:
+        fig.update_xaxes(range=x_range)
+    return fig
+
+
+def px_choropleth(app, dff, indct_chosen):
+    import plotly.express as px
+
+    fig = px.choropleth(
+        data_frame=dff,
+        locations="iso3c",
+        color=indct_chosen,
+        scope="world",
+        hover_data={"iso3c": False, "country": True},
+        labels=app.INDICATOR_LABELS,
+    )
+    fig.update_layout(
+        geo={"projection": {"type": "natural earth"}},
+        margin=dict(l=50, r=50, t=50, b=50),
+    )
+    return fig
+
+
+def go_pie(app, slider_input, title):
+    import plotly.graph_objects as go
+
+    colors = app.COLORS
+    fig = go.Figure(
+        data=[
+            go.Pie(
+                labels=["Cash", "Bonds", "Stocks"],
+                values=slider_input,
+                textinfo="label+percent",
+                textposition="inside",
+                marker={"colors": [colors["cash"], colors["bonds"], colors["stocks"]]},
+                sort=False,
+                hoverinfo="none",
+            )
+        ]
+    )
+    fig.update_layout(
+        title_text=title,
+        title_x=0.5,
+        margin=dict(b=25, t=75, l=35, r=25),
+        height=325,
+        paper_bgcolor=colors["background"],
+    )
+    return fig
+
+
+def go_line_chart(app, dff):
+    import plotly.graph_objects as go
+
+    colors = app.COLORS
+    start = dff.loc[1, "Year"]
+    yrs = dff["Year"].size - 1
+    dtick = 1 if yrs < 16 else 2 if yrs in range(16, 30) else 5
+    fig = go.Figure()
+    for col, name, style in [
+        ("all_cash", "All Cash", dict(marker_color=colors["cash"])),
+        ("all_bonds", "All Bonds (10yr T.Bonds)", dict(marker_color=colors["bonds"])),
+        ("all_stocks", "All Stocks (S&P500)", dict(marker_color=colors["stocks"])),
+        ("Total", "My Portfolio",
+         dict(marker_color="black", line=dict(width=6, dash="dot"))),
+        ("inflation_only", "Inflation",
+         dict(visible=True, marker_color=colors["inflation"])),
+    ]:
+        fig.add_trace(go.Scatter(x=dff["Year"], y=dff[col], name=name, **style))
+    fig.update_layout(
+        title=f"Returns for {yrs} years starting {start}",
+        template="none",
+        showlegend=True,
+        legend=dict(x=0.01, y=0.99),
+        height=400,
+        margin=dict(l=40, r=10, t=60, b=55),
+        yaxis=dict(tickprefix="$", fixedrange=True),
+        xaxis=dict(title="Year Ended", fixedrange=True, dtick=dtick),
+    )
+    return fig
+
+
+def pollution_cases(app):
+    partition_store = app.dataset.get()[1]
+    name, measure, geo_type, periods, locations = app.default_filters(partition_store)
+    default = (name, measure, geo_type, *periods[0])
+    largest = max(
+        partition_store.partitions,
+        key=lambda key: len(partition_store.partitions[key].frame),
+    )
+    zoom = ["2012-01-01", "2016-12-31"]
+    cases = []
+    for label, partition in [("default", default), ("largest", largest)]:
+        every = partition_store.get(*partition).locations()
+        for what, args in [
+            (f"all {len(every)} locations", (every,)),
+            ("one location", (every[:1],)),
+            ("all locations zoomed to 2012-2016", (every, zoom)),
+        ]:
+            cases.append((
+                f"line chart {label}, {what}",
+                lambda partition=partition, args=args: px_line_chart(
+                    app, partition_store, partition, *args),
+                lambda partition=partition, args=args: app.make_line_chart(
+                    partition_store, partition, *args),
+            ))
+    return cases
+
+
+def api_cases(app):
+    version = app.read_latest()["version"]
+    dff = app.get_snapshot(version)
+    available = [i for i in app.indicators.values() if i in dff]
+    cube = app.get_cube(version, dff, available)
+    cases = []
+    for indicator in available:
+        means = cube.mean(indicator, 2005, 2016)
+        cases.append((
+            f"choropleth {app.INDICATOR_LABELS.get(indicator, indicator)} 2005-2016",
+            lambda means=means, indicator=indicator: px_choropleth(app, means, indicator),
+            lambda means=means, indicator=indicator: app.make_choropleth(means, indicator),
+        ))
+    return cases
+
+
+def advanced_cases(app):
+    cases = [(
+        "pie chart",
+        lambda: go_pie(app, [10, 30, 60], "Moderate Asset Allocation"),
+        lambda: app.make_pie([10, 30, 60], "Moderate Asset Allocation"),
+    )]
+    for start_yr, nper in [(app.MIN_YR, app.MAX_YR - app.MIN_YR + 1), (1970, 30), (2014, 10)]:
+        dff = app.backtest(60, 10, 10000, nper, start_yr)
+        cases.append((
+            f"line chart {nper} years from {start_yr}",
+            lambda dff=dff: go_line_chart(app, dff),
+            lambda dff=dff: app.make_line_chart(dff),
+        ))
+    return cases
+
+
+CASES = {
+    "pollution_app": pollution_cases,
+    "api_application": api_cases,
+    "Advanced_Application": advanced_cases,
+}
+
+
+def serialize(fig):
+    """The figure JSON Dash sends."""
+    from dash._utils import to_json
+
+    return to_json(fig)
+
+
+def _decode(value):
+    """Typed array {"dtype", "bdata", "shape"} to a list."""
+    array = np.frombuffer(base64.b64decode(value["bdata"]), dtype=value["dtype"])
+    if "shape" in value:
+        shape = value["shape"]
+        if isinstance(shape, str):
+            shape = [int(n) for n in shape.split(",")]
+        array = array.reshape(shape)
+    return array.tolist()
+
+
+def normalize(value):
+    if isinstance(value, dict):
+        if "bdata" in value and "dtype" in value:
+            return normalize(_decode(value))
+        # An empty object sets nothing; go.Figure leaves it out
+        return {k: normalize(v) for k, v in value.items() if v != {}}
+    if isinstance(value, list):
+        return [normalize(v) for v in value]
+    if isinstance(value, str):
+        match = DATE_RE.match(value)
+        return match.group(1) if match else value
+    return value
+
+
+def differences(a, b, path=""):
+    """Returns the paths where a and b differ."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        found = []
+        for key in sorted(set(a) | set(b)):
+            if key not in a or key not in b:
+                found.append(f"{path}.{key}: only in {'template' if key in b else 'reference'}")
+            else:
+                found += differences(a[key], b[key], f"{path}.{key}")
+        return found
+    if isinstance(a, list) and isinstance(b, list):
+        if len(a) != len(b):
+            return [f"{path}: length {len(a)} != {len(b)}"]
+        found = []
+        for i, (x, y) in enumerate(zip(a, b)):
+            found += differences(x, y, f"{path}[{i}]")
+        return found
+    numbers = (int, float)
+    if isinstance(a, numbers) and isinstance(b, numbers) and not isinstance(a, bool):
+        if a == b or (a != a and b != b) or abs(a - b) <= 1e-9 * max(abs(a), abs(b)):
+            return []
+    elif a == b:
+        return []
+    return [f"{path}: {a!r} != {b!r}"]
+
+
+def timed(build, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        build()
+        timings.append(1000 * (time.perf_counter() - start))
+    return float(np.median(timings))
+
+
+def run_worker(app_name, fixture_dir, repeat, out_path):
+    app = load_app(app_name, fixture_dir)
+    results = []
+    for name, reference, template in CASES[app_name](app):
+        ref_json, new_json = serialize(reference()), serialize(template())
+        diff = differences(
+            normalize(trim_theme(json.loads(ref_json))),
+            normalize(trim_theme(json.loads(new_json))),
+        )
+        results.append({
+            "case": f"{app_name}: {name}",
+            "reference_ms": timed(lambda: serialize(reference()), repeat),
+            "template_ms": timed(lambda: serialize(template()), repeat),
+            "reference_bytes": len(ref_json),
+            "template_bytes": len(new_json),
+            "differences": diff,
+        })
+    with open(out_path, "w") as f:
+        json.dump(results, f)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], sys.argv[3], int(sys.argv[4]), sys.argv[5])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Compare the figure templates with plotly.express.")
+    parser.add_argument("--apps", nargs="+", choices=APPS, default=APPS)
+    parser.add_argument("--repeat", type=int, default=20, help="timed builds per case")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        make_fixtures(fixture_dir)
+        for app_name in args.apps:
+            out_path = os.path.join(fixture_dir, f"{app_name}.json")
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--worker", app_name,
+                 fixture_dir, str(args.repeat), out_path],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                env=fixture_env(fixture_dir), check=True, stdout=subprocess.DEVNULL,
+            )
+            with open(out_path) as f:
+                results += json.load(f)
+
+    width = max(len(r["case"]) for r in results)
+    print(f"{'case':<{width}}{'px ms':>8}{'template ms':>13}{'px KiB':>8}{'template KiB':>14}  same")
+    failed = 0
+    for r in results:
+        failed += bool(r["differences"])
+        print(f"{r['case']:<{width}}{r['reference_ms']:>8.2f}{r['template_ms']:>13.2f}"
+              f"{r['reference_bytes'] / 1024:>8.1f}{r['template_bytes'] / 1024:>14.1f}"
+              f"  {'no' if r['differences'] else 'yes'}")
+        for diff in r["differences"][:10]:
+            print(f"    {diff}")
+    if failed:
+        print(f"{failed} case(s) differ from the reference")
+        sys.exit(1)
@@ -0,0 +1,65 @@
+# Peak memory benchmark for ingest.py.
+# Builds synthetic extracts of growing size from Input/Air_Quality.csv (new
+# Unique IDs per copy, then 5% of the first copy's rows again at the end of
+# the same file, so the dedupe has repeated IDs to drop) and runs a full
+# ingest_csv of each one in a fresh process, reporting its peak RSS.
+# Incremental updates (apply_delta) are not measured.
+#
+#     python bench_ingest.py --sizes 1 4 16 64
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+SAMPLE_CSV = "Input/Air_Quality.csv"
+
+MEASURE = """
+import resource, sys
+from ingest import ingest_csv
+manifest = ingest_csv(sys.argv[1], sys.argv[2], int(sys.argv[3]))
+rows = sum(p["rows"] for p in manifest["partitions"])
+print(rows, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+"""
+
+
+def make_extract(path, copies, duplicate_frac=0.05):
+    """Writes copies of the sample with fresh IDs, appending row by row
+    so the benchmark itself never holds the whole extract."""
+    sample = pd.read_csv(SAMPLE_CSV)
+    id_step = int(sample["Unique ID"].max()) + 1
+    for i in range(copies):
+        copy = sample.copy()
+        copy["Unique ID"] += i * id_step
+        copy.to_csv(path, mode="w" if i == 0 else "a", header=i == 0, index=False)
+    # Repeat some rows of the first copy; ingest keeps one row per Unique ID
+    repeats = sample.sample(frac=duplicate_frac, random_state=0)
+    repeats.to_csv(path, mode="a", header=False, index=False)
+    return copies * len(sample) + len(repeats)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest.py memory use.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 4, 16, 64],
+                        help="extract sizes, in copies of the sample")
+    parser.add_argument("--chunksize", type=int, default=50_000)
+    args = parser.parse_args()
+
+    print(f"{'input rows':>12}{'stored rows':>13}{'peak RSS MB':>13}{'seconds':>9}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for copies in args.sizes:
+            csv_path = os.path.join(tmp, f"extract-{copies}.csv")
+            input_rows = make_extract(csv_path, copies)
+            start = time.perf_counter()
+            out = subprocess.run(
+                [sys.executable, "-c", MEASURE, csv_path,
+                 os.path.join(tmp, f"store-{copies}"), str(args.chunksize)],
+                capture_output=True, text=True, check=True,
+            ).stdout.split()
+            elapsed = time.perf_counter() - start
+            # ru_maxrss is in kilobytes on Linux
+            print(f"{input_rows:>12}{int(out[0]):>13}{int(out[1]) / 1024:>13.1f}{elapsed:>9.1f}")
+            os.remove(csv_path)
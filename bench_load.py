@@ -0,0 +1,271 @@
+# Load test of serve.py: throughput of one app as the number of workers grows.
+# For every worker count the app is started under serve.py against the
+# fixtures of bench_callbacks.py, then client processes send its main
+# callback as fast as the server answers for --duration seconds, with random
+# inputs so most requests miss the figure cache. Prints requests per second,
+# the speedup over the first worker count, latency percentiles, and the
+# memory of the workers: RSS, and the part not shared with the master and the
+# other workers (USS), which stays small when the data is shared.
+#
+#     python bench_load.py pollution_app --workers 1 2 4 8
+#
+# The clients run on the same machine and need CPU too; on a machine with
+# fewer cores than workers the speedup flattens out early.
+import argparse
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+import requests
+
+from bench_callbacks import fixture_env, make_fixtures
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+UPDATE_PATH = "/_dash-update-component"
+
+
+def component_props(layout):
+    """{id: props} for every component with an id in a Dash layout."""
+    found = {}
+    stack = [layout]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict) and "props" in node:
+            props = node["props"]
+            if "id" in props:
+                found[props["id"]] = props
+            stack.append(props.get("children"))
+    return found
+
+
+def callback_body(outputs, inputs, state=()):
+    """The request body the browser sends for a callback, the first input
+    being the one that changed."""
+    specs = [{"id": i, "property": p} for i, p in outputs]
+    if len(specs) == 1:
+        output, specs = "{}.{}".format(*outputs[0]), specs[0]
+    else:
+        output = ".." + "...".join(f"{i}.{p}" for i, p in outputs) + ".."
+    return {
+        "output": output,
+        "outputs": specs,
+        "inputs": [{"id": i, "property": p, "value": v} for i, p, v in inputs],
+        "state": [{"id": i, "property": p, "value": v} for i, p, v in state],
+        "changedPropIds": ["{}.{}".format(*inputs[0][:2])],
+    }
+
+
+def pollution_requests(props, rng, count):
+    """update_graph over random subsets of the default locations."""
+    locations = [o["value"] for o in props["filter-dropdown"]["options"]]
+    state = [
+        ("graph-width", "data", 1200),
+        *[(c, "value", props[c]["value"])
+          for c in ["name-dropdown", "measure-dropdown", "geo-type-dropdown", "period-dropdown"]],
+    ]
+    return [
+        callback_body(
+            [("pollution-chart", "figure")],
+            [("filter-dropdown", "value",
+              rng.sample(locations, rng.randint(1, len(locations)))),
+             ("chart-zoom", "data", None), ("default-view", "data", None)],
+            state,
+        )
+        for _ in range(count)
+    ]
+
+
+def api_requests(props, rng, count):
+    """update_graph for random indicators and year ranges."""
+    indicators = [o["value"] for o in props["radio-indicator"]["options"]]
+    low, high = props["years-range"]["min"], props["years-range"]["max"]
+    bodies = []
+    for n in range(count):
+        start = rng.randint(low, high)
+        bodies.append(callback_body(
+            [("my_choropleth", "figure")],
+            [("my_button", "n_clicks", n + 1), ("storage", "data", None),
+             ("default-view", "data", None)],
+            [("years-range", "value", [start, rng.randint(start, high)]),
+             ("radio-indicator", "value", rng.choice(indicators))],
+        ))
+    return bodies
+
+
+def advanced_requests(props, rng, count):
+    """update_totals for random allocations, amounts and periods."""
+    first, last = props["start_yr"]["min"], props["start_yr"]["max"]
+    bodies = []
+    for _ in range(count):
+        cash = rng.randrange(0, 50, 5)
+        start_yr = rng.randint(first, last - 1)
+        bodies.append(callback_body(
+            [("total_returns", "data"), ("returns_chart", "figure"),
+             ("summary_table", "children"), ("ending_amount", "value"), ("cagr", "value")],
+            [("starting_amount", "value", rng.randint(10, 100000)),
+             ("stock_bond", "value", rng.randrange(0, 100 - cash, 5)),
+             ("cash", "value", cash),
+             ("planning_time", "value", rng.randint(1, last - start_yr + 1)),
+             ("start_yr", "value", start_yr)],
+        ))
+    return bodies
+
+
+REQUESTS = {
+    "pollution_app": pollution_requests,
+    "api_application": api_requests,
+    "Advanced_Application": advanced_requests,
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(app_name, workers, fixture_dir, port):
+    args = [sys.executable, os.path.join(ROOT, "serve.py"), app_name,
+            "--workers", str(workers), "--bind", f"127.0.0.1:{port}"]
+    if app_name == "Advanced_Application":
+        # assets/historic.csv of the fixtures
+        args += ["--chdir", fixture_dir]
+    # A fresh figure cache, so earlier runs do not answer for this one
+    env = dict(
+        fixture_env(fixture_dir),
+        FIGURE_CACHE_DIR=os.path.join(fixture_dir, f"figures-{workers}"),
+    )
+    server = subprocess.Popen(
+        args, cwd=ROOT, env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"serve.py {app_name} exited with {server.returncode}")
+        try:
+            layout = requests.get(url + "/_dash-layout", timeout=5)
+            if layout.ok and len(worker_pids(server.pid)) == workers:
+                return server, url, layout.json()
+        except requests.ConnectionError:
+            pass
+        time.sleep(0.2)
+    server.kill()
+    raise RuntimeError(f"serve.py {app_name} did not start")
+
+
+def stop_server(server):
+    server.send_signal(signal.SIGTERM)
+    try:
+        server.wait(30)
+    except subprocess.TimeoutExpired:
+        server.kill()
+
+
+def worker_pids(master_pid):
+    try:
+        with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+            return [int(pid) for pid in f.read().split()]
+    except OSError:
+        return []
+
+
+def memory_kib(pid):
+    """(RSS, USS) of a process in KiB, from /proc/<pid>/smaps_rollup."""
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == "kB":
+                    fields[parts[0].rstrip(":")] = int(parts[1])
+    except OSError:
+        return None
+    return fields["Rss"], fields["Private_Clean"] + fields["Private_Dirty"]
+
+
+def client(args):
+    """Sends random requests until the deadline, returns the latencies in ms
+    and the number of failed requests."""
+    url, app_name, props, seed, count, deadline = args
+    bodies = REQUESTS[app_name](props, random.Random(seed), count)
+    session = requests.Session()
+    latencies, errors = [], 0
+    i = 0
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            ok = session.post(url + UPDATE_PATH, json=bodies[i % len(bodies)], timeout=60).ok
+        except requests.RequestException:
+            ok = False
+        if ok:
+            latencies.append(1000 * (time.perf_counter() - start))
+        else:
+            errors += 1
+        i += 1
+    return latencies, errors
+
+
+def run_load(url, app_name, props, clients, count, duration, warmup):
+    """Runs the clients for warmup, then for duration seconds. Every client
+    sends its own random requests, the same for every worker count."""
+    with Pool(clients) as pool:
+        pool.map(client, [
+            (url, app_name, props, -1 - seed, count, time.time() + warmup)
+            for seed in range(clients)
+        ])
+        results = pool.map(client, [
+            (url, app_name, props, seed, count, time.time() + duration)
+            for seed in range(clients)
+        ])
+    latencies = np.concatenate([np.array(r[0]) for r in results])
+    errors = sum(r[1] for r in results)
+    return latencies, errors
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure serve.py throughput per worker count.")
+    parser.add_argument("app", choices=REQUESTS)
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--clients", type=int, help="concurrent clients, default 2 per worker")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per worker count")
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="distinct requests per client")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        make_fixtures(fixture_dir)
+        for workers in args.workers:
+            server, url, layout = start_server(args.app, workers, fixture_dir, free_port())
+            try:
+                latencies, errors = run_load(
+                    url, args.app, component_props(layout), args.clients or 2 * workers,
+                    args.requests, args.duration, args.warmup,
+                )
+                memory = [m for m in map(memory_kib, worker_pids(server.pid)) if m]
+            finally:
+                stop_server(server)
+            rows.append((workers, len(latencies) / args.duration, latencies, errors, memory))
+
+    print(f"{'workers':>7}{'req/s':>9}{'speedup':>9}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}"
+          f"{'RSS MiB':>9}{'USS MiB':>9}")
+    base = rows[0][1] or 1
+    for workers, rate, latencies, errors, memory in rows:
+        p50, p95 = np.percentile(latencies, [50, 95]) if len(latencies) else (0, 0)
+        rss = np.mean([m[0] for m in memory]) / 1024 if memory else float("nan")
+        uss = np.mean([m[1] for m in memory]) / 1024 if memory else float("nan")
+        print(f"{workers:>7}{rate:>9.1f}{rate / base:>9.2f}{p50:>9.1f}{p95:>9.1f}{errors:>8}"
+              f"{rss:>9.1f}{uss:>9.1f}")
@@ -0,0 +1,89 @@
+# Response size benchmark for the figure encodings of figure_encoding.py.
+# Runs the callback cases of bench_callbacks.py (the Air_Quality.csv views,
+# the World Bank views and the Advanced Application) once with JSON number
+# lists and once with TYPED_ARRAYS=1, and prints the size of each response
+# as sent, gzipped and, when the brotli package is installed, brotli
+# compressed, the way COMPRESS_RESPONSES=1 would send it.
+#
+#     python bench_payload.py
+import argparse
+import gzip
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench_callbacks import APPS, CASES, fixture_env, load_app, make_fixtures, response_json, set_trigger
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+MODES = {"lists": "", "typed": "1"}
+
+
+def sizes(body):
+    data = body.encode()
+    result = {"raw": len(data), "gzip": len(gzip.compress(data, compresslevel=6))}
+    if brotli is not None:
+        result["br"] = len(brotli.compress(data, quality=4))
+    return result
+
+
+def run_worker(app_name, fixture_dir, out_path):
+    from figure_cache import FigureCache
+
+    app = load_app(app_name, fixture_dir)
+    results = {}
+    for case in CASES[app_name](app):
+        if case.cached:
+            continue
+        if hasattr(app, "figure_cache"):
+            app.figure_cache = FigureCache(cache_dir=None)
+        set_trigger(case.trigger)
+        results[f"{app_name}: {case.name}"] = sizes(response_json(case.call()))
+    with open(out_path, "w") as f:
+        json.dump(results, f)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--worker":
+        run_worker(sys.argv[2], sys.argv[3], sys.argv[4])
+        sys.exit()
+
+    parser = argparse.ArgumentParser(description="Compare callback response sizes per encoding.")
+    parser.add_argument("--apps", nargs="+", choices=APPS, default=APPS)
+    args = parser.parse_args()
+
+    results = {mode: {} for mode in MODES}
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        make_fixtures(fixture_dir)
+        for mode, typed in MODES.items():
+            env = dict(fixture_env(fixture_dir), TYPED_ARRAYS=typed)
+            for app_name in args.apps:
+                out_path = os.path.join(fixture_dir, f"{app_name}-{mode}.json")
+                subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--worker", app_name,
+                     fixture_dir, out_path],
+                    cwd=os.path.dirname(os.path.abspath(__file__)),
+                    env=env, check=True, stdout=subprocess.DEVNULL,
+                )
+                with open(out_path) as f:
+                    results[mode].update(json.load(f))
+
+    encodings = ["raw", "gzip"] + (["br"] if brotli is not None else [])
+    columns = [f"{mode} {encoding}" for mode in MODES for encoding in encodings]
+    width = max(len(name) for name in results["lists"])
+    print(f"{'case (KiB)':<{width}}" + "".join(f"{c:>12}" for c in columns))
+    totals = dict.fromkeys(columns, 0)
+    for name in results["lists"]:
+        row = ""
+        for mode in MODES:
+            for encoding in encodings:
+                size = results[mode][name][encoding]
+                totals[f"{mode} {encoding}"] += size
+                row += f"{size / 1024:>12.1f}"
+        print(f"{name:<{width}}{row}")
+    print(f"{'total':<{width}}" + "".join(f"{totals[c] / 1024:>12.1f}" for c in columns))
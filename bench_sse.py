@@ -0,0 +1,181 @@
+# Idle client benchmark for the snapshot event stream of api_application.py.
+# Starts the app under serve.py, as it runs in production, on the fixtures of
+# bench_callbacks.py, and holds growing numbers of idle /events/snapshot
+# clients open from a single thread. The clients reconnect like EventSource
+# does, after the retry the server last sent. For each number of clients it
+# reports the streams the workers hold, the requests the clients make while
+# nothing changes, the server's CPU use, and how long it takes until every
+# client has heard about a new version.
+#
+#     python bench_sse.py --clients 0 4 50 200 --idle 120
+#
+# Each worker holds at most half of its threads' streams (4 with the default
+# 8 threads) for WB_EVENTS_MAX_AGE seconds, then the client reconnects. The
+# other clients get the current version and retry every 60 s, as often as the
+# dcc.Interval the stream replaced. So once there are more tabs than held
+# streams, the requests per minute approach one per tab again, and those tabs
+# hear about a new version up to a minute late.
+import argparse
+import heapq
+import json
+import os
+import selectors
+import socket
+import tempfile
+import time
+
+from bench_callbacks import make_fixtures
+from bench_load import free_port, start_server, stop_server, worker_pids
+
+REQUEST = (
+    b"GET /events/snapshot HTTP/1.1\r\nHost: localhost\r\n"
+    b"Accept: text/event-stream\r\nConnection: close\r\n\r\n"
+)
+
+
+def publish(snapshot_dir, version):
+    """Points latest.json at the same snapshot under a new version."""
+    path = os.path.join(snapshot_dir, "latest.json")
+    with open(path) as f:
+        latest = json.load(f)
+    latest["version"] = version
+    with open(path + ".tmp", "w") as f:
+        json.dump(latest, f)
+    os.replace(path + ".tmp", path)
+
+
+def server_stats(pids):
+    """Returns (cpu seconds, RSS MB, threads) summed over processes, from /proc."""
+    cpu = rss = threads = 0
+    for pid in pids:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+        cpu += (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+        status = {}
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                key, _, value = line.partition(":")
+                status[key] = value.split()
+        rss += int(status["VmRSS"][0]) / 1024
+        threads += int(status["Threads"][0])
+    return cpu, rss, threads
+
+
+class Clients:
+    """Idle EventSource clients, all driven by one selector."""
+
+    def __init__(self, port):
+        self.port = port
+        self.selector = selectors.DefaultSelector()
+        # client number: last version received
+        self.received = {}
+        # client number: open connection, and reconnect times of the others
+        self.sockets = {}
+        self.pending = []
+        self.requests = 0
+
+    def _open(self, client):
+        sock = socket.create_connection(("127.0.0.1", self.port))
+        sock.sendall(REQUEST)
+        sock.setblocking(False)
+        # the buffer and the retry in ms the server asked for
+        self.selector.register(sock, selectors.EVENT_READ, [client, bytearray(), 5000])
+        self.sockets[client] = sock
+        self.requests += 1
+
+    def connect(self, n):
+        for client in range(len(self.received), len(self.received) + n):
+            self.received[client] = None
+            self._open(client)
+
+    def held(self):
+        """Clients whose stream is still open."""
+        return len(self.sockets)
+
+    def pump(self, seconds):
+        """Reads whatever arrives, and reconnects ended streams, for the
+        given time."""
+        deadline = time.monotonic() + seconds
+        while (now := time.monotonic()) < deadline:
+            while self.pending and self.pending[0][0] <= now:
+                self._open(heapq.heappop(self.pending)[1])
+            wake = min(deadline, self.pending[0][0]) if self.pending else deadline
+            for key, _ in self.selector.select(max(wake - now, 0)):
+                client, buffer, retry = key.data
+                data = key.fileobj.recv(65536)
+                if data:
+                    buffer.extend(data)
+                    *lines, rest = bytes(buffer).split(b"\n")
+                    buffer[:] = rest
+                    for line in lines:
+                        if line.startswith(b"data: "):
+                            self.received[client] = line[6:].decode().strip()
+                        elif line.startswith(b"retry: "):
+                            key.data[2] = int(line[7:])
+                    continue
+                # the stream ended, EventSource reconnects after the retry
+                self.selector.unregister(key.fileobj)
+                key.fileobj.close()
+                del self.sockets[client]
+                heapq.heappush(self.pending, (time.monotonic() + retry / 1000, client))
+
+    def wait_all(self, version, timeout):
+        """Returns seconds until every client has received version."""
+        start = time.monotonic()
+        while time.monotonic() - start < timeout:
+            if all(v == version for v in self.received.values()):
+                return time.monotonic() - start
+            self.pump(0.01)
+        return float("nan")
+
+    def close(self):
+        for sock in self.sockets.values():
+            self.selector.unregister(sock)
+            sock.close()
+        self.sockets.clear()
+        self.pending.clear()
+        self.received.clear()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark idle SSE clients.")
+    parser.add_argument("--clients", type=int, nargs="+", default=[0, 4, 50, 200])
+    parser.add_argument("--idle", type=float, default=120.0,
+                        help="seconds of idle time measured per step")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as fixture_dir:
+        make_fixtures(fixture_dir)
+        snapshot_dir = os.path.join(fixture_dir, "wb")
+        port = free_port()
+        server, _, _ = start_server("api_application", args.workers, fixture_dir, port)
+        try:
+            pids = [server.pid, *worker_pids(server.pid)]
+            clients = Clients(port)
+            print(f"{'clients':>8}{'held':>6}{'threads':>9}{'RSS MB':>8}{'idle CPU %':>12}"
+                  f"{'req/min':>9}{'polls/min':>11}{'push s':>8}")
+            for step, n in enumerate(args.clients):
+                version = f"bench-{step}"
+                publish(snapshot_dir, version)
+                clients.close()
+                clients.connect(n)
+                clients.wait_all(version, 30)
+                clients.pump(1.0)
+
+                cpu_before = server_stats(pids)[0]
+                requests_before = clients.requests
+                clients.pump(args.idle)
+                cpu, rss, threads = server_stats(pids)
+                idle_cpu = 100 * (cpu - cpu_before) / args.idle
+                per_minute = 60 * (clients.requests - requests_before) / args.idle
+                held = clients.held()
+
+                publish(snapshot_dir, f"{version}-new")
+                push = clients.wait_all(f"{version}-new", 90)
+                # polls/min: the requests the 60 s dcc.Interval made
+                print(f"{n:>8}{held:>6}{threads:>9}{rss:>8.0f}{idle_cpu:>12.2f}"
+                      f"{per_minute:>9.1f}{n:>11}{push:>8.2f}")
+            clients.close()
+        finally:
+            stop_server(server)
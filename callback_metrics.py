@@ -0,0 +1,394 @@
+# Per-callback metrics for the Dash apps, served in the Prometheus text format.
+# instrument(app) wraps every server callback registered after it and adds a
+# /metrics route to the Flask server:
+#
+#     dash_callback_calls_total{callback, outcome}   ok, prevented or error
+#     dash_callback_phase_seconds{callback, phase}   histogram per phase
+#     dash_callback_request_bytes{callback}          histogram
+#     dash_callback_response_bytes{callback}         histogram
+#     figure_cache_lookups_total{result}             memory_hit, disk_hit, miss
+#
+# A callback's time is split into phases: "figure" is the time spent inside
+# `with phase("figure"):` blocks, "prep" the rest of the function, and
+# "serialize" what Dash does around it, mostly encoding the JSON response.
+# Metrics are kept per process. With METRICS_DIR set (serve.py sets it), each
+# process also writes its metrics to a file of its own there, and /metrics
+# serves the sum over every process, including recycled ones. Callbacks only
+# update counters in memory: the file is written by a background thread every
+# METRICS_DUMP_INTERVAL seconds (default 5) when something changed, when the
+# process serves /metrics itself and when it exits. The other processes'
+# counts in a scrape can be that many seconds old.
+# Callbacks called outside a request (tests, benchmarks, prebuilt views) are
+# not recorded.
+import atexit
+import functools
+import glob
+import json
+import os
+import threading
+import time
+from contextlib import nullcontext
+from threading import Lock
+from time import perf_counter
+
+from dash.exceptions import PreventUpdate
+from flask import Response, g, has_request_context, request
+
+METRICS_PATH = "/metrics"
+METRICS_DIR = os.environ.get("METRICS_DIR")
+METRICS_DUMP_INTERVAL = float(os.environ.get("METRICS_DUMP_INTERVAL", 5))
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+def _escape(value):
+    return str(value).replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{n}="{_escape(v)}"' for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.values = {}
+        self._lock = Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def snapshot(self):
+        """The values as a JSON serializable list."""
+        with self._lock:
+            return [[list(k), v] for k, v in self.values.items()]
+
+    def add(self, snapshot):
+        """Adds the values of another process's snapshot."""
+        with self._lock:
+            for label_values, value in snapshot:
+                key = tuple(label_values)
+                self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        with self._lock:
+            values = dict(self.values)
+        for label_values, value in sorted(values.items()):
+            yield self.name + _format_labels(self.labels, label_values), value
+
+
+class Histogram:
+    """Cumulative bucket counts, sum and count per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.values = {}
+        self._lock = Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            counts, total = self.values.get(label_values, (None, 0))
+            if counts is None:
+                counts = [0] * len(self.buckets)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[label_values] = (counts, total + value)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(k), [list(c), s]] for k, (c, s) in self.values.items()]
+
+    def add(self, snapshot):
+        with self._lock:
+            for label_values, (counts, total) in snapshot:
+                key = tuple(label_values)
+                old_counts, old_total = self.values.get(key, ([0] * len(self.buckets), 0))
+                self.values[key] = (
+                    [a + b for a, b in zip(old_counts, counts)], old_total + total
+                )
+
+    def samples(self):
+        with self._lock:
+            values = {k: (list(c), s) for k, (c, s) in self.values.items()}
+        for label_values, (counts, total) in sorted(values.items()):
+            for bound, count in zip(self.buckets, counts):
+                labels = _format_labels(
+                    self.labels + ("le",), label_values + (_format_value(bound),)
+                )
+                yield f"{self.name}_bucket{labels}", count
+            labels = _format_labels(self.labels, label_values)
+            yield f"{self.name}_sum{labels}", total
+            yield f"{self.name}_count{labels}", counts[-1]
+
+
+class CacheLookups:
+    """figure_cache_lookups_total, read from FigureCache counters at scrape time."""
+
+    kind = "counter"
+    name = "figure_cache_lookups_total"
+    help = "Figure cache lookups by result."
+    labels = ("result",)
+
+    def __init__(self):
+        self.caches = []
+        # Lookups made before the process was forked, counted by the parent
+        self.baseline = {}
+
+    def results(self):
+        return {
+            "memory_hit": sum(c.hits - c.disk_hits for c in self.caches),
+            "disk_hit": sum(c.disk_hits for c in self.caches),
+            "miss": sum(c.misses for c in self.caches),
+        }
+
+    def snapshot(self):
+        return [
+            [[result], value - self.baseline.get(result, 0)]
+            for result, value in self.results().items()
+        ]
+
+    def samples(self):
+        for (result,), value in self.snapshot():
+            yield f'{self.name}{{result="{result}"}}', value
+
+
+class CallbackMetrics:
+    """The metrics of one Dash app."""
+
+    def __init__(self, shared_dir=METRICS_DIR, dump_interval=METRICS_DUMP_INTERVAL):
+        self.calls = Counter(
+            "dash_callback_calls_total", "Callback requests by outcome.",
+            ("callback", "outcome"),
+        )
+        self.phase_seconds = Histogram(
+            "dash_callback_phase_seconds", "Callback time per phase.",
+            ("callback", "phase"),
+        )
+        self.request_bytes = Histogram(
+            "dash_callback_request_bytes", "Size of the callback request body.",
+            ("callback",), SIZE_BUCKETS,
+        )
+        self.response_bytes = Histogram(
+            "dash_callback_response_bytes", "Size of the callback response body.",
+            ("callback",), SIZE_BUCKETS,
+        )
+        self.cache_lookups = CacheLookups()
+        self.metrics = [
+            self.calls, self.phase_seconds, self.request_bytes, self.response_bytes,
+            self.cache_lookups,
+        ]
+        self.shared_dir = shared_dir
+        self.dump_interval = dump_interval
+        self._dump_path = None
+        self._dump_lock = Lock()
+        self._dirty = False
+        self._dumper = None
+        if shared_dir and hasattr(os, "register_at_fork"):
+            os.register_at_fork(after_in_child=self._forked)
+
+    def _forked(self):
+        # Counting starts over in the child, under a file of its own. The
+        # dump thread is not copied by fork and starts with the first callback.
+        self._dump_path = None
+        self._dirty = False
+        self._dumper = None
+        self.cache_lookups.baseline = self.cache_lookups.results()
+        for metric in self.metrics[:-1]:
+            metric.values = {}
+
+    def _start_dumper(self):
+        with self._dump_lock:
+            if self._dumper is not None:
+                return
+            self._dumper = threading.Thread(
+                target=self._dump_loop, name="metrics-dump", daemon=True
+            )
+            self._dumper.start()
+        # A recycled worker leaves its last counts behind
+        atexit.register(self.dump)
+
+    def _dump_loop(self):
+        while True:
+            time.sleep(self.dump_interval)
+            if self._dirty:
+                self.dump()
+
+    def watch_cache(self, figure_cache):
+        """Adds a FigureCache to figure_cache_lookups_total."""
+        self.cache_lookups.caches.append(figure_cache)
+
+    def wrap(self, func):
+        """Returns func timing itself into the current request."""
+        name = func.__name__
+
+        @functools.wraps(func)
+        def timed(*args, **kwargs):
+            if not has_request_context():
+                return func(*args, **kwargs)
+            g.callback_name = name
+            g.callback_phases = {}
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except PreventUpdate:
+                raise
+            except Exception:
+                g.callback_error = True
+                self.calls.inc(name, "error")
+                self._changed()
+                raise
+            finally:
+                g.callback_seconds = perf_counter() - start
+
+        return timed
+
+    def record(self, response):
+        """Records the phases and sizes of a finished callback request."""
+        name = g.callback_name
+        elapsed = perf_counter() - g.callback_request_start
+        marked = g.callback_phases
+        own = g.get("callback_seconds", 0.0)
+        self.phase_seconds.observe(max(own - sum(marked.values()), 0.0), name, "prep")
+        self.phase_seconds.observe(marked.get("figure", 0.0), name, "figure")
+        self.phase_seconds.observe(max(elapsed - own, 0.0), name, "serialize")
+        self.request_bytes.observe(request.content_length or 0, name)
+        self.response_bytes.observe(response.calculate_content_length() or 0, name)
+        self.calls.inc(name, "prevented" if response.status_code == 204 else "ok")
+        self._changed()
+
+    def _changed(self):
+        # The file is written later, off the request
+        if self.shared_dir:
+            self._dirty = True
+            if self._dumper is None:
+                self._start_dumper()
+
+    def dump(self):
+        """Writes this process's metrics to the shared directory."""
+        with self._dump_lock:
+            self._dirty = False
+            if self._dump_path is None:
+                # The pid alone could be reused by a later worker
+                name = f"{os.getpid()}-{time.time_ns()}.json"
+                self._dump_path = os.path.join(self.shared_dir, name)
+            tmp_path = f"{self._dump_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({m.name: m.snapshot() for m in self.metrics}, f)
+            os.replace(tmp_path, self._dump_path)
+
+    def combined(self):
+        """The metrics summed over every process that wrote to the shared
+        directory."""
+        self.dump()
+        totals = [
+            Histogram(m.name, m.help, m.labels, m.buckets[:-1]) if m.kind == "histogram"
+            else Counter(m.name, m.help, m.labels)
+            for m in self.metrics
+        ]
+        for path in glob.glob(os.path.join(self.shared_dir, "*.json")):
+            try:
+                with open(path) as f:
+                    snapshot = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for total in totals:
+                total.add(snapshot.get(total.name, []))
+        return totals
+
+    def render(self):
+        lines = []
+        for metric in self.combined() if self.shared_dir else self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for sample, value in metric.samples():
+                lines.append(f"{sample} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+class _Phase:
+    """Adds the time spent in a block to phases[name]."""
+
+    __slots__ = ("phases", "name", "start")
+
+    def __init__(self, phases, name):
+        self.phases = phases
+        self.name = name
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *exc_info):
+        self.phases[self.name] = self.phases.get(self.name, 0.0) + perf_counter() - self.start
+
+
+# Shared by every phase outside a callback request, so those allocate nothing
+_NO_PHASE = nullcontext()
+
+
+def phase(name):
+    """Attributes the time spent in the block to a phase of the current
+    callback; a no-op outside a callback request."""
+    if not has_request_context() or "callback_phases" not in g:
+        return _NO_PHASE
+    return _Phase(g.callback_phases, name)
+
+
+def instrument(app, path=METRICS_PATH):
+    """Wraps the server callbacks of app registered from now on and serves
+    their metrics on path. Returns the CallbackMetrics."""
+    metrics = CallbackMetrics()
+    server = app.server
+    update_path = app.config.routes_pathname_prefix + "_dash-update-component"
+
+    register_callback = app.callback
+
+    def callback(*args, **kwargs):
+        register = register_callback(*args, **kwargs)
+
+        def decorator(func):
+            register(metrics.wrap(func))
+            # Direct calls, e.g. from bench_callbacks.py, skip the wrapper
+            return func
+
+        return decorator
+
+    app.callback = callback
+
+    @server.before_request
+    def start_timer():
+        if request.path == update_path:
+            g.callback_request_start = perf_counter()
+
+    @server.after_request
+    def record(response):
+        if "callback_name" in g and not g.get("callback_error"):
+            metrics.record(response)
+        return response
+
+    def serve_metrics():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+    server.add_url_rule(path, "metrics", serve_metrics)
+    return metrics
@@ -0,0 +1,260 @@
+# Loads the air quality data set through a typed columnar cache.
+# The CSV is parsed once, then every column is written as its own .npy file
+# so that later processes (e.g. gunicorn workers) can memory-map the arrays
+# instead of re-parsing text on every boot.
+import hashlib
+import json
+import os
+import re
+import shutil
+
+import numpy as np
+import pandas as pd
+
+CSV_PATH = "Input/Air_Quality.csv"
+CACHE_DIR = "Input/.cache"
+
+# Low cardinality text columns are stored as integer codes + categories
+CATEGORICAL_COLUMNS = [
+    "Name",
+    "Measure",
+    "Measure Info",
+    "Geo Type Name",
+    "Geo Place Name",
+    "Time Period",
+    "Message",
+    "Period Kind",
+    "Season",
+]
+DATE_COLUMNS = {"Start_Date": "%m/%d/%Y"}
+FLOAT_COLUMNS = {"Data Value": "float32"}
+
+# Bumped whenever parse_air_quality changes, so old caches get rebuilt
+SCHEMA_VERSION = 2
+
+# Free text "Time Period" formats: (pattern, period kind, season)
+TIME_PERIOD_PATTERNS = [
+    (re.compile(r"^Annual Average (\d{4})$"), "annual", "Annual"),
+    (re.compile(r"^(\d{4})$"), "annual", "Annual"),
+    (re.compile(r"^Summer (\d{4})$"), "seasonal", "Summer"),
+    (re.compile(r"^Winter (\d{4})-\d{2}$"), "seasonal", "Winter"),
+    (re.compile(r"^2-Year Summer Average (\d{4})-(\d{4})$"), "multi-year", "Summer"),
+    (re.compile(r"^(\d{4})-(\d{4})$"), "multi-year", "Annual"),
+]
+
+
+def file_hash(path, block_size=1 << 20):
+    """Returns the sha256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def parse_air_quality(raw_df):
+    """Converts a raw CSV frame into the typed column layout."""
+    df = raw_df.copy()
+    for col in CATEGORICAL_COLUMNS:
+        if col in df:
+            df[col] = df[col].astype("string").astype("category")
+    for col, fmt in DATE_COLUMNS.items():
+        if col in df:
+            df[col] = pd.to_datetime(df[col], format=fmt)
+    for col, dtype in FLOAT_COLUMNS.items():
+        if col in df:
+            df[col] = df[col].astype(dtype)
+    if "Time Period" in df and "Start_Date" in df:
+        df = add_period_columns(df)
+    return df
+
+
+def _parse_time_period(text):
+    """Returns (kind, season, year, start, end) for one Time Period value.
+
+    start/end are None for "Annual Average" periods, whose 12 months begin
+    at the row's Start_Date.
+    """
+    for pattern, kind, season in TIME_PERIOD_PATTERNS:
+        match = pattern.match(text)
+        if match is None:
+            continue
+        first = int(match.group(1))
+        last = int(match.group(2)) if pattern.groups > 1 else first
+        if text.startswith("Annual Average"):
+            return kind, season, first, None, None
+        if season == "Summer":
+            start, end = f"{first}-06-01", f"{last}-08-31"
+        elif season == "Winter":
+            start, end = f"{first}-12-01", pd.Timestamp(f"{first + 1}-03-01") - pd.Timedelta(days=1)
+        else:
+            start, end = f"{first}-01-01", f"{last}-12-31"
+        return kind, season, first, pd.Timestamp(start), pd.Timestamp(end)
+    return "other", None, None, pd.NaT, pd.NaT
+
+
+def add_period_columns(df):
+    """Adds Period Kind, Season, Period Year, Period Start and Period End.
+
+    Only the distinct Time Period values are parsed, rows are filled in
+    through the category codes.
+    """
+    time_period = df["Time Period"].astype("category")
+    parsed = pd.DataFrame(
+        [_parse_time_period(str(c)) for c in time_period.cat.categories],
+        columns=["kind", "season", "year", "start", "end"],
+    )
+    codes = time_period.cat.codes.to_numpy()
+    found = codes >= 0
+    codes = np.where(found, codes, 0)
+
+    def by_row(column):
+        values = parsed[column].take(codes).reset_index(drop=True)
+        return values.where(found)
+
+    df["Period Kind"] = pd.Categorical(by_row("kind"))
+    df["Season"] = pd.Categorical(by_row("season"))
+    df["Period Year"] = by_row("year").fillna(-1).to_numpy(dtype="int16")
+
+    # Annual averages run for 12 months from their Start_Date
+    row_based = by_row("start").isna() & by_row("kind").eq("annual")
+    row_start = df["Start_Date"].reset_index(drop=True)
+    start = pd.to_datetime(by_row("start")).where(~row_based, row_start)
+    end = pd.to_datetime(by_row("end")).where(
+        ~row_based, row_start + pd.DateOffset(years=1) - pd.Timedelta(days=1)
+    )
+    df["Period Start"] = start.to_numpy()
+    df["Period End"] = end.to_numpy()
+    return df
+
+
+def read_air_quality_csv(csv_path=CSV_PATH):
+    """Parses the CSV without touching the cache."""
+    return parse_air_quality(pd.read_csv(csv_path))
+
+
+def _manifest_path(csv_path, cache_dir):
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    return os.path.join(cache_dir, name + ".json")
+
+
+def atomic_write_json(path, data):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def write_columnar_cache(df, cache_dir):
+    """Writes each column of df to cache_dir and returns the column specs."""
+    os.makedirs(cache_dir, exist_ok=True)
+    columns = []
+    for i, col in enumerate(df.columns):
+        spec = {"name": col, "file": f"{i}.npy"}
+        series = df[col]
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            spec["kind"] = "category"
+            spec["categories"] = [str(c) for c in series.cat.categories]
+            values = series.cat.codes.to_numpy()
+        elif pd.api.types.is_datetime64_any_dtype(series):
+            spec["kind"] = "datetime"
+            values = series.to_numpy(dtype="datetime64[ns]")
+        else:
+            spec["kind"] = "numeric"
+            values = series.to_numpy()
+        np.save(os.path.join(cache_dir, spec["file"]), values, allow_pickle=False)
+        columns.append(spec)
+    return columns
+
+
+def read_columnar_cache(cache_dir, columns, mmap=True):
+    """Rebuilds a frame from column specs, memory-mapping the arrays."""
+    mmap_mode = "r" if mmap else None
+    data = {}
+    for spec in columns:
+        values = np.load(os.path.join(cache_dir, spec["file"]), mmap_mode=mmap_mode)
+        if spec["kind"] == "category":
+            data[spec["name"]] = pd.Categorical.from_codes(
+                values, categories=spec["categories"]
+            )
+        else:
+            data[spec["name"]] = values
+    return pd.DataFrame(data, copy=False)
+
+
+def prune_cache(csv_path, cache_dir, keep):
+    """Deletes the cache directories of csv_path's older contents or schema
+    versions, all but keep."""
+    name = os.path.splitext(os.path.basename(csv_path))[0]
+    pattern = re.compile(re.escape(name) + r"-[0-9a-f]{16}-v\d+")
+    for entry in os.scandir(cache_dir):
+        if entry.is_dir() and entry.name != keep and pattern.fullmatch(entry.name):
+            # Processes that mapped the old columns keep their copy
+            shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def load_air_quality(csv_path=CSV_PATH, cache_dir=CACHE_DIR, mmap=True):
+    """Returns the typed air quality frame, rebuilding the cache if stale.
+
+    The cache is keyed on the source file's mtime and sha256. A changed mtime
+    with an unchanged hash (e.g. a fresh checkout) only refreshes the manifest.
+    A rebuild deletes the directories of the previous versions.
+    """
+    manifest_path = _manifest_path(csv_path, cache_dir)
+    mtime = os.stat(csv_path).st_mtime_ns
+
+    manifest = None
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+
+    if manifest is not None and manifest.get("schema") != SCHEMA_VERSION:
+        manifest = None
+
+    if manifest is not None and manifest["mtime"] != mtime:
+        if manifest["sha256"] == file_hash(csv_path):
+            manifest["mtime"] = mtime
+            atomic_write_json(manifest_path, manifest)
+        else:
+            manifest = None
+
+    if manifest is not None:
+        data_dir = os.path.join(cache_dir, manifest["data_dir"])
+        try:
+            df = read_columnar_cache(data_dir, manifest["columns"], mmap=mmap)
+        except FileNotFoundError:
+            # Missing, or pruned by a newer build since the manifest was read
+            pass
+        else:
+            df.attrs["version"] = manifest["sha256"][:16]
+            return df
+
+    # Cache is missing or stale, parse the CSV and write a new one.
+    # Each version goes in its own directory so concurrent readers never
+    # see a half written cache.
+    df = read_air_quality_csv(csv_path)
+    sha256 = file_hash(csv_path)
+    data_dir = "{}-{}-v{}".format(
+        os.path.splitext(os.path.basename(manifest_path))[0], sha256[:16], SCHEMA_VERSION
+    )
+    columns = write_columnar_cache(df, os.path.join(cache_dir, data_dir))
+    atomic_write_json(
+        manifest_path,
+        {
+            "schema": SCHEMA_VERSION,
+            "mtime": mtime,
+            "sha256": sha256,
+            "data_dir": data_dir,
+            "columns": columns,
+        },
+    )
+    prune_cache(csv_path, cache_dir, data_dir)
+    df.attrs["version"] = sha256[:16]
+    return df
+
+
+if __name__ == "__main__":
+    # Build (or validate) the cache ahead of starting the app workers
+    pollution_df = load_air_quality()
+    print(pollution_df.dtypes)
+    print(f"{len(pollution_df)} rows cached in {CACHE_DIR}")
@@ -0,0 +1,62 @@
+# Server side downsampling for line charts.
+# Both functions take a series sorted by x and return the sorted positions of
+# at most n_out points to keep, always including the first and the last, so
+# callers can take() whatever columns they need.
+import numpy as np
+
+
+def lttb(x, y, n_out):
+    """Largest-Triangle-Three-Buckets: keeps the n_out points that best
+    preserve the visual shape of the line.
+    """
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    if n_out < 3:
+        return np.array([0, n - 1])
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # First and last points are always kept, the rest is split in buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=np.intp)
+    keep[0], keep[-1] = 0, n - 1
+
+    prev = 0
+    for i in range(n_out - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else n
+        # Average of the next bucket is the third corner of the triangle
+        avg_x = x[stop:next_stop].mean()
+        avg_y = y[stop:next_stop].mean()
+        areas = np.abs(
+            (x[prev] - avg_x) * (y[start:stop] - y[prev])
+            - (x[prev] - x[start:stop]) * (avg_y - y[prev])
+        )
+        prev = start + int(np.argmax(areas))
+        keep[i + 1] = prev
+    return keep
+
+
+def minmax(x, y, n_out):
+    """Keeps the first and last point, and the min and max point of
+    (n_out - 2) // 2 equal-count buckets in between."""
+    n = len(x)
+    if n_out >= n:
+        return np.arange(n)
+    n_buckets = (n_out - 2) // 2
+    if n_buckets < 1:
+        return np.array([0, n - 1])
+    y = np.asarray(y, dtype=float)[1:-1]
+    sizes = np.full(n_buckets, len(y) // n_buckets)
+    sizes[:len(y) % n_buckets] += 1
+    buckets = np.repeat(np.arange(n_buckets), sizes)
+
+    # Sorting by (bucket, y) puts each bucket's min first and max last
+    order = np.lexsort((y, buckets))
+    starts = np.flatnonzero(np.r_[True, np.diff(buckets[order]) != 0])
+    stops = np.r_[starts[1:], len(y)] - 1
+    return np.unique(np.r_[0, 1 + order[starts], 1 + order[stops], n - 1])
+
+
+METHODS = {"lttb": lttb, "minmax": minmax}
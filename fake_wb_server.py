@@ -0,0 +1,171 @@
+# Local stand-in for the World Bank API, for trying out wb_snapshot.py.
+# Serves /country, /indicator and /country/<codes>/indicator/<id> with
+# deterministic values, paging and ETags, and can add latency and errors:
+# random ones, the first few requests for every URL, or every request for
+# some paths (tests/test_wb_snapshot.py).
+#
+#     python fake_wb_server.py --port 8090 --delay 0.2 --fail-rate 0.1
+#     python wb_snapshot.py --once --base-url http://127.0.0.1:8090 --snapshot-dir /tmp/wb
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+COUNTRIES = [
+    # Every tenth entry is an aggregate (no capital city), like the real API
+    {"id": f"C{i:03d}", "name": f"Country {i}", "capitalCity": "" if i % 10 == 0 else "X"}
+    for i in range(220)
+]
+
+INDICATOR_LIST = [
+    {"id": "IT.NET.USER.ZS", "name": "Individuals using the Internet (% of population)"},
+    {"id": "SG.GEN.PARL.ZS",
+     "name": "Proportion of seats held by women in national parliments (%)"},
+    {"id": "EN.ATM.CO2E.KT", "name": "CO2 emissions (kt)"},
+    {"id": "EN.ATM.PM25.MC.M3",
+     "name": "PM2.5 air pollution, mean annual exposure (micrograms per cubic meter)"},
+    {"id": "EN.ATM.PM25.MC.ZS",
+     "name": "PM2.5 air pollution, population exposed to levels exceeding WHO "
+             "guideline value (% of total)"},
+] + [
+    # Filler so the list is about as long as the real one
+    {"id": f"FAKE.{i:05d}", "name": f"Synthetic indicator {i} ({['%', 'kt', 'US$'][i % 3]})"}
+    for i in range(20000)
+]
+
+
+class FakeWorldBank(ThreadingHTTPServer):
+    """Threaded fake API server; delay, the failures and counts can be changed
+    while it runs.
+
+    fail_rate is the share of requests answered with fail_status, fail_first
+    the number of times every URL is answered with fail_status before it
+    succeeds, and fail_paths {path substring: status} the paths that always
+    fail.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, delay=0.0, fail_rate=0.0, fail_status=503):
+        super().__init__(address, FakeHandler)
+        self.delay = delay
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.fail_first = 0
+        self.fail_paths = {}
+        self.seen = {}
+        self.counts = {}
+        self.active = 0
+        self.max_active = 0
+        self._lock = threading.Lock()
+
+    def count(self, status):
+        with self._lock:
+            self.counts[status] = self.counts.get(status, 0) + 1
+
+    def failure(self, url):
+        """Returns the status to fail a request for url with, or None."""
+        with self._lock:
+            for part, status in self.fail_paths.items():
+                if part in url:
+                    return status
+            seen = self.seen[url] = self.seen.get(url, 0) + 1
+        if seen <= self.fail_first or random.random() < self.fail_rate:
+            return self.fail_status
+        return None
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+def _value(code, indicator, year):
+    digest = hashlib.sha1(f"{code}{indicator}{year}".encode()).digest()
+    return int.from_bytes(digest[:2], "big") / 655.35
+
+
+class FakeHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _send(self, status, body=b"", headers=()):
+        self.server.count(status)
+        self.send_response(status)
+        for key, value in headers:
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        server = self.server
+        with server._lock:
+            server.active += 1
+            server.max_active = max(server.max_active, server.active)
+        try:
+            time.sleep(server.delay)
+            status = server.failure(self.path)
+            if status is not None:
+                return self._send(status)
+            self._answer()
+        finally:
+            with server._lock:
+                server.active -= 1
+
+    def _answer(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        match = re.match(r".*/country/([^/]+)/indicator/([^/]+)$", url.path)
+        if url.path.endswith("/country"):
+            rows = COUNTRIES
+        elif url.path.endswith("/indicator"):
+            rows = [dict(r, source={"id": "2", "value": "Fake"}) for r in INDICATOR_LIST]
+        elif match:
+            indicator = match.group(2)
+            codes = match.group(1).split(";")
+            if codes == ["all"]:
+                codes = [c["id"] for c in COUNTRIES]
+            first, last = map(int, query["date"][0].split(":"))
+            rows = [
+                {
+                    "indicator": {"id": indicator},
+                    "countryiso3code": code,
+                    "date": str(year),
+                    "value": _value(code, indicator, year),
+                }
+                for code in codes
+                for year in range(last, first - 1, -1)
+            ]
+        else:
+            return self._send(404)
+
+        etag = '"%s"' % hashlib.sha1(url.path.encode()).hexdigest()[:16]
+        if self.headers.get("If-None-Match") == etag:
+            return self._send(304)
+        page = int(query.get("page", ["1"])[0])
+        per_page = int(query.get("per_page", ["50"])[0])
+        pages = max(1, -(-len(rows) // per_page))
+        meta = {"page": page, "pages": pages, "per_page": per_page, "total": len(rows)}
+        body = json.dumps([meta, rows[(page - 1) * per_page:page * per_page]]).encode()
+        self._send(200, body, [("Content-Type", "application/json"), ("ETag", etag)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake World Bank API server.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="seconds added to every response")
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="share of requests answered with --fail-status")
+    parser.add_argument("--fail-status", type=int, default=503)
+    args = parser.parse_args()
+
+    server = FakeWorldBank(("127.0.0.1", args.port), args.delay, args.fail_rate,
+                           args.fail_status)
+    print(f"Fake World Bank API on http://127.0.0.1:{args.port}")
+    server.serve_forever()
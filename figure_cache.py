@@ -0,0 +1,159 @@
+# Server side cache for built Plotly figures.
+# Figures are stored as JSON in a directory on disk, so every worker pointed
+# at the same directory shares the results, and decoded in a small in-process
+# LRU. Both layers are bounded by size; the disk layer evicts the least
+# recently used files (by mtime, which is bumped on every hit). Each process
+# adds the files it writes to the directory size it last scanned and only
+# scans again, evicting down to EVICT_TO of the limit, once that passes the
+# limit; files written by the other workers are counted at the next scan.
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from threading import Lock
+
+FIGURE_CACHE_DIR = os.environ.get("FIGURE_CACHE_DIR", "cache/figures")
+# Fraction of max_disk_bytes the disk layer is evicted down to
+EVICT_TO = 0.9
+
+
+def make_key(*parts):
+    """Builds a stable cache key from JSON serializable parts."""
+    canonical = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha1(canonical.encode()).hexdigest()
+
+
+class FigureCache:
+    """Bounded LRU cache of figures with a shared on-disk backend."""
+
+    def __init__(
+        self,
+        cache_dir=FIGURE_CACHE_DIR,
+        max_disk_bytes=256 * 2**20,
+        max_memory_bytes=16 * 2**20,
+    ):
+        self.cache_dir = cache_dir
+        self.max_disk_bytes = max_disk_bytes
+        self.max_memory_bytes = max_memory_bytes
+        # key: (decoded figure, size of its JSON)
+        self._memory = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_bytes = 0
+        self._lock = Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._evict()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, key + ".json")
+
+    def _remember(self, key, fig, size):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return
+            self._memory[key] = (fig, size)
+            self._memory_bytes += size
+            while self._memory_bytes > self.max_memory_bytes and len(self._memory) > 1:
+                _, (_, old_size) = self._memory.popitem(last=False)
+                self._memory_bytes -= old_size
+
+    def get(self, key):
+        """Returns the cached figure as a dict, or None on a miss.
+
+        The dict is shared with other callers, do not modify it.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        if self.cache_dir:
+            path = self._path(key)
+            try:
+                with open(path, "rb") as f:
+                    fig_json = f.read()
+                os.utime(path)
+            except FileNotFoundError:
+                fig_json = None
+            if fig_json is not None:
+                fig = json.loads(fig_json)
+                self._remember(key, fig, len(fig_json))
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return fig
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key, fig):
+        """Stores a figure (go.Figure or dict) and returns it as a dict,
+        shared like the ones get returns."""
+        import plotly.io as pio
+
+        fig_json = pio.to_json(fig, validate=False).encode()
+        fig = json.loads(fig_json)
+        self._remember(key, fig, len(fig_json))
+        if self.cache_dir:
+            path = self._path(key)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(fig_json)
+            os.replace(tmp_path, path)
+            with self._lock:
+                self._disk_bytes += len(fig_json)
+                full = self._disk_bytes > self.max_disk_bytes
+            if full:
+                self._evict()
+        return fig
+
+    def get_or_build(self, key, build):
+        """Returns the cached figure for key, calling build() on a miss."""
+        fig = self.get(key)
+        if fig is None:
+            fig = self.set(key, build())
+        return fig
+
+    def _evict(self):
+        """Scans the directory and deletes the least recently used files
+        until it is below EVICT_TO of max_disk_bytes."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".json"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        if total > self.max_disk_bytes:
+            for _, size, path in sorted(entries):
+                if total <= self.max_disk_bytes * EVICT_TO:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+        with self._lock:
+            self._disk_bytes = total
+
+    def stats(self):
+        """Returns the hit/miss counters for this process."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_bytes,
+            }
@@ -0,0 +1,116 @@
+# Opt-in compact encoding of callback responses.
+#
+# TYPED_ARRAYS=1 sends the numeric arrays of figures as plotly.js typed arrays,
+# {"dtype": "f8", "bdata": "<base64>"}, instead of JSON number lists. The
+# plotly.js bundled with Dash 2.16 predates typed arrays, so the apps then load
+# a newer one (PLOTLY_JS_URL), which dcc.Graph uses instead of its own.
+#
+# COMPRESS_RESPONSES=1 compresses JSON responses with brotli, when the brotli
+# package is installed and the browser accepts it, or gzip.
+#
+# python bench_payload.py compares the response sizes of each mode.
+import base64
+import gzip
+import os
+
+import numpy as np
+
+TYPED_ARRAYS = bool(os.environ.get("TYPED_ARRAYS"))
+COMPRESS_RESPONSES = bool(os.environ.get("COMPRESS_RESPONSES"))
+PLOTLY_JS_URL = os.environ.get(
+    "PLOTLY_JS_URL", "https://cdn.plot.ly/plotly-2.35.2.min.js"
+)
+# Part of the figure cache keys and static view URLs, so a figure built with
+# the other TYPED_ARRAYS setting is never served
+ENCODING = "typed" if TYPED_ARRAYS else "json"
+# Smaller responses are sent as they are
+MIN_COMPRESS_BYTES = 1024
+COMPRESS_MIMETYPES = {"application/json", "text/html", "text/css", "application/javascript"}
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Integer types plotly.js reads, narrowest first
+INT_TYPES = [np.int8, np.uint8, np.int16, np.uint16, np.int32, np.uint32]
+
+
+def plotly_scripts():
+    """external_scripts for the Dash app: the newer plotly.js when typed
+    arrays are on."""
+    return [PLOTLY_JS_URL] if TYPED_ARRAYS else []
+
+
+def typed_array(values):
+    """Returns values as a plotly.js typed array spec.
+
+    Floats are sent as f8, integers in the narrowest type that holds them.
+    """
+    array = np.asarray(values)
+    if array.dtype.kind in "iub":
+        lo, hi = (array.min(), array.max()) if array.size else (0, 0)
+        for int_type in INT_TYPES:
+            info = np.iinfo(int_type)
+            if info.min <= lo and hi <= info.max:
+                array = array.astype(int_type)
+                break
+        else:
+            array = array.astype("<f8")
+    else:
+        array = array.astype("<f8")
+    spec = {
+        "dtype": array.dtype.str.lstrip("<|="),
+        "bdata": base64.b64encode(np.ascontiguousarray(array)).decode("ascii"),
+    }
+    if array.ndim > 1:
+        spec["shape"] = ",".join(map(str, array.shape))
+    return spec
+
+
+def encode_array(values):
+    """Returns a numeric numpy array as a typed array when TYPED_ARRAYS is
+    on; anything else is returned as it is."""
+    if TYPED_ARRAYS and isinstance(values, np.ndarray) and values.dtype.kind in "iufb":
+        return typed_array(values)
+    return values
+
+
+def encode_arrays(trace):
+    """Returns trace with encode_array applied to each of its properties."""
+    if not TYPED_ARRAYS:
+        return trace
+    return {key: encode_array(value) for key, value in trace.items()}
+
+
+def compress_responses(server, min_size=MIN_COMPRESS_BYTES):
+    """Compresses the Flask server's JSON, HTML, CSS and JavaScript responses."""
+    from flask import request
+
+    @server.after_request
+    def compress(response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or "Content-Encoding" in response.headers
+            or response.mimetype not in COMPRESS_MIMETYPES
+        ):
+            return response
+        body = response.get_data()
+        if len(body) < min_size:
+            return response
+        accepted = request.headers.get("Accept-Encoding", "")
+        if brotli is not None and "br" in accepted:
+            # Quality 4 is about as fast as gzip and still smaller
+            response.set_data(brotli.compress(body, quality=4))
+            response.headers["Content-Encoding"] = "br"
+        elif "gzip" in accepted:
+            response.set_data(gzip.compress(body, compresslevel=6))
+            response.headers["Content-Encoding"] = "gzip"
+        else:
+            return response
+        response.vary.add("Accept-Encoding")
+        return response
+
+    return server
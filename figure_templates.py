@@ -0,0 +1,74 @@
+# Figure templates for the charts drawn on every request.
+# plotly.express validates its arguments, reshapes the frame and groups the
+# traces on every call, and a go.Figure validates every property again. A
+# FigureTemplate holds the layout and trace skeleton of one chart type,
+# validated by plotly once, with the theme trimmed to the trace types it
+# draws. A figure is then the skeleton with only the data arrays filled in,
+# left as numpy buffers for the JSON encoder, or sent as typed arrays (see
+# figure_encoding.py). bench_figures.py checks the result against the
+# plotly.express version.
+from threading import Lock
+
+from figure_encoding import encode_arrays
+
+
+def merge(base, updates):
+    """Returns base with updates merged in. Only the dicts along the updated
+    paths are copied; the rest is shared with base."""
+    merged = dict(base)
+    for key, value in updates.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = merge(merged[key], value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def trim_theme(fig_dict):
+    """Drops the theme's defaults for trace types the figure does not draw."""
+    template = fig_dict.get("layout", {}).get("template")
+    if template and "data" in template:
+        types = {trace.get("type", "scatter") for trace in fig_dict.get("data", [])}
+        template["data"] = {t: v for t, v in template["data"].items() if t in types}
+    return fig_dict
+
+
+class FigureTemplate:
+    """Layout and trace skeleton of one chart type.
+
+    trace holds the properties shared by every trace, layout those of the
+    figure; both are validated the first time the template is used.
+    Figures share the unchanged parts of the skeleton and must not be
+    modified in place.
+    """
+
+    def __init__(self, trace, layout):
+        self._spec = (trace, layout)
+        self._skeleton = None
+        self._lock = Lock()
+
+    def _load(self):
+        # plotly is imported on first use, to keep it out of worker boot time
+        import plotly.graph_objects as go
+
+        with self._lock:
+            if self._skeleton is None:
+                trace, layout = self._spec
+                fig = trim_theme(go.Figure(data=[trace], layout=layout).to_dict())
+                self._skeleton = (fig["data"][0], fig["layout"])
+        return self._skeleton
+
+    @property
+    def colorway(self):
+        """Trace colours of the theme, in the order plotly.express uses them."""
+        layout = self._load()[1]
+        return layout["template"]["layout"]["colorway"]
+
+    def figure(self, traces, layout=None):
+        """Returns a figure dict with one trace per item of traces, each the
+        skeleton updated with that item, and the layout updated with layout."""
+        trace, base_layout = self._skeleton or self._load()
+        return {
+            "data": [encode_arrays(merge(trace, update)) for update in traces],
+            "layout": merge(base_layout, layout or {}),
+        }
@@ -0,0 +1,344 @@
+# Boundary geometry for the NYC choropleth.
+# The map reads one GeoJSON file per geography type from Input/geo
+# (NYC_GEO_DIR), e.g. UHF42.geojson, UHF34.geojson and CD.geojson, in lon/lat.
+# Each feature's id, or its GEOCODE property (NYC_GEO_ID_PROPERTY), must be the
+# Geo Join ID used in Air_Quality.csv. The files are not in the repository;
+#
+#     python geo_shapes.py --download
+#
+# fetches them from the NYC Environment & Health Data Portal, where
+# Air_Quality.csv comes from (NYC_GEO_URL), as TopoJSON and converts them.
+#
+# Every file is simplified once per map zoom level and written to cache/geo as
+# the GeoJSON handed to the Plotly trace. Borders shared by two neighborhoods
+# are simplified once, so the simplified shapes still meet without gaps.
+#
+#     python geo_shapes.py
+#
+# precomputes every level and prints the number of points kept.
+import argparse
+import hashlib
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+from data_loader import atomic_write_json, file_hash
+
+GEO_DIR = os.environ.get("NYC_GEO_DIR", "Input/geo")
+GEO_CACHE_DIR = os.environ.get("GEO_CACHE_DIR", "cache/geo")
+GEO_ID_PROPERTY = os.environ.get("NYC_GEO_ID_PROPERTY", "GEOCODE")
+GEO_SOURCE_URL = os.environ.get(
+    "NYC_GEO_URL",
+    "https://raw.githubusercontent.com/nychealth/EHDP-data/production/geography",
+)
+# Boundary file of every geography type at GEO_SOURCE_URL
+GEO_SOURCES = {"UHF42": "UHF42.topo.json", "UHF34": "UHF34.topo.json", "CD": "CD.topo.json"}
+
+# Simplification tolerance in degrees for each map zoom level, about one pixel
+ZOOM_TOLERANCES = {9: 0.002, 10: 0.001, 11: 0.0005, 12: 0.00025}
+# Decimals kept in the cached coordinates (~1 m)
+PRECISION = 5
+
+
+def source_path(geo_type, geo_dir=GEO_DIR):
+    return os.path.join(geo_dir, f"{geo_type}.geojson")
+
+
+def available_geo_types(geo_dir=GEO_DIR):
+    """Returns the geography types that have a boundary file."""
+    if not os.path.isdir(geo_dir):
+        return []
+    return sorted(
+        os.path.splitext(f)[0] for f in os.listdir(geo_dir) if f.endswith(".geojson")
+    )
+
+
+def zoom_level(zoom):
+    """Returns the precomputed level to use at a map zoom."""
+    levels = sorted(ZOOM_TOLERANCES)
+    if zoom is None:
+        return levels[0]
+    return max([level for level in levels if level <= zoom] or levels[:1])
+
+
+def douglas_peucker(points, tolerance):
+    """Returns a mask of the points of a line to keep (Ramer-Douglas-Peucker).
+
+    The first and last points are always kept.
+    """
+    n = len(points)
+    keep = np.zeros(n, dtype=bool)
+    keep[0] = keep[-1] = True
+    stack = [(0, n - 1)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        start, end = points[first], points[last]
+        segment = end - start
+        inner = points[first + 1:last] - start
+        length = np.hypot(*segment)
+        if length == 0:
+            dist = np.hypot(inner[:, 0], inner[:, 1])
+        else:
+            dist = np.abs(segment[0] * inner[:, 1] - segment[1] * inner[:, 0]) / length
+        i = int(np.argmax(dist))
+        if dist[i] > tolerance:
+            i += first + 1
+            keep[i] = True
+            stack.append((first, i))
+            stack.append((i, last))
+    return keep
+
+
+def _polygons(geometry):
+    """Returns a geometry as a list of polygons, each a list of rings."""
+    if geometry["type"] == "Polygon":
+        return [geometry["coordinates"]]
+    if geometry["type"] == "MultiPolygon":
+        return geometry["coordinates"]
+    raise ValueError(f"Unsupported geometry type: {geometry['type']}")
+
+
+def _feature_id(feature, id_property=GEO_ID_PROPERTY):
+    if feature.get("id") is not None:
+        return str(feature["id"])
+    return str(feature["properties"][id_property])
+
+
+def simplify_features(features, tolerance):
+    """Simplifies the polygons of features, keeping shared borders identical.
+
+    Rings are cut into arcs at every point where the set of rings using a
+    point changes, and at the start of every ring. Each arc is simplified
+    once and reused, in reverse if needed, by every ring that contains it.
+    """
+    rings = []
+    for feature in features:
+        for polygon in _polygons(feature["geometry"]):
+            for ring in polygon:
+                # Rings are closed, the last point repeats the first
+                rings.append([tuple(p[:2]) for p in ring[:-1]])
+
+    owners = {}
+    for ring_no, ring in enumerate(rings):
+        for point in ring:
+            owners.setdefault(point, set()).add(ring_no)
+    fixed = {ring[0] for ring in rings if ring}
+    for ring in rings:
+        for i, point in enumerate(ring):
+            before, after = ring[i - 1], ring[(i + 1) % len(ring)]
+            if owners[point] != owners[before] or owners[point] != owners[after]:
+                fixed.add(point)
+
+    arcs = {}
+
+    def simplify_arc(arc):
+        reverse = arc[-1] < arc[0]
+        key = tuple(arc[::-1]) if reverse else tuple(arc)
+        if key not in arcs:
+            points = np.array(key, dtype=float)
+            arcs[key] = [key[i] for i in np.flatnonzero(douglas_peucker(points, tolerance))]
+        return arcs[key][::-1] if reverse else arcs[key]
+
+    simplified = []
+    for ring in rings:
+        cuts = [i for i, point in enumerate(ring) if point in fixed] + [len(ring)]
+        closed = ring + ring[:1]
+        out = []
+        for start, stop in zip(cuts, cuts[1:]):
+            out.extend(simplify_arc(closed[start:stop + 1])[:-1])
+        # Rings that collapse are kept as they were
+        simplified.append(out if len(out) >= 3 else ring)
+
+    result = []
+    ring_no = 0
+    for feature in features:
+        polygons = []
+        for polygon in _polygons(feature["geometry"]):
+            new_polygon = []
+            for _ in polygon:
+                ring = simplified[ring_no]
+                ring_no += 1
+                new_polygon.append(
+                    [[round(x, PRECISION), round(y, PRECISION)] for x, y in ring + ring[:1]]
+                )
+            polygons.append(new_polygon)
+        result.append(
+            {
+                "type": "Feature",
+                "id": _feature_id(feature),
+                "properties": {},
+                "geometry": {"type": "MultiPolygon", "coordinates": polygons},
+            }
+        )
+    return result
+
+
+def _cache_path(geo_type, sha256, level, cache_dir):
+    return os.path.join(cache_dir, f"{geo_type}-{sha256[:16]}-z{level}.json")
+
+
+def build_levels(geo_type, geo_dir=GEO_DIR, cache_dir=GEO_CACHE_DIR):
+    """Simplifies a boundary file for every zoom level and caches the results.
+
+    Returns {level: path of the cached GeoJSON}, or None without a boundary
+    file.
+    """
+    path = source_path(geo_type, geo_dir)
+    if not os.path.exists(path):
+        return None
+    sha256 = file_hash(path)
+    paths = {
+        level: _cache_path(geo_type, sha256, level, cache_dir)
+        for level in ZOOM_TOLERANCES
+    }
+    missing = [level for level, p in paths.items() if not os.path.exists(p)]
+    if missing:
+        with open(path) as f:
+            features = json.load(f)["features"]
+        os.makedirs(cache_dir, exist_ok=True)
+        for level in missing:
+            atomic_write_json(
+                paths[level],
+                {
+                    "type": "FeatureCollection",
+                    "features": simplify_features(features, ZOOM_TOLERANCES[level]),
+                },
+            )
+    return paths
+
+
+_levels = {}
+
+
+@lru_cache(maxsize=32)
+def _load_geometry(cache_path):
+    with open(cache_path) as f:
+        geojson = json.load(f)
+    return geojson, hashlib.sha1(os.path.basename(cache_path).encode()).hexdigest()[:12]
+
+
+def geometry(geo_type, zoom=None, geo_dir=GEO_DIR, cache_dir=GEO_CACHE_DIR):
+    """Returns (geojson, geometry key) for a geography type at a map zoom.
+
+    The key changes only with the boundary file and the zoom level, so a
+    client that already holds the geometry for a key never needs it again.
+    Returns (None, None) without a boundary file.
+    """
+    path = source_path(geo_type, geo_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None, None
+    # Boundary files are hashed once per modification, not on every call
+    key = (path, mtime, cache_dir)
+    if key not in _levels:
+        _levels[key] = build_levels(geo_type, geo_dir, cache_dir)
+    return _load_geometry(_levels[key][zoom_level(zoom)])
+
+
+def _decode_arcs(topology):
+    """Returns the arcs of a TopoJSON topology as lists of [lon, lat]."""
+    transform = topology.get("transform")
+    arcs = []
+    for arc in topology["arcs"]:
+        points = np.array(arc, dtype=float)[:, :2]
+        if transform is not None:
+            # Quantized arcs are delta-encoded integers
+            points = np.cumsum(points, axis=0) * transform["scale"] + transform["translate"]
+        arcs.append(points.tolist())
+    return arcs
+
+
+def _ring(arcs, indexes):
+    points = []
+    for i in indexes:
+        # A negative index is the one's complement of a reversed arc
+        arc = arcs[i] if i >= 0 else arcs[~i][::-1]
+        points.extend(arc if not points else arc[1:])
+    return points
+
+
+def topojson_features(topology, id_property=GEO_ID_PROPERTY):
+    """Converts the polygons of every object of a TopoJSON topology to GeoJSON
+    features, with the id_property of each as its id."""
+    arcs = _decode_arcs(topology)
+    features = []
+    for obj in topology["objects"].values():
+        for geom in obj.get("geometries", [obj]):
+            if geom.get("type") == "Polygon":
+                polygons = [geom["arcs"]]
+            elif geom.get("type") == "MultiPolygon":
+                polygons = geom["arcs"]
+            else:
+                continue
+            properties = geom.get("properties") or {}
+            features.append({
+                "type": "Feature",
+                "id": str(properties.get(id_property, geom.get("id"))),
+                "properties": properties,
+                "geometry": {
+                    "type": "MultiPolygon",
+                    "coordinates": [[_ring(arcs, ring) for ring in polygon] for polygon in polygons],
+                },
+            })
+    return features
+
+
+def download(geo_types=GEO_SOURCES, geo_dir=GEO_DIR, base_url=GEO_SOURCE_URL, timeout=60):
+    """Fetches the boundary file of each geography type into geo_dir as
+    GeoJSON. Returns {geo_type: path}."""
+    # Only needed here, the apps never download
+    import requests
+
+    os.makedirs(geo_dir, exist_ok=True)
+    paths = {}
+    for geo_type in geo_types:
+        resp = requests.get(f"{base_url.rstrip('/')}/{GEO_SOURCES[geo_type]}", timeout=timeout)
+        resp.raise_for_status()
+        data = resp.json()
+        if data.get("type") == "Topology":
+            data = {"type": "FeatureCollection", "features": topojson_features(data)}
+        paths[geo_type] = source_path(geo_type, geo_dir)
+        atomic_write_json(paths[geo_type], data)
+    return paths
+
+
+def _point_count(geojson):
+    return sum(
+        len(ring)
+        for feature in geojson["features"]
+        for polygon in feature["geometry"]["coordinates"]
+        for ring in polygon
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Precompute simplified boundaries.")
+    parser.add_argument("geo_types", nargs="*")
+    parser.add_argument("--geo-dir", default=GEO_DIR)
+    parser.add_argument("--cache-dir", default=GEO_CACHE_DIR)
+    parser.add_argument("--download", action="store_true",
+                        help=f"fetch the boundary files first, from {GEO_SOURCE_URL}")
+    args = parser.parse_args()
+
+    if args.download:
+        for geo_type, path in download(args.geo_types or GEO_SOURCES, args.geo_dir).items():
+            print(f"{geo_type}: {path}")
+    geo_types = args.geo_types or available_geo_types(args.geo_dir)
+    if not geo_types:
+        print(f"No boundary files in {args.geo_dir}")
+    for geo_type in geo_types:
+        paths = build_levels(geo_type, args.geo_dir, args.cache_dir)
+        if paths is None:
+            print(f"{geo_type}: no boundary file")
+            continue
+        for level, path in sorted(paths.items()):
+            geojson = _load_geometry(path)[0]
+            print(
+                f"{geo_type} z{level}: {_point_count(geojson)} points, "
+                f"{os.path.getsize(path) / 1024:.0f} KiB"
+            )
@@ -0,0 +1,30 @@
+# Hot swapping of data that is rebuilt when a new dataset version is published.
+# Workers check the version at most every check_interval seconds, from inside
+# a request, so a refresh needs no restart and no extra thread.
+import time
+from threading import Lock
+
+
+class HotSwap:
+    """Holds the value built by load() and rebuilds it when version() changes."""
+
+    def __init__(self, load, version, check_interval=5.0):
+        self._load = load
+        self._version = version
+        self.check_interval = check_interval
+        self._lock = Lock()
+        self.version = version()
+        self.value = load()
+        self._checked = time.monotonic()
+
+    def get(self):
+        """Returns the value for the newest published version."""
+        if time.monotonic() - self._checked >= self.check_interval:
+            with self._lock:
+                if time.monotonic() - self._checked >= self.check_interval:
+                    self._checked = time.monotonic()
+                    version = self._version()
+                    if version != self.version:
+                        self.value = self._load()
+                        self.version = version
+        return self.value
@@ -0,0 +1,216 @@
+# Local catalog of World Bank indicators and the app's indicator config.
+# The full indicator list (tens of thousands of rows) is downloaded once into
+# cache/wb/indicator_catalog.json and searched through an in-memory inverted
+# token index, so finding an indicator ID takes milliseconds and no network.
+#
+#     python indicator_catalog.py --refresh
+#     python indicator_catalog.py "pm2.5 exposure"
+#     python indicator_catalog.py --add EN.ATM.PM25.MC.M3
+#
+# The indicators shown by api_application.py are listed in indicators.json
+# (WB_INDICATORS_CONFIG): an id, optionally a name (looked up in the catalog
+# when missing) and a short label for the colour bar.
+import argparse
+import difflib
+import json
+import os
+import re
+from bisect import bisect_left
+
+from wb_fetch import WB_API_URL, fetch_pages, make_session
+
+CATALOG_PATH = os.path.join(
+    os.environ.get("WB_SNAPSHOT_DIR", "cache/wb"), "indicator_catalog.json"
+)
+CONFIG_PATH = os.environ.get("WB_INDICATORS_CONFIG", "indicators.json")
+
+# Words, numbers and dotted codes such as "pm2.5" or "en.atm"
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def download_catalog(path=CATALOG_PATH, base_url=WB_API_URL, session=None):
+    """Downloads the indicator list and writes it to path.
+
+    The request is conditional, so an unchanged list costs one 304.
+    """
+    previous = _read_catalog(path)
+    validators = previous.get("validators") if previous else None
+    rows, validators = fetch_pages(
+        session or make_session(1),
+        f"{base_url.rstrip('/')}/indicator",
+        {"per_page": 20000},
+        validators,
+        timeout=120,
+    )
+    if rows is None:
+        return previous
+    catalog = {
+        "validators": validators,
+        "indicators": [
+            {
+                "id": r["id"],
+                "name": r["name"],
+                "source": (r.get("source") or {}).get("value", ""),
+            }
+            for r in rows
+        ],
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(catalog, f)
+    os.replace(tmp_path, path)
+    return catalog
+
+
+def _read_catalog(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+class IndicatorCatalog:
+    """Indicator rows with an inverted index from token to row positions."""
+
+    def __init__(self, indicators):
+        self.indicators = indicators
+        self.by_id = {row["id"]: row for row in indicators}
+        self.index = {}
+        for pos, row in enumerate(indicators):
+            tokens = tokenize(row["name"]) + tokenize(row["id"]) + tokenize(
+                row["id"].replace(".", " ")
+            )
+            for token in set(tokens):
+                self.index.setdefault(token, []).append(pos)
+        self.vocabulary = sorted(self.index)
+
+    def get(self, indicator_id):
+        return self.by_id.get(indicator_id)
+
+    def find(self, name):
+        """Returns the rows whose name is exactly name."""
+        return [row for row in self.search(name, limit=None) if row["name"] == name]
+
+    def _expand(self, token):
+        """Index tokens a query token stands for: itself, the tokens it is a
+        prefix of, or the closest spellings if neither exists."""
+        start = bisect_left(self.vocabulary, token)
+        matches = []
+        for word in self.vocabulary[start:]:
+            if not word.startswith(token):
+                break
+            matches.append(word)
+        if matches:
+            return matches
+        # Typos: only compare with words of the same first letter and a
+        # similar length
+        start = bisect_left(self.vocabulary, token[0])
+        stop = bisect_left(self.vocabulary, chr(ord(token[0]) + 1))
+        candidates = [
+            word for word in self.vocabulary[start:stop]
+            if abs(len(word) - len(token)) <= 2
+        ]
+        return difflib.get_close_matches(token, candidates, n=3, cutoff=0.8)
+
+    def search(self, query, limit=10):
+        """Returns the rows matching the most query tokens, best first.
+
+        Exact token matches score higher than prefix or fuzzy ones, and
+        shorter names win ties.
+        """
+        scores = {}
+        for token in set(tokenize(query)):
+            weights = {}
+            for word in self._expand(token):
+                weight = 1.0 if word == token else 0.5
+                for pos in self.index[word]:
+                    weights[pos] = max(weights.get(pos, 0), weight)
+            for pos, weight in weights.items():
+                scores[pos] = scores.get(pos, 0) + weight
+        ranked = sorted(
+            scores, key=lambda pos: (-scores[pos], len(self.indicators[pos]["name"]))
+        )
+        return [self.indicators[pos] for pos in ranked[:limit]]
+
+
+_catalogs = {}
+
+
+def load_catalog(path=CATALOG_PATH, download=True):
+    """Returns the IndicatorCatalog for the local snapshot, downloading it
+    first if there is none. Cached per process until the file changes."""
+    if not os.path.exists(path):
+        if not download:
+            return None
+        download_catalog(path)
+    mtime = os.stat(path).st_mtime_ns
+    if _catalogs.get(path, (None,))[0] != mtime:
+        _catalogs[path] = (mtime, IndicatorCatalog(_read_catalog(path)["indicators"]))
+    return _catalogs[path][1]
+
+
+def read_config(path=CONFIG_PATH):
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_indicators(path=CONFIG_PATH, catalog_path=CATALOG_PATH):
+    """Returns ({id: name}, {name: label}) for the configured indicators.
+
+    Entries without a name are named from the local catalog, if there is one.
+    """
+    config = read_config(path)
+    catalog = None
+    if any("name" not in entry for entry in config):
+        catalog = load_catalog(catalog_path, download=False)
+    indicators, labels = {}, {}
+    for entry in config:
+        name = entry.get("name")
+        if name is None:
+            row = catalog.get(entry["id"]) if catalog else None
+            name = row["name"] if row else entry["id"]
+        indicators[entry["id"]] = name
+        if entry.get("label"):
+            labels[name] = entry["label"]
+    return indicators, labels
+
+
+def add_indicator(indicator_id, path=CONFIG_PATH, catalog_path=CATALOG_PATH):
+    """Appends a catalog indicator to the config file."""
+    row = load_catalog(catalog_path).get(indicator_id)
+    if row is None:
+        raise KeyError(f"{indicator_id} is not in the indicator catalog")
+    config = read_config(path)
+    if all(entry["id"] != indicator_id for entry in config):
+        config.append({"id": row["id"], "name": row["name"]})
+        with open(path, "w") as f:
+            json.dump(config, f, indent=1)
+            f.write("\n")
+    return row
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Search the World Bank indicators.")
+    parser.add_argument("query", nargs="?")
+    parser.add_argument("--refresh", action="store_true",
+                        help="download the indicator list again")
+    parser.add_argument("--add", metavar="ID", help="add an indicator to the config")
+    parser.add_argument("--limit", type=int, default=10)
+    parser.add_argument("--base-url", default=WB_API_URL)
+    args = parser.parse_args()
+
+    if args.refresh or not os.path.exists(CATALOG_PATH):
+        catalog = download_catalog(base_url=args.base_url)
+        print(f"{len(catalog['indicators'])} indicators in {CATALOG_PATH}")
+    if args.add:
+        row = add_indicator(args.add)
+        print(f"Added {row['id']}: {row['name']} to {CONFIG_PATH}")
+    if args.query:
+        for row in load_catalog().search(args.query, args.limit):
+            print(f"{row['id']:<28}{row['name']}")
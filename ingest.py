@@ -0,0 +1,379 @@
+# Streaming ingestion of air quality extracts into a partitioned columnar store.
+# The CSV is read in fixed size chunks; every chunk is parsed with the same
+# typed layout as data_loader and split by pollutant (Name) and year of
+# Start_Date into staging files. The last row for every Unique ID is found
+# over all staging files from their key columns alone, so a reading that
+# appears under two pollutants or years is stored once, then each
+# pollutant/year partition is compacted on its own. Peak memory depends on
+# the chunk size, the largest partition and 16 bytes per input row for the
+# keys, not on the size of the rows.
+#
+#     python ingest.py "Input/Air_Quality.csv" --store Input/store
+#
+# New readings are applied with --incremental: only the partitions that the
+# delta touches are rewritten, everything else is shared with the previous
+# version. Publishing a version deletes all but the last KEEP_VERSIONS
+# versions and the partitions only they used; the older ones stay readable
+# for workers that have not switched yet.
+#
+# Layout of the store:
+#     partitions/<name>/<year>/<part id>/   one .npy file per column
+#     versions/<version>.json               partitions making up a version
+#     CURRENT.json                          the version readers should use
+import argparse
+import json
+import os
+import re
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from data_loader import (
+    CATEGORICAL_COLUMNS,
+    add_period_columns,
+    atomic_write_json,
+    parse_air_quality,
+    read_columnar_cache,
+    write_columnar_cache,
+)
+
+STORE_DIR = os.environ.get("AIR_QUALITY_STORE", "Input/store")
+CHUNKSIZE = 200_000
+KEY_COLUMN = "Unique ID"
+# Versions kept on disk, the current one included
+KEEP_VERSIONS = int(os.environ.get("AIR_QUALITY_KEEP_VERSIONS", 3))
+# Position of every staged row in the input, next to the part's columns
+ROWS_FILE = "rows.npy"
+
+
+def _slug(name):
+    return re.sub(r"[^A-Za-z0-9]+", "_", str(name)).strip("_")
+
+
+def _read_json(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def iter_chunks(csv_path, chunksize=CHUNKSIZE):
+    """Yields typed frames of at most chunksize rows from the CSV."""
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        yield parse_air_quality(chunk)
+
+
+def split_by_partition(df):
+    """Yields ((name, year), rows) for every pollutant/year in df."""
+    years = df["Start_Date"].dt.year
+    for (name, year), part in df.groupby([df["Name"], years], observed=True):
+        yield (str(name), int(year)), part.reset_index(drop=True)
+
+
+def write_part(df, path):
+    """Writes one immutable columnar part and its column specs."""
+    columns = write_columnar_cache(df, path)
+    atomic_write_json(os.path.join(path, "columns.json"), columns)
+    return path
+
+
+def read_part(path, mmap=True):
+    """Reads a part written by write_part, memory-mapping its columns."""
+    with open(os.path.join(path, "columns.json")) as f:
+        columns = json.load(f)
+    return read_columnar_cache(path, columns, mmap=mmap)
+
+
+def read_column(path, name):
+    """Memory-maps a single column of a part."""
+    with open(os.path.join(path, "columns.json")) as f:
+        columns = json.load(f)
+    spec = next(c for c in columns if c["name"] == name)
+    return np.load(os.path.join(path, spec["file"]), mmap_mode="r")
+
+
+def concat_parts(frames):
+    """Concatenates typed frames, re-unifying their categories."""
+    df = pd.concat(frames, ignore_index=True)
+    for col in CATEGORICAL_COLUMNS:
+        if col in df and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("string").astype("category")
+    return df
+
+
+def dedupe(df, key=KEY_COLUMN):
+    """Keeps the last row for every key, in original row order."""
+    ids = df[key].to_numpy()
+    _, last = np.unique(ids[::-1], return_index=True)
+    return df.take(np.sort(len(ids) - 1 - last)).reset_index(drop=True)
+
+
+def write_partition(df, store_dir, name, year, key=KEY_COLUMN):
+    """Writes a partition and returns its manifest entry."""
+    path = write_part(df, new_partition_path(store_dir, name, year))
+    ids = df[key].to_numpy()
+    return {
+        "name": name,
+        "year": year,
+        "path": path,
+        "rows": len(df),
+        "min_id": int(ids.min()) if len(ids) else None,
+        "max_id": int(ids.max()) if len(ids) else None,
+    }
+
+
+def compact(part_paths, store_dir, name, year, key=KEY_COLUMN, keep=None):
+    """Merges parts (oldest first) into one deduplicated partition.
+
+    keep maps a part path to a mask of its rows to use, e.g. from
+    latest_rows. Returns None when no row is left.
+    """
+    keep = keep or {}
+    frames = []
+    for path in part_paths:
+        df = read_part(path)
+        if path in keep:
+            df = df[keep[path]]
+        frames.append(df)
+    df = dedupe(concat_parts(frames), key)
+    if not len(df):
+        return None
+    return write_partition(df, store_dir, name, year, key)
+
+
+def new_partition_path(store_dir, name, year):
+    return os.path.join(
+        store_dir, "partitions", _slug(name), str(year), uuid.uuid4().hex[:12]
+    )
+
+
+def stage_chunks(csv_path, store_dir, chunksize=CHUNKSIZE):
+    """Splits the CSV into per-partition staging parts.
+
+    Returns the staging directory and {(name, year): [part paths]}.
+    """
+    staging = os.path.join(store_dir, "staging", uuid.uuid4().hex[:12])
+    staged = {}
+    offset = 0
+    for chunk_no, chunk in enumerate(iter_chunks(csv_path, chunksize)):
+        chunk["_row"] = np.arange(offset, offset + len(chunk))
+        offset += len(chunk)
+        for key, part in split_by_partition(chunk):
+            path = os.path.join(
+                staging, _slug(key[0]), str(key[1]), f"chunk-{chunk_no:05d}"
+            )
+            write_part(part.drop(columns="_row"), path)
+            np.save(os.path.join(path, ROWS_FILE), part["_row"].to_numpy())
+            staged.setdefault(key, []).append(path)
+    return staging, staged
+
+
+def latest_rows(staged, key=KEY_COLUMN):
+    """Returns {part path: mask} of the staged rows that are the last row of
+    their key in the input, whichever partition the other rows went to."""
+    paths = [p for paths in staged.values() for p in paths]
+    if not paths:
+        return {}
+    ids = [read_column(p, key) for p in paths]
+    rows = np.concatenate([np.load(os.path.join(p, ROWS_FILE)) for p in paths])
+    all_ids = np.concatenate(ids)
+    order = np.lexsort((rows, all_ids))
+    sorted_ids = all_ids[order]
+    last = np.r_[sorted_ids[1:] != sorted_ids[:-1], True]
+    keep = np.empty(len(order), dtype=bool)
+    keep[order] = last
+    bounds = np.cumsum([len(i) for i in ids])[:-1]
+    return dict(zip(paths, np.split(keep, bounds)))
+
+
+def store_version(store_dir=STORE_DIR):
+    """Returns the current version number, or None if nothing is published."""
+    current = _read_json(os.path.join(store_dir, "CURRENT.json"))
+    return None if current is None else current["version"]
+
+
+def current_version(store_dir=STORE_DIR):
+    """Returns the manifest of the current store version, or None."""
+    version = store_version(store_dir)
+    if version is None:
+        return None
+    return _read_json(os.path.join(store_dir, "versions", f"{version}.json"))
+
+
+def publish(store_dir, partitions, keep_versions=KEEP_VERSIONS):
+    """Writes a new version manifest, makes it current and prunes old versions."""
+    previous = current_version(store_dir)
+    version = 1 if previous is None else previous["version"] + 1
+    manifest = {
+        "version": version,
+        "partitions": sorted(partitions, key=lambda p: (p["name"], p["year"])),
+    }
+    os.makedirs(os.path.join(store_dir, "versions"), exist_ok=True)
+    atomic_write_json(os.path.join(store_dir, "versions", f"{version}.json"), manifest)
+    atomic_write_json(os.path.join(store_dir, "CURRENT.json"), {"version": version})
+    prune_versions(store_dir, keep_versions)
+    return manifest
+
+
+def prune_versions(store_dir=STORE_DIR, keep_versions=KEEP_VERSIONS):
+    """Deletes all but the newest keep_versions versions, and the partitions
+    that no kept version uses. Returns the deleted version numbers."""
+    versions_dir = os.path.join(store_dir, "versions")
+    numbers = sorted(
+        int(name[:-5]) for name in os.listdir(versions_dir)
+        if name.endswith(".json") and name[:-5].isdigit()
+    )
+    keep = max(keep_versions, 1)
+    kept, dropped = numbers[-keep:], numbers[:-keep]
+    if not dropped:
+        return []
+
+    def paths(number):
+        manifest = _read_json(os.path.join(versions_dir, f"{number}.json"), {})
+        return {os.path.normpath(p["path"]) for p in manifest.get("partitions", [])}
+
+    used = set().union(*(paths(n) for n in kept))
+    unused = set().union(*(paths(n) for n in dropped)) - used
+    # Manifests first, so no version ever points at a deleted partition
+    for number in dropped:
+        os.remove(os.path.join(versions_dir, f"{number}.json"))
+    for path in unused:
+        shutil.rmtree(path, ignore_errors=True)
+    return dropped
+
+
+def ingest_csv(
+    csv_path, store_dir=STORE_DIR, chunksize=CHUNKSIZE, keep_versions=KEEP_VERSIONS
+):
+    """Ingests a full extract, replacing the store contents with a new version."""
+    staging, staged = stage_chunks(csv_path, store_dir, chunksize)
+    partitions = []
+    try:
+        keep = latest_rows(staged)
+        for (name, year), paths in staged.items():
+            entry = compact(paths, store_dir, name, year, keep=keep)
+            if entry is not None:
+                partitions.append(entry)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return publish(store_dir, partitions, keep_versions)
+
+
+def apply_delta(
+    csv_path, store_dir=STORE_DIR, chunksize=CHUNKSIZE, key=KEY_COLUMN,
+    keep_versions=KEEP_VERSIONS,
+):
+    """Applies new or changed rows to the current version, keyed on Unique ID.
+
+    The delta's rows replace the stored rows with the same key in every
+    partition, so a row that moved to another partition (e.g. a corrected
+    Start_Date) is dropped from its old one even when the delta also writes
+    to it. Partitions that receive rows are merged with them; partitions
+    holding none of the keys are reused as they are.
+    """
+    previous = current_version(store_dir)
+    if previous is None:
+        return ingest_csv(csv_path, store_dir, chunksize, keep_versions)
+
+    staging, staged = stage_chunks(csv_path, store_dir, chunksize)
+    try:
+        keep = latest_rows(staged, key)
+        delta_ids = np.unique(
+            np.concatenate(
+                [read_column(p, key) for paths in staged.values() for p in paths]
+                or [np.empty(0, dtype=np.int64)]
+            )
+        )
+        existing = {(p["name"], p["year"]): p for p in previous["partitions"]}
+
+        partitions = []
+        for (name, year), entry in existing.items():
+            # Only look at the key column of partitions whose id range overlaps
+            if not len(delta_ids) or (
+                entry.get("min_id") is not None
+                and (entry["max_id"] < delta_ids[0] or entry["min_id"] > delta_ids[-1])
+            ):
+                replaced = None
+            else:
+                replaced = np.isin(read_column(entry["path"], key), delta_ids)
+                if not replaced.any():
+                    replaced = None
+            if (name, year) in staged:
+                # merged with the delta below, without the replaced rows
+                if replaced is not None:
+                    keep[entry["path"]] = ~replaced
+                continue
+            if replaced is None:
+                partitions.append(entry)
+                continue
+            df = read_part(entry["path"])[~replaced].reset_index(drop=True)
+            if len(df):
+                partitions.append(write_partition(df, store_dir, name, year))
+
+        for (name, year), paths in staged.items():
+            old = [existing[(name, year)]["path"]] if (name, year) in existing else []
+            entry = compact(old + paths, store_dir, name, year, keep=keep)
+            if entry is not None:
+                partitions.append(entry)
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    return publish(store_dir, partitions, keep_versions)
+
+
+def store_names(store_dir=STORE_DIR, manifest=None):
+    """Returns the pollutants of the current version, from its manifest alone."""
+    manifest = manifest or current_version(store_dir)
+    if manifest is None:
+        return []
+    return sorted({p["name"] for p in manifest["partitions"]})
+
+
+def read_store(store_dir=STORE_DIR, names=None, years=None, manifest=None):
+    """Returns the rows of the current version, optionally only some
+    pollutants and years. Only the partitions holding them are read, and
+    their columns are memory-mapped where possible.
+    """
+    manifest = manifest or current_version(store_dir)
+    if manifest is None:
+        return None
+    frames = [
+        read_part(p["path"])
+        for p in manifest["partitions"]
+        if (names is None or p["name"] in names)
+        and (years is None or p["year"] in years)
+    ]
+    if not frames:
+        return None
+    df = concat_parts(frames)
+    # Partitions written before the period columns existed
+    if "Period Kind" not in df:
+        df = add_period_columns(df)
+    df.attrs["version"] = f"store-{manifest['version']}"
+    return df
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Ingest an air quality CSV.")
+    parser.add_argument("csv_path")
+    parser.add_argument("--store", default=STORE_DIR)
+    parser.add_argument("--chunksize", type=int, default=CHUNKSIZE)
+    parser.add_argument("--incremental", action="store_true",
+                        help="apply new or changed rows to the current version")
+    parser.add_argument("--keep-versions", type=int, default=KEEP_VERSIONS,
+                        help="versions to keep on disk, the new one included")
+    args = parser.parse_args()
+
+    if args.incremental:
+        manifest = apply_delta(
+            args.csv_path, args.store, args.chunksize, keep_versions=args.keep_versions
+        )
+    else:
+        manifest = ingest_csv(args.csv_path, args.store, args.chunksize, args.keep_versions)
+    rows = sum(p["rows"] for p in manifest["partitions"])
+    print(
+        f"Published version {manifest['version']}: "
+        f"{rows} rows in {len(manifest['partitions'])} partitions"
+    )
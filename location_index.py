@@ -0,0 +1,79 @@
+# Per-location index over the air quality data.
+# The frame is sorted once by location and date so that every location's
+# rows sit in one contiguous block. A dropdown selection is then assembled
+# by concatenating blocks instead of scanning the whole frame with isin().
+import numpy as np
+import pandas as pd
+
+
+class LocationIndex:
+    """Maps each location to a sorted block of (Start_Date, Data Value) rows."""
+
+    def __init__(
+        self, df, key="Geo Place Name", date_col="Start_Date", columns=("Data Value",)
+    ):
+        self.key = key
+        self.date_col = date_col
+        frame = df[[key, date_col, *columns]].sort_values(
+            [key, date_col], kind="stable"
+        )
+        self.frame = frame.reset_index(drop=True)
+
+        # Raw arrays for range lookups and downsampling
+        self.x = self.frame[date_col].to_numpy(dtype="datetime64[ns]")
+        self.y = self.frame[columns[0]].to_numpy(dtype=float)
+
+        # Block boundaries, found with one pass over the sorted key column
+        keys = self.frame[key].astype(str).to_numpy()
+        starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else []
+        stops = np.r_[starts[1:], len(keys)] if len(keys) else []
+        self.blocks = {
+            keys[start]: (start, stop) for start, stop in zip(starts, stops)
+        }
+
+    def __contains__(self, name):
+        return name in self.blocks
+
+    def locations(self):
+        """Returns every indexed location in sorted order."""
+        return sorted(self.blocks)
+
+    def positions(self, names, start=None, end=None, max_points=None, downsample=None):
+        """Returns the row positions for the given locations, in selection order.
+
+        start/end limit each block to a date window (found by binary search,
+        blocks are sorted by date). With max_points and a downsample function
+        from downsample.py, blocks longer than max_points are thinned out.
+        """
+        start = None if start is None else pd.Timestamp(start).to_datetime64()
+        end = None if end is None else pd.Timestamp(end).to_datetime64()
+
+        ranges = []
+        for name in names:
+            if name not in self.blocks:
+                continue
+            lo, hi = self.blocks[name]
+            if start is not None:
+                lo += np.searchsorted(self.x[lo:hi], start, "left")
+            if end is not None:
+                hi = lo + np.searchsorted(self.x[lo:hi], end, "right")
+            if max_points and downsample is not None and hi - lo > max_points:
+                x = self.x[lo:hi].astype("int64")
+                ranges.append(lo + downsample(x, self.y[lo:hi], max_points))
+            else:
+                ranges.append(np.arange(lo, hi))
+        if not ranges:
+            return np.empty(0, dtype=np.intp)
+        return np.concatenate(ranges)
+
+    def select(self, names, **kwargs):
+        """Returns the rows for the given locations as one frame.
+
+        Takes the same keyword arguments as positions().
+        """
+        return self.frame.take(self.positions(names, **kwargs))
+
+    def block(self, name):
+        """Returns the rows for a single location."""
+        start, stop = self.blocks[name]
+        return self.frame.iloc[start:stop]
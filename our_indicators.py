@@ -1,6 +1,5 @@
-import pandas as pd
-from pandas_datareader import wb
+from indicator_catalog import load_catalog
 
-df = wb.get_indicators()[['id','name']]
-df = df[df.name == 'Individuals using the Internet (% of population)']
-print(df)
\ No newline at end of file
+# Looked up in the local catalog snapshot, downloaded on first use
+catalog = load_catalog()
+print(catalog.find('Individuals using the Internet (% of population)'))
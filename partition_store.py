@@ -0,0 +1,122 @@
+# Air quality data pre-split by pollutant, measure, geography type and period.
+# The series in the data set are not comparable with each other (ppb, mcg/m3,
+# rates per 100,000 adults, ...), so the app always looks at one
+# (Name, Measure, Geo Type Name) combination at a time. Annual, summer, winter
+# and multi-year averages of the same measure are separate series too, so the
+# Season and Period Kind columns from data_loader are part of the key.
+# Splitting once at load time turns every filter combination into a
+# dictionary lookup.
+import numpy as np
+import pandas as pd
+
+from location_index import LocationIndex
+
+PARTITION_COLUMNS = ["Name", "Measure", "Geo Type Name", "Season", "Period Kind"]
+
+# Order of the geography types, from the finest to the whole city
+GEO_TYPE_ORDER = ["UHF34", "UHF42", "CD", "Borough", "Citywide"]
+
+# Order of the periods in the period dropdown
+SEASON_ORDER = ["Annual", "Summer", "Winter"]
+PERIOD_KIND_ORDER = ["annual", "seasonal", "multi-year"]
+
+# (Season, Period Kind) of readings whose Time Period data_loader could not
+# parse; they are kept as their own period, drawn at their Start_Date
+OTHER_PERIOD = {"Season": "Other", "Period Kind": "other"}
+
+
+class PartitionStore:
+    """One LocationIndex per (Name, Measure, Geo Type Name, Season, Period Kind)
+    combination, each sorted by the start of its periods."""
+
+    def __init__(self, df, partition_columns=PARTITION_COLUMNS):
+        self.partitions = {}
+        self.units = {}
+        self.years = {}
+        parts = {}
+        groups = df.groupby(partition_columns, observed=True, sort=True, dropna=False)
+        for key, part in groups:
+            if any(pd.isna(k) for k in key):
+                key, part = _other_period(key, part, partition_columns)
+            key = tuple(str(k) for k in key)
+            # a missing Season and a missing Period Kind end up in one bucket
+            parts[key] = pd.concat([parts[key], part]) if key in parts else part
+        for key, part in parts.items():
+            self.partitions[key] = LocationIndex(
+                part,
+                date_col="Period Start",
+                columns=("Data Value", "Geo Join ID", "Period Year"),
+            )
+            if "Measure Info" in part:
+                self.units[key] = str(part["Measure Info"].iloc[0])
+            self.years[key] = sorted(int(y) for y in part["Period Year"].unique())
+
+    @classmethod
+    def from_frames(cls, frames, partition_columns=PARTITION_COLUMNS):
+        """Builds one store from frames that each hold every row of their
+        pollutants, e.g. read one pollutant at a time, so only one frame is
+        in memory at once."""
+        store = cls(pd.DataFrame(columns=partition_columns), partition_columns)
+        for df in frames:
+            part = cls(df, partition_columns)
+            store.partitions.update(part.partitions)
+            store.units.update(part.units)
+            store.years.update(part.years)
+        return store
+
+    def get(self, name, measure, geo_type, season, kind):
+        """Returns the LocationIndex for a filter combination, or None."""
+        return self.partitions.get((name, measure, geo_type, season, kind))
+
+    def names(self):
+        """Returns every pollutant / indicator name."""
+        return sorted({key[0] for key in self.partitions})
+
+    def measures(self, name):
+        """Returns the measures available for a name."""
+        return sorted({key[1] for key in self.partitions if key[0] == name})
+
+    def geo_types(self, name, measure):
+        """Returns the geography types available for a name and measure."""
+        geo_types = {key[2] for key in self.partitions if key[:2] == (name, measure)}
+        return sorted(geo_types, key=_geo_type_rank)
+
+    def periods(self, name, measure, geo_type):
+        """Returns the (season, period kind) pairs available for a name,
+        measure and geography type."""
+        periods = {
+            key[3:] for key in self.partitions if key[:3] == (name, measure, geo_type)
+        }
+        return sorted(periods, key=_period_rank)
+
+
+def _other_period(key, part, partition_columns):
+    """Puts a group with a missing Season or Period Kind in OTHER_PERIOD."""
+    key = tuple(
+        OTHER_PERIOD.get(col, k) if pd.isna(k) else k
+        for col, k in zip(partition_columns, key)
+    )
+    if "Start_Date" in part:
+        start = part["Start_Date"]
+        part = part.assign(**{
+            "Period Start": part["Period Start"].fillna(start),
+            "Period Year": np.where(
+                part["Period Year"] < 0, start.dt.year, part["Period Year"]
+            ).astype(part["Period Year"].dtype),
+        })
+    return key, part
+
+
+def _geo_type_rank(geo_type):
+    if geo_type in GEO_TYPE_ORDER:
+        return GEO_TYPE_ORDER.index(geo_type), geo_type
+    return len(GEO_TYPE_ORDER), geo_type
+
+
+def _period_rank(period):
+    season, kind = period
+    return (
+        SEASON_ORDER.index(season) if season in SEASON_ORDER else len(SEASON_ORDER),
+        PERIOD_KIND_ORDER.index(kind) if kind in PERIOD_KIND_ORDER else len(PERIOD_KIND_ORDER),
+        period,
+    )
@@ -1,78 +1,615 @@
 # Importing packages
-import pandas as pd
-import plotly.express as px # Look into Plotly Graph Objects (More customizable)
-from dash import Dash, dcc, html, Input, Output
+import os
 
-# Read in the data
-pollution_df = pd.read_csv("Input/Air_Quality.csv")
+import numpy as np
+from dash import Dash, dcc, html, Input, Output, State, Patch, ctx, no_update
+from downsample import METHODS
+from data_loader import load_air_quality
+from geo_shapes import GEO_DIR, geometry
+from hot_swap import HotSwap
+from ingest import current_version, read_store, store_names, store_version
+from partition_store import PartitionStore
+from callback_metrics import instrument, phase
+from figure_cache import FigureCache, make_key
+from figure_encoding import (
+    COMPRESS_RESPONSES, ENCODING, compress_responses, encode_array, plotly_scripts
+)
+from figure_templates import FigureTemplate
+from static_figures import LOADER_SCRIPT, StaticViews
+
+def load_data():
+    """Reads the newest data set.
+    
+    Uses the columnar store written by ingest.py when there is one, otherwise
+    the typed cache of the CSV. Returns the data set version and a
+    PartitionStore: one frame per (pollutant, measure, geography type), each
+    split into sorted per-location blocks, so callbacks never rescan the
+    whole table.
+    """
+    manifest = current_version()
+    if manifest is None:
+        pollution_df = load_air_quality("Input/Air_Quality.csv")
+        return pollution_df.attrs["version"], PartitionStore(pollution_df)
+    # One pollutant's partitions at a time, never the whole store at once
+    partition_store = PartitionStore.from_frames(
+        read_store(names=[name], manifest=manifest) for name in store_names(manifest=manifest)
+    )
+    return f"store-{manifest['version']}", partition_store
+
+# Read in the data. Running workers switch to a newly ingested version on
+# their next callback, without a restart.
+dataset = HotSwap(load_data, store_version)
+
+def period_value(season, kind):
+    """Dropdown value for a (season, period kind) pair."""
+    return f"{season}|{kind}"
+
+def period_label(season, kind):
+    if kind == "multi-year":
+        return f"{season} (multi-year average)"
+    if season == "Annual":
+        return "Annual average"
+    return season
+
+def period_options(periods):
+    return [
+        {"label": period_label(*period), "value": period_value(*period)}
+        for period in periods
+    ]
+
+def default_filters(partition_store):
+    """Default filters: NO2, then the first measure, geography type, period
+    and all of its locations."""
+    name = "Nitrogen dioxide (NO2)"
+    if name not in partition_store.names():
+        name = partition_store.names()[0]
+    measure = partition_store.measures(name)[0]
+    geo_type = partition_store.geo_types(name, measure)[0]
+    periods = partition_store.periods(name, measure, geo_type)
+    locations = partition_store.get(name, measure, geo_type, *periods[0]).locations()
+    return name, measure, geo_type, periods, locations
+
+# Built figures are shared between workers through the on-disk cache
+figure_cache = FigureCache()
+
+# Above this many points the chart is drawn with WebGL (Scattergl) instead of SVG
+WEBGL_THRESHOLD = 1000
+# Each trace is downsampled to about one point per pixel of the graph's width
+DEFAULT_GRAPH_WIDTH = 1200
+DOWNSAMPLE = METHODS[os.environ.get("DOWNSAMPLE", "lttb")]
 
 # Use external stylesheet
 stylesheet = ['https://codepen.io/chriddyp/pen/bWLegP.css']
-app = Dash(__name__, external_stylesheets=stylesheet)
+app = Dash(
+    __name__, external_stylesheets=stylesheet, external_scripts=plotly_scripts()
+)
+if COMPRESS_RESPONSES:
+    compress_responses(app.server)
 
-app.layout = html.Div(
-    [
-        html.Div(
-            html.H1(
-                "Analysis of air pollution data", style={"textAlign": "center"}
+# Latency, payload size and cache hit metrics of every callback, on /metrics
+metrics = instrument(app)
+metrics.watch_cache(figure_cache)
+
+# The landing view is prebuilt per dataset version and served as static JSON
+static_views = StaticViews(
+    app.server,
+    lambda: dataset.get()[0],
+    f"{ENCODING}-{DOWNSAMPLE.__name__}",
+)
+
+def serve_layout():
+    """Builds the layout from the current data, so new pollutants show up on
+    the next page load."""
+    partition_store = dataset.get()[1]
+    name, measure, geo_type, periods, locations = default_filters(partition_store)
+    years = partition_store.years[(name, measure, geo_type, *periods[0])]
+    return html.Div(
+        [
+            html.Div(
+                html.H1(
+                    "Analysis of air pollution data", style={"textAlign": "center"}
+                ),
+                className="row",
             ),
-            className="row",
-        ),
-        html.Div(dcc.Graph(id="pollution-chart", figure={}), className="row"),
-        html.Div(
-            [
-                html.Div(
-                    dcc.Dropdown(
-                        id="filter-dropdown",
-                        multi=True,
-                        options=[
-                            {"label": x, "value": x}
-                            for x in sorted(pollution_df['Geo Place Name'].unique())
-                        ],
-                        value=[x for x in pollution_df['Geo Place Name'].unique()],
-                    ),
-                    className="three columns",
+            html.Div(dcc.Graph(id="pollution-chart", figure={}), className="row"),
+            dcc.Store(id="graph-width"),
+            dcc.Store(id="chart-zoom"),
+            html.Div(dcc.Graph(id="pollution-map", figure={}), className="row"),
+            html.Div(
+                dcc.Slider(
+                    id="map-year-slider",
+                    step=None,
+                    min=years[0],
+                    max=years[-1],
+                    marks={y: str(y) for y in years},
+                    value=years[-1],
                 ),
-                html.Div(
-                    html.A(
-                        id="my-link",
-                        children="Click here to view the source data",
-                        href="https://www.kaggle.com/datasets/sahirmaharajj/air-pollution-dataset?resource=download",
-                        target="_blank",
+                className="row",
+            ),
+            # Geometry key and zoom of the map the browser currently shows
+            dcc.Store(id="map-geometry"),
+            dcc.Store(id="map-zoom"),
+            # The prebuilt landing view; "render" when the callbacks must
+            # draw the page instead
+            dcc.Store(id="default-view-url", data=static_views.url("pollution")),
+            dcc.Store(id="default-view"),
+            html.Div(
+                [
+                    html.Div(
+                        dcc.Dropdown(
+                            id="name-dropdown",
+                            options=[
+                                {"label": x, "value": x} for x in partition_store.names()
+                            ],
+                            value=name,
+                            clearable=False,
+                        ),
+                        className="four columns",
                     ),
-                    className="two columns",
-                ),
-            ],
-            className="row",
-        ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="measure-dropdown",
+                            options=partition_store.measures(name),
+                            value=measure,
+                            clearable=False,
+                        ),
+                        className="four columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="geo-type-dropdown",
+                            options=partition_store.geo_types(name, measure),
+                            value=geo_type,
+                            clearable=False,
+                        ),
+                        className="four columns",
+                    ),
+                ],
+                className="row",
+            ),
+            html.Div(
+                [
+                    html.Div(
+                        dcc.Dropdown(
+                            id="filter-dropdown",
+                            multi=True,
+                            options=[
+                                {"label": x, "value": x} for x in locations
+                            ],
+                            value=locations,
+                        ),
+                        className="three columns",
+                    ),
+                    html.Div(
+                        dcc.Dropdown(
+                            id="period-dropdown",
+                            options=period_options(periods),
+                            value=period_value(*periods[0]),
+                            clearable=False,
+                        ),
+                        className="three columns",
+                    ),
+                    html.Div(
+                        html.A(
+                            id="my-link",
+                            children="Click here to view the source data",
+                            href="https://www.kaggle.com/datasets/sahirmaharajj/air-pollution-dataset?resource=download",
+                            target="_blank",
+                        ),
+                        className="two columns",
+                    ),
+                ],
+                className="row",
+            ),
+        ]
+    )
+
+app.layout = serve_layout
+
+# Trace and layout skeletons of the line chart, as plotly.express draws it
+LINE_TRACE = {
+    "mode": "lines",
+    "line": {"dash": "solid"},
+    "marker": {"symbol": "circle"},
+    "orientation": "v",
+    "showlegend": True,
+    "xaxis": "x",
+    "yaxis": "y",
+}
+LINE_LAYOUT = {
+    "xaxis": {"anchor": "y", "domain": [0, 1], "title": {"text": "Reading Date"}},
+    "yaxis": {"anchor": "x", "domain": [0, 1], "type": "log"},
+    "legend": {"title": {"text": "Geo Place Name"}, "tracegroupgap": 0},
+}
+LINE_TEMPLATES = {
+    "svg": FigureTemplate(dict(LINE_TRACE, type="scatter"), LINE_LAYOUT),
+    "webgl": FigureTemplate(dict(LINE_TRACE, type="scattergl"), LINE_LAYOUT),
+}
+
+def make_line_chart(
+    partition_store, partition, locations, x_range=None, width=DEFAULT_GRAPH_WIDTH
+):
+    """Builds the line chart for the selected locations of one partition,
+    a (Name, Measure, Geo Type Name, Season, Period Kind) key of
+    partition_store. Readings are drawn at the start of their period.
+    
+    Only the rows inside x_range (a [start, end] pair, None for everything) are
+    used, and each location is downsampled to about width points.
+    """
+    start, end = x_range if x_range else (None, None)
+    location_index = partition_store.get(*partition)
+    years = partition_store.years[partition]
+    span = str(years[0]) if years[0] == years[-1] else f"{years[0]}-{years[-1]}"
+    y_label = f"{partition[1]} ({partition_store.units[partition]})"
+    
+    # One trace per location, straight from the index arrays
+    series = []
+    for name in locations:
+        positions = location_index.positions(
+            [name], start=start, end=end, max_points=width, downsample=DOWNSAMPLE
+        )
+        if len(positions):
+            series.append((name, positions))
+    points = sum(len(positions) for _, positions in series)
+    template = LINE_TEMPLATES["webgl" if points > WEBGL_THRESHOLD else "svg"]
+    colors = template.colorway
+    traces = [
+        {
+            "name": name,
+            "legendgroup": name,
+            "line": {"color": colors[i % len(colors)]},
+            "hovertemplate": (
+                f"Geo Place Name={name}<br>Reading Date=%{{x}}<br>"
+                f"{y_label}=%{{y}}<extra></extra>"
+            ),
+            "x": np.datetime_as_string(location_index.x[positions], unit="D"),
+            "y": location_index.y[positions],
+        }
+        for i, (name, positions) in enumerate(series)
     ]
-)
+    layout = {
+        "yaxis": {"title": {"text": y_label}},
+        "title": {
+            "text": f"{partition[0]} by {partition[2]}, {period_label(*partition[3:])} {span}"
+        },
+        # Keeps the user's zoom while the zoomed window is swapped in
+        "uirevision": ",".join([*partition, *locations]),
+    }
+    if x_range:
+        layout["xaxis"] = {"range": x_range}
+    return template.figure(traces, layout)
+
+def zoomed_range(relayout_data):
+    """Returns the [start, end] x range from relayoutData, None when zoomed
+    out, or no_update when the x axis did not change."""
+    if not relayout_data:
+        return no_update
+    if relayout_data.get("xaxis.autorange"):
+        return None
+    if "xaxis.range[0]" in relayout_data:
+        return [relayout_data["xaxis.range[0]"], relayout_data["xaxis.range[1]"]]
+    if "xaxis.range" in relayout_data:
+        return list(relayout_data["xaxis.range"])
+    return no_update
+
+def map_values(location_index, year):
+    """Returns the Geo Join IDs, values and place names of one year."""
+    frame = location_index.frame
+    rows = frame[frame["Period Year"] == year]
+    return (
+        rows["Geo Join ID"].astype(str).tolist(),
+        rows["Data Value"].round(2).to_numpy(),
+        rows[location_index.key].astype(str).tolist(),
+    )
+
+def make_map(geojson, ids, values, names, title, units, uirevision):
+    """Builds the choropleth as a plain figure dict; the geometry is already
+    simplified and serialized by geo_shapes, so nothing is validated again."""
+    return {
+        "data": [
+            {
+                "type": "choroplethmapbox",
+                "geojson": geojson,
+                "locations": ids,
+                "z": values,
+                "text": names,
+                "hovertemplate": "%{text}<br>%{z}<extra></extra>",
+                "colorscale": "YlOrRd",
+                "marker": {"line": {"width": 0.5, "color": "white"}},
+                "colorbar": {"title": {"text": units}},
+            }
+        ],
+        "layout": {
+            "title": {"text": title},
+            "mapbox": {
+                "style": "carto-positron",
+                "center": {"lat": 40.7, "lon": -73.94},
+                "zoom": 9,
+            },
+            "margin": {"l": 0, "r": 0, "t": 40, "b": 0},
+            "uirevision": uirevision,
+        },
+    }
+
+def empty_map(message):
+    return {
+        "data": [],
+        "layout": {
+            "xaxis": {"visible": False},
+            "yaxis": {"visible": False},
+            "annotations": [{"text": message, "showarrow": False}],
+        },
+    }
 
 # Callback functions
+# The layout already holds the default filters, so nothing runs on page load;
+# the charts come from the prebuilt view
+@app.callback(
+    Output("measure-dropdown", "options"),
+    Output("measure-dropdown", "value"),
+    Input("name-dropdown", "value"),
+    State("measure-dropdown", "value"),
+    prevent_initial_call=True,
+)
+def update_measures(name, measure):
+    measures = dataset.get()[1].measures(name)
+    if not measures:
+        return [], None
+    return measures, measure if measure in measures else measures[0]
+
+@app.callback(
+    Output("geo-type-dropdown", "options"),
+    Output("geo-type-dropdown", "value"),
+    Input("name-dropdown", "value"),
+    Input("measure-dropdown", "value"),
+    State("geo-type-dropdown", "value"),
+    prevent_initial_call=True,
+)
+def update_geo_types(name, measure, geo_type):
+    geo_types = dataset.get()[1].geo_types(name, measure)
+    if not geo_types:
+        return [], None
+    return geo_types, geo_type if geo_type in geo_types else geo_types[0]
+
+@app.callback(
+    Output("period-dropdown", "options"),
+    Output("period-dropdown", "value"),
+    Input("name-dropdown", "value"),
+    Input("measure-dropdown", "value"),
+    Input("geo-type-dropdown", "value"),
+    State("period-dropdown", "value"),
+    prevent_initial_call=True,
+)
+def update_periods(name, measure, geo_type, period):
+    periods = dataset.get()[1].periods(name, measure, geo_type)
+    if not periods:
+        return [], None
+    values = [period_value(*p) for p in periods]
+    return period_options(periods), period if period in values else values[0]
+
+@app.callback(
+    Output("filter-dropdown", "options"),
+    Output("filter-dropdown", "value"),
+    Input("name-dropdown", "value"),
+    Input("measure-dropdown", "value"),
+    Input("geo-type-dropdown", "value"),
+    Input("period-dropdown", "value"),
+    prevent_initial_call=True,
+)
+def update_locations(name, measure, geo_type, period):
+    # A new filter combination starts with all of its locations selected
+    if not period:
+        return [], []
+    location_index = dataset.get()[1].get(name, measure, geo_type, *period.split("|"))
+    if location_index is None:
+        return [], []
+    locations = location_index.locations()
+    return locations, locations
+
+app.clientside_callback(
+    LOADER_SCRIPT,
+    Output("default-view", "data"),
+    Input("default-view-url", "data"),
+)
+
+app.clientside_callback(
+    "function(id) { return window.innerWidth; }",
+    Output("graph-width", "data"),
+    Input("pollution-chart", "id"),
+)
+
+# Only x axis changes of the chart and zoom changes of the map reach the
+# server; plotly reports every other interaction through relayoutData too
+app.clientside_callback(
+    """
+    function(relayout) {
+        if (relayout && Object.keys(relayout).some(k => k.startsWith("xaxis."))) {
+            return relayout;
+        }
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("chart-zoom", "data"),
+    Input("pollution-chart", "relayoutData"),
+)
+
+app.clientside_callback(
+    """
+    function(relayout) {
+        if (relayout && "mapbox.zoom" in relayout) {
+            return relayout["mapbox.zoom"];
+        }
+        return window.dash_clientside.no_update;
+    }
+    """,
+    Output("map-zoom", "data"),
+    Input("pollution-map", "relayoutData"),
+)
+
+def line_chart(
+    version, partition_store, partition, locations, x_range=None,
+    width=DEFAULT_GRAPH_WIDTH,
+):
+    """Returns the line chart through the figure cache."""
+    key = make_key(
+        "pollution-line",
+        version,
+        ENCODING,
+        DOWNSAMPLE.__name__,
+        partition,
+        locations,
+        x_range,
+        width,
+    )
+    with phase("figure"):
+        return figure_cache.get_or_build(
+            key,
+            lambda: make_line_chart(partition_store, partition, locations, x_range, width),
+        )
+
 @app.callback(
     Output(component_id="pollution-chart", component_property="figure"),
-    [Input(component_id="filter-dropdown", component_property="value")],
+    [
+        Input(component_id="filter-dropdown", component_property="value"),
+        Input(component_id="chart-zoom", component_property="data"),
+        Input(component_id="default-view", component_property="data"),
+    ],
+    State("graph-width", "data"),
+    State("name-dropdown", "value"),
+    State("measure-dropdown", "value"),
+    State("geo-type-dropdown", "value"),
+    State("period-dropdown", "value"),
+    prevent_initial_call=True,
 )
-def update_graph(selected_value):
-    print(f"Currently selected value: {selected_value}")
-    
-    if len(selected_value) == 0:
+def update_graph(
+    selected_value, relayout_data, default_view, graph_width, name, measure,
+    geo_type, period
+):
+    version, partition_store = dataset.get()
+    if not period:
         return {}
-    else:
-        filtered_pollution = pollution_df[pollution_df["Geo Place Name"].isin(selected_value)]
-        fig = px.line(
-            data_frame=filtered_pollution,
-            x = "Start_Date",
-            y="Data Value",
-            color = "Geo Place Name",
-            log_y=True,
-            labels={
-                "Start Date" : "Reading Date",
-                "Data Value" : "Pollution Value",
-                "Geo Name Place" : "Location"
-            },
-        )
-        return fig
+    partition = (name, measure, geo_type, *period.split("|"))
+    if len(selected_value) == 0 or partition_store.get(*partition) is None:
+        return {}
+    
+    # Zooming re-fetches the visible window at full resolution
+    x_range = None
+    if ctx.triggered_id == "chart-zoom":
+        x_range = zoomed_range(relayout_data)
+        if x_range is no_update:
+            return no_update
+    
+    # Round the width so similar screens share cached figures
+    width = round((graph_width or DEFAULT_GRAPH_WIDTH) / 100) * 100 or 100
     
+    # Same set of locations -> same figure, whatever order they were picked in
+    locations = sorted(set(selected_value))
+    return line_chart(version, partition_store, partition, locations, x_range, width)
+
+@app.callback(
+    Output("map-year-slider", "min"),
+    Output("map-year-slider", "max"),
+    Output("map-year-slider", "marks"),
+    Output("map-year-slider", "value"),
+    Input("name-dropdown", "value"),
+    Input("measure-dropdown", "value"),
+    Input("geo-type-dropdown", "value"),
+    Input("period-dropdown", "value"),
+    State("map-year-slider", "value"),
+    prevent_initial_call=True,
+)
+def update_map_years(name, measure, geo_type, period, year):
+    partition = (name, measure, geo_type, *(period or "|").split("|"))
+    years = dataset.get()[1].years.get(partition)
+    if not years:
+        return 0, 0, {}, None
+    marks = {y: str(y) for y in years}
+    return years[0], years[-1], marks, year if year in years else years[-1]
+
+def map_view(partition_store, partition, year, zoom=None, shown=None):
+    """Returns (figure, shown state) for the map of one partition and year.
+
+    The figure is a Patch of the values when the browser already shows the
+    right geometry (shown is its state), a full figure otherwise.
+    """
+    shown = shown or {}
+    geo_type = partition[2]
+    location_index = partition_store.get(*partition)
+    if year is None or location_index is None:
+        return empty_map("No data for this selection"), None
+    geojson, geometry_key = geometry(geo_type, zoom)
+    if geojson is None:
+        return empty_map(
+            f"No {geo_type} boundary file in {GEO_DIR}, see python geo_shapes.py --download"
+        ), None
+
+    state = {"key": geometry_key, "zoom": zoom}
+    ids, values, names = map_values(location_index, year)
+    values = encode_array(values)
+    title = f"{partition[0]}, {period_label(*partition[3:])} {year}"
+    units = partition_store.units.get(partition, partition[1])
+    with phase("figure"):
+        if geometry_key == shown.get("key"):
+            patched = Patch()
+            patched["data"][0]["locations"] = ids
+            patched["data"][0]["z"] = values
+            patched["data"][0]["text"] = names
+            patched["data"][0]["colorbar"]["title"]["text"] = units
+            patched["layout"]["title"]["text"] = title
+            return patched, state
+        return make_map(geojson, ids, values, names, title, units, geo_type), state
+
+@app.callback(
+    Output("pollution-map", "figure"),
+    Output("map-geometry", "data"),
+    Input("map-year-slider", "value"),
+    Input("map-zoom", "data"),
+    Input("default-view", "data"),
+    State("name-dropdown", "value"),
+    State("measure-dropdown", "value"),
+    State("geo-type-dropdown", "value"),
+    State("period-dropdown", "value"),
+    State("map-geometry", "data"),
+    prevent_initial_call=True,
+)
+def update_map(year, zoom, default_view, name, measure, geo_type, period, shown):
+    """Draws the selected pollutant and period on a map of geo_type.
+
+    The boundaries are sent only when the browser does not have them yet
+    (another geography type or zoom level); otherwise only the values are
+    patched into the figure it already shows.
+    """
+    shown = shown or {}
+    if ctx.triggered_id != "map-zoom":
+        zoom = shown.get("zoom")
+    if not period:
+        return empty_map("No data for this selection"), None
+    partition = (name, measure, geo_type, *period.split("|"))
+    if ctx.triggered_id == "map-zoom" and shown.get("key") is not None:
+        # Zoomed within the same simplification level
+        if geometry(geo_type, zoom)[1] == shown["key"]:
+            return no_update, {"key": shown["key"], "zoom": zoom}
+    return map_view(dataset.get()[1], partition, year, zoom, shown)
+
+@static_views.view("pollution")
+def default_view(version):
+    """The landing page: every location of the default filters, and the map
+    of their latest year."""
+    current, partition_store = dataset.get()
+    if current != version:
+        return None
+    name, measure, geo_type, periods, locations = default_filters(partition_store)
+    partition = (name, measure, geo_type, *periods[0])
+    map_figure, map_state = map_view(
+        partition_store, partition, partition_store.years[partition][-1]
+    )
+    return {
+        "pollution-chart": {
+            "figure": line_chart(version, partition_store, partition, locations)
+        },
+        "pollution-map": {"figure": map_figure},
+        "map-geometry": {"data": map_state},
+    }
+
 if __name__ == "__main__":
     app.run_server(debug=True)
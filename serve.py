@@ -0,0 +1,132 @@
+# Production server for the three apps: gunicorn with several worker processes
+# instead of the single process debug server of `app.run_server(debug=True)`.
+# The app is imported in the master before the workers are forked, so the
+# data it loads (pollution_app's frame and partition store, the World Bank
+# snapshot and its cube, the historic returns) is read once and shared with
+# the workers copy-on-write. The garbage collector is kept off during the load
+# and the loaded objects are frozen, so collections in the workers do not
+# touch, and so copy, the shared pages.
+#
+#     python serve.py pollution_app --workers 4 --bind 0.0.0.0:8050
+#     python serve.py Advanced_Application --chdir /srv/advanced   # has assets/historic.csv
+#
+# --max-requests recycles each worker after about that many requests. The
+# workers are threaded, and a snapshot event stream of api_application keeps
+# its thread busy while it is open, so at most half of the threads hold
+# streams (WB_EVENTS_MAX_STREAMS), 4 per worker with the default 8 threads,
+# and the rest always serve callbacks; tabs over the limit check for new
+# versions every 60 s instead, like the page did before it had a stream. Callback metrics
+# are summed over the workers (METRICS_DIR). Unix only, like gunicorn.
+import argparse
+import gc
+import glob
+import importlib
+import importlib.util
+import os
+import sys
+import tempfile
+
+from gunicorn.app.base import BaseApplication
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+# App name: (module, file to load it from or None, default threads per worker)
+APPS = {
+    "pollution_app": ("pollution_app", None, 4),
+    "api_application": ("api_application", None, 8),
+    "Advanced_Application": (
+        "Advanced_Application", os.path.join(ROOT, "assets", "Advanced_Application.py"), 4
+    ),
+}
+
+
+def import_app(name):
+    """Imports an app module, by file path for the one under assets/."""
+    module_name, path, _ = APPS[name]
+    if path is None:
+        return importlib.import_module(module_name)
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[module_name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_app(name):
+    """Imports the app and builds what every worker needs, then freezes it.
+
+    Returns the Flask server.
+    """
+    gc.disable()
+    module = import_app(name)
+    # Prebuilt landing views: the World Bank snapshot and cube are loaded and
+    # the figure cache is warmed here rather than once per worker
+    if hasattr(module, "static_views"):
+        module.static_views.build_all()
+    gc.freeze()
+    return module.app.server
+
+
+def post_fork(server, worker):
+    gc.enable()
+
+
+class AppServer(BaseApplication):
+    def __init__(self, name, options):
+        self.name = name
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return load_app(self.name)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve an app with gunicorn.")
+    parser.add_argument("app", choices=APPS)
+    parser.add_argument("--bind", default=os.environ.get("BIND", "127.0.0.1:8050"))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.environ.get("WEB_CONCURRENCY", os.cpu_count() or 1)))
+    parser.add_argument("--threads", type=int, help="threads per worker")
+    parser.add_argument("--max-requests", type=int, default=1000,
+                        help="recycle a worker after about this many requests, 0 never")
+    parser.add_argument("--max-requests-jitter", type=int, default=100)
+    parser.add_argument("--timeout", type=int, default=60,
+                        help="seconds before a silent worker is restarted")
+    parser.add_argument("--chdir", help="directory the app reads its data from")
+    args = parser.parse_args()
+
+    if args.chdir:
+        os.chdir(args.chdir)
+    sys.path.insert(0, ROOT)
+
+    # Each worker writes its callback metrics here and /metrics sums them.
+    # Counts start over with the server.
+    metrics_dir = os.environ.get("METRICS_DIR")
+    if metrics_dir:
+        os.makedirs(metrics_dir, exist_ok=True)
+        for path in glob.glob(os.path.join(metrics_dir, "*.json")):
+            os.remove(path)
+    else:
+        os.environ["METRICS_DIR"] = tempfile.mkdtemp(prefix="metrics-")
+
+    # Event streams never take the last thread of a worker
+    threads = args.threads or APPS[args.app][2]
+    max_streams = int(os.environ.get("WB_EVENTS_MAX_STREAMS", threads // 2))
+    os.environ["WB_EVENTS_MAX_STREAMS"] = str(min(max_streams, threads - 1))
+
+    AppServer(args.app, {
+        "bind": args.bind,
+        "workers": args.workers,
+        "worker_class": "gthread",
+        "threads": threads,
+        "max_requests": args.max_requests,
+        "max_requests_jitter": args.max_requests_jitter,
+        "timeout": args.timeout,
+        "preload_app": True,
+        "post_fork": post_fork,
+    }).run()
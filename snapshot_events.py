@@ -0,0 +1,164 @@
+# Server-sent events for new World Bank snapshot versions.
+# One watcher thread per process checks latest.json (a single stat call) and
+# wakes the connected clients only when wb_snapshot.py publishes a new
+# version. Idle clients wait on a condition variable, so the cost of an open
+# tab does not depend on how often anything is checked.
+#
+# api_application.py serves the stream on /events/snapshot; the browser opens
+# it with EventSource and writes each version into the "storage" Store.
+#
+# A threaded server spends a thread on every open stream, so streams are
+# bounded: each ends after WB_EVENTS_MAX_AGE seconds and EventSource opens a
+# new one, which frees the threads of tabs that were closed without the
+# server noticing. At most WB_EVENTS_MAX_STREAMS streams are held per process
+# (serve.py sets half of the worker's threads, 4 for api_application). A
+# client over the limit gets the current version and a stream that ends at
+# once with a longer retry, so that tab checks for a new version every
+# OVERFLOW_RETRY seconds instead, as often as the page polled before it had
+# an event stream.
+import os
+import threading
+import time
+
+from flask import Response, stream_with_context
+
+from wb_snapshot import SNAPSHOT_DIR, read_latest
+
+EVENTS_PATH = "/events/snapshot"
+# Seconds between checks of latest.json, once per process
+POLL_INTERVAL = float(os.environ.get("WB_EVENTS_POLL_INTERVAL", 2.0))
+# Seconds between keep-alive comments, so proxies keep idle streams open
+HEARTBEAT = 25.0
+# Seconds before a held stream ends and the browser reconnects
+MAX_AGE = float(os.environ.get("WB_EVENTS_MAX_AGE", 300))
+# Streams held open at once per process, unset for no limit
+MAX_STREAMS = os.environ.get("WB_EVENTS_MAX_STREAMS")
+MAX_STREAMS = int(MAX_STREAMS) if MAX_STREAMS else None
+# Seconds until a client over MAX_STREAMS asks again, the period of the
+# dcc.Interval the stream replaced
+OVERFLOW_RETRY = 60
+
+
+class VersionBroadcaster:
+    """Tracks the latest snapshot version and wakes waiting streams on change."""
+
+    def __init__(
+        self,
+        snapshot_dir=SNAPSHOT_DIR,
+        poll_interval=POLL_INTERVAL,
+        heartbeat=HEARTBEAT,
+        max_age=MAX_AGE,
+        max_streams=MAX_STREAMS,
+    ):
+        self.snapshot_dir = snapshot_dir
+        self.poll_interval = poll_interval
+        self.heartbeat = heartbeat
+        self.max_age = max_age
+        self.max_streams = max_streams
+        self.version = None
+        self.clients = 0
+        self._changed = threading.Condition()
+        self._thread = None
+        self._mtime = None
+
+    def _check(self):
+        try:
+            mtime = os.stat(os.path.join(self.snapshot_dir, "latest.json")).st_mtime_ns
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        self._mtime = mtime
+        latest = read_latest(self.snapshot_dir)
+        if latest is not None and latest["version"] != self.version:
+            with self._changed:
+                self.version = latest["version"]
+                self._changed.notify_all()
+
+    def _watch(self):
+        while True:
+            self._check()
+            time.sleep(self.poll_interval)
+
+    def start(self):
+        """Starts the watcher thread, once."""
+        with self._changed:
+            if self._thread is None:
+                self._check()
+                self._thread = threading.Thread(target=self._watch, daemon=True)
+                self._thread.start()
+
+    def wait(self, known, timeout):
+        """Blocks until the version differs from known or timeout passes,
+        then returns the current version."""
+        with self._changed:
+            self._changed.wait_for(lambda: self.version != known, timeout)
+            return self.version
+
+    def stream(self):
+        """Yields SSE frames: the current version, then every new one until
+        max_age passes. Over max_streams, only the current version."""
+        self.start()
+        with self._changed:
+            held = self.max_streams is None or self.clients < self.max_streams
+            if held:
+                self.clients += 1
+            version = self.version
+        if not held:
+            yield f"retry: {OVERFLOW_RETRY * 1000}\n\n"
+            if version is not None:
+                yield f"event: snapshot\ndata: {version}\n\n"
+            return
+        try:
+            # Reconnect after 5 s when the stream ends or the connection drops
+            yield "retry: 5000\n\n"
+            sent = None
+            deadline = time.monotonic() + self.max_age
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                version = self.wait(sent, min(self.heartbeat, remaining))
+                if version != sent:
+                    sent = version
+                    yield f"event: snapshot\ndata: {version}\n\n"
+                else:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._changed:
+                self.clients -= 1
+
+
+def register(server, broadcaster, path=EVENTS_PATH):
+    """Adds the event stream route to a Flask server."""
+
+    def snapshot_events():
+        return Response(
+            stream_with_context(broadcaster.stream()),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    server.add_url_rule(path, "snapshot_events", snapshot_events)
+    return broadcaster
+
+
+# Opens the stream once per page and copies each new version into a Store,
+# whose data starts as the version the page was rendered with
+CLIENT_SCRIPT = """
+function(id, version) {
+    if (window.EventSource && !window.snapshotEvents) {
+        window.snapshotEvents = new EventSource("%s");
+        window.snapshotEvents.addEventListener("snapshot", function(e) {
+            // Every reconnect sends the current version again, and the page
+            // already shows the one it was rendered with
+            var seen = window.snapshotVersion || version;
+            window.snapshotVersion = e.data;
+            if (e.data !== seen) {
+                window.dash_clientside.set_props(id, {data: e.data});
+            }
+        });
+    }
+    return window.dash_clientside.no_update;
+}
+"""
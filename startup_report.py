@@ -0,0 +1,85 @@
+# Startup time report for the apps.
+# Imports an app module in a fresh interpreter with `python -X importtime`
+# and prints where the boot time goes, grouped by top level package.
+#
+#     python startup_report.py pollution_app --budget 2.0
+#     python startup_report.py assets.Advanced_Application --chdir /srv/advanced
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|(\s*)(\S+)")
+
+
+def measure_imports(module, cwd=None):
+    """Imports module in a subprocess and returns (wall seconds, rows).
+
+    cwd is the directory the app reads its data from; the apps are always
+    imported from this checkout.
+    Each row is (module name, self microseconds, cumulative microseconds, depth).
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+    start = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=cwd,
+        env=env,
+    )
+    wall = time.perf_counter() - start
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            rows.append((name, int(self_us), int(cumulative_us), len(indent) // 2))
+    return wall, rows
+
+
+def by_package(rows):
+    """Sums self time per top level package, largest first."""
+    totals = defaultdict(int)
+    for name, self_us, _, _ in rows:
+        totals[name.split(".")[0]] += self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+def print_report(module, wall, rows, top=15):
+    print(f"Startup report for {module}: {wall:.2f}s wall time")
+    print(f"{'package':<32}{'self ms':>10}")
+    for package, self_us in by_package(rows)[:top]:
+        print(f"{package:<32}{self_us / 1000:>10.1f}")
+    if rows:
+        name, _, cumulative_us, _ = rows[-1]
+        print(f"{name} including its imports: {cumulative_us / 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report app import time.")
+    parser.add_argument("modules", nargs="+", help="e.g. pollution_app api_application")
+    parser.add_argument("--budget", type=float, default=None,
+                        help="fail if any module takes longer than this many seconds")
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--chdir", help="directory the apps read their data from")
+    args = parser.parse_args()
+
+    over_budget = []
+    for module in args.modules:
+        wall, rows = measure_imports(module, args.chdir)
+        print_report(module, wall, rows, args.top)
+        print()
+        if args.budget is not None and wall > args.budget:
+            over_budget.append(f"{module} ({wall:.2f}s)")
+
+    if over_budget:
+        sys.exit(f"Over the {args.budget}s startup budget: {', '.join(over_budget)}")
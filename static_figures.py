@@ -0,0 +1,157 @@
+# Prebuilt landing views served as static, compressed JSON.
+# A view is a set of component properties (usually a figure) for the default
+# state of a page, rendered once per dataset version and written gzipped to
+# cache/static. The page fetches it from a versioned URL,
+#     /figures/<view>/<dataset version>/<encoding>.json
+# served with an ETag and a one year immutable Cache-Control header, and
+# applies it in the browser, so the default state needs no Python callback.
+# The encoding names the app settings that change the rendered figures
+# (TYPED_ARRAYS, DOWNSAMPLE). A new dataset version or encoding means a new
+# URL; its file is built on first request, or ahead of time with
+#
+#     python static_figures.py pollution_app api_application
+import argparse
+import gzip
+import hashlib
+import importlib
+import os
+from threading import Lock
+
+from flask import Response, abort, request
+
+STATIC_FIGURE_DIR = os.environ.get("STATIC_FIGURE_DIR", "cache/static")
+ROUTE = "/figures/<name>/<version>/<encoding>.json"
+CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Fetches the view and applies it; returns "render" so the server callbacks
+# draw the page themselves when there is no view
+LOADER_SCRIPT = """
+async function(url) {
+    if (!url) { return "render"; }
+    try {
+        const resp = await fetch(url);
+        if (!resp.ok) { return "render"; }
+        const view = await resp.json();
+        for (const [id, props] of Object.entries(view.props)) {
+            window.dash_clientside.set_props(id, props);
+        }
+        return window.dash_clientside.no_update;
+    } catch (e) {
+        return "render";
+    }
+}
+"""
+
+
+class StaticViews:
+    """Registry of prebuilt views for one Dash app."""
+
+    def __init__(self, server, version, encoding, static_dir=STATIC_FIGURE_DIR):
+        # version() returns the current dataset version, or None
+        self.version = version
+        self.encoding = encoding
+        self.static_dir = static_dir
+        self.builders = {}
+        self.warmers = []
+        self._lock = Lock()
+        server.add_url_rule(ROUTE, "static_figures", self._serve)
+
+    def view(self, name):
+        """Decorator registering build(version) -> {component id: {prop: value}}.
+
+        build may return None when it cannot render that version.
+        """
+        def register(build):
+            self.builders[name] = build
+            return build
+        return register
+
+    def warm(self, fill):
+        """Decorator registering fill(version), run by the build step to put
+        the next most popular figures in the figure cache."""
+        self.warmers.append(fill)
+        return fill
+
+    def url(self, name):
+        """URL of a view for the current dataset version, or None."""
+        version = self.version()
+        if version is None:
+            return None
+        return f"/figures/{name}/{version}/{self.encoding}.json"
+
+    def path(self, name, version):
+        return os.path.join(self.static_dir, f"{name}-{version}-{self.encoding}.json.gz")
+
+    def build(self, name, version=None):
+        """Renders a view to gzipped JSON and returns its path, or None."""
+        import plotly.io as pio
+
+        version = version or self.version()
+        if version is None:
+            return None
+        props = self.builders[name](version)
+        if props is None:
+            return None
+        body = pio.to_json({"version": version, "props": props}, validate=False)
+        os.makedirs(self.static_dir, exist_ok=True)
+        path = self.path(name, version)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            # mtime=0 keeps the bytes, and so the ETag, identical across builds
+            f.write(gzip.compress(body.encode(), compresslevel=9, mtime=0))
+        os.replace(tmp_path, path)
+        return path
+
+    def build_all(self):
+        """Builds every view and warms the figure cache for the current version."""
+        paths = {name: self.build(name) for name in self.builders}
+        version = self.version()
+        if version is not None:
+            for fill in self.warmers:
+                fill(version)
+        return paths
+
+    def _read(self, name, version):
+        path = self.path(name, version)
+        if not os.path.exists(path):
+            # Only the current version is built on demand
+            if version != self.version():
+                return None
+            with self._lock:
+                if not os.path.exists(path) and self.build(name, version) is None:
+                    return None
+        with open(path, "rb") as f:
+            return f.read()
+
+    def _serve(self, name, version, encoding):
+        # Views of another encoding are only built by apps running with it
+        if name not in self.builders or encoding != self.encoding:
+            abort(404)
+        body = self._read(name, version)
+        if body is None:
+            abort(404)
+        etag = hashlib.sha1(body).hexdigest()[:16]
+        headers = {"Cache-Control": CACHE_CONTROL, "Vary": "Accept-Encoding"}
+        if request.if_none_match.contains(etag):
+            resp = Response(status=304, headers=headers)
+        elif "gzip" in request.headers.get("Accept-Encoding", ""):
+            resp = Response(body, mimetype="application/json", headers=headers)
+            resp.headers["Content-Encoding"] = "gzip"
+        else:
+            resp = Response(gzip.decompress(body), mimetype="application/json", headers=headers)
+        resp.set_etag(etag)
+        return resp
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the static landing views.")
+    parser.add_argument("apps", nargs="+", help="app modules, e.g. pollution_app")
+    args = parser.parse_args()
+
+    for module_name in args.apps:
+        views = importlib.import_module(module_name).static_views
+        for name, path in views.build_all().items():
+            if path is None:
+                print(f"{module_name} {name}: nothing to build")
+            else:
+                print(f"{module_name} {name}: {path} ({os.path.getsize(path) / 1024:.0f} KiB)")
@@ -0,0 +1,111 @@
+# The backtest of the Advanced Application against the original pandas loop,
+# on a synthetic historic.csv (bench_callbacks.py).
+import importlib.util
+import itertools
+import os
+import sys
+
+import pytest
+
+from bench_callbacks import ADVANCED_APP, make_historic
+
+ALLOCATIONS = [(0, 0), (0, 100), (10, 20), (25, 60), (50, 50), (100, 0), (5, 90)]
+PERIODS = [(1928, 96), (1928, 1), (1970, 30), (2007, 17), (2014, 10), (2022, 2)]
+START_BALANCES = [10, 9999, 10000, 123457, 2500000]
+
+# The loop is kept as it was, pandas warns about its int to float upcasts
+pytestmark = pytest.mark.filterwarnings("ignore::FutureWarning")
+
+
+@pytest.fixture(scope="module")
+def app(tmp_path_factory):
+    data_dir = tmp_path_factory.mktemp("advanced")
+    os.makedirs(data_dir / "assets")
+    make_historic(data_dir / "assets" / "historic.csv")
+    cwd = os.getcwd()
+    os.chdir(data_dir)
+    try:
+        spec = importlib.util.spec_from_file_location("Advanced_Application", ADVANCED_APP)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules["Advanced_Application"] = module
+        spec.loader.exec_module(module)
+    finally:
+        os.chdir(cwd)
+    return module
+
+
+def loop_backtest(df, stocks, cash, start_bal, nper, start_yr):
+    """The backtest as it was, with .loc reads and writes per year."""
+    end_yr = start_yr + nper - 1
+    cash_allocation = cash / 100
+    stocks_allocation = stocks / 100
+    bonds_allocation = (100 - stocks - cash) / 100
+
+    dff = df[(df.Year >= start_yr - 1) & (df.Year <= end_yr)].set_index(
+        "Year", drop=False
+    )
+    dff["Year"] = dff["Year"].astype(int)
+    dff["Cash"] = cash_allocation * start_bal
+    dff["Bonds"] = bonds_allocation * start_bal
+    dff["Stocks"] = stocks_allocation * start_bal
+    dff["Total"] = start_bal
+    dff["Rebalance"] = True
+
+    for yr in dff.Year + 1:
+        if yr <= end_yr:
+            if dff.loc[yr, "Rebalance"]:
+                dff.loc[yr, "Cash"] = dff.loc[yr - 1, "Total"] * cash_allocation
+                dff.loc[yr, "Stocks"] = dff.loc[yr - 1, "Total"] * stocks_allocation
+                dff.loc[yr, "Bonds"] = dff.loc[yr - 1, "Total"] * bonds_allocation
+            dff.loc[yr, "Cash"] = dff.loc[yr, "Cash"] * (1 + dff.loc[yr, "3-mon T.Bill"])
+            dff.loc[yr, "Stocks"] = dff.loc[yr, "Stocks"] * (1 + dff.loc[yr, "S&P 500"])
+            dff.loc[yr, "Bonds"] = dff.loc[yr, "Bonds"] * (1 + dff.loc[yr, "10yr T.Bond"])
+            dff.loc[yr, "Total"] = dff.loc[yr, ["Cash", "Bonds", "Stocks"]].sum()
+
+    dff = dff.reset_index(drop=True)
+    columns = ["Cash", "Stocks", "Bonds", "Total"]
+    dff[columns] = dff[columns].round(0)
+
+    dff1 = (dff[(dff.Year >= start_yr) & (dff.Year <= end_yr)]).copy()
+    columns = ["all_cash", "all_bonds", "all_stocks", "inflation_only"]
+    annual_returns = ["3-mon T.Bill", "10yr T.Bond", "S&P 500", "Inflation"]
+    for col, return_pct in zip(columns, annual_returns):
+        dff1[col] = round(start_bal * (1 + (1 + dff1[return_pct]).cumprod() - 1), 0)
+    dff1 = dff1[["Year"] + columns]
+    dff = dff.merge(dff1, how="left")
+    dff.loc[0, columns] = start_bal
+    return dff
+
+
+COLUMNS = ["Year", "Cash", "Bonds", "Stocks", "Total",
+           "all_cash", "all_bonds", "all_stocks", "inflation_only"]
+
+
+def test_backtest_matches_loop(app):
+    app.backtest_grid = None
+    differing = []
+    for (cash, stocks), (start_yr, nper), start_bal in itertools.product(
+        ALLOCATIONS, PERIODS, START_BALANCES
+    ):
+        expected = loop_backtest(app.df, stocks, cash, start_bal, nper, start_yr)[COLUMNS]
+        actual = app.backtest(stocks, cash, start_bal, nper, start_yr)[COLUMNS]
+        if not expected.astype(float).equals(actual.astype(float)):
+            differing.append((cash, stocks, start_yr, nper, start_bal))
+    assert differing == []
+
+
+def test_precomputed_grid_matches_loop(app):
+    app.backtest_grid = app.BacktestGrid(start_bals=START_BALANCES)
+    try:
+        differing = []
+        for (cash, stocks), (start_yr, nper), start_bal in itertools.product(
+            ALLOCATIONS, PERIODS, START_BALANCES
+        ):
+            assert app.backtest_grid.totals(stocks, cash, start_bal, start_yr, nper) is not None
+            expected = loop_backtest(app.df, stocks, cash, start_bal, nper, start_yr)[COLUMNS]
+            actual = app.backtest(stocks, cash, start_bal, nper, start_yr)[COLUMNS]
+            if not expected.astype(float).equals(actual.astype(float)):
+                differing.append((cash, stocks, start_yr, nper, start_bal))
+        assert differing == []
+    finally:
+        app.backtest_grid = None
@@ -0,0 +1,167 @@
+# /metrics of callback_metrics.py on a small instrumented Dash app: the
+# Prometheus text format, what each callback outcome records, and the sum
+# over processes sharing a metrics directory.
+import re
+
+import pytest
+from dash import Dash, Input, Output, html
+from dash.exceptions import PreventUpdate
+
+from bench_load import callback_body
+from callback_metrics import LATENCY_BUCKETS, CallbackMetrics, instrument, phase
+from figure_cache import FigureCache
+
+# Sample lines: name, optional {label="value",...} and a number
+SAMPLE_RE = re.compile(
+    r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(\{(?:[a-zA-Z_][a-zA-Z0-9_]*="(?:[^"\\\n]|\\.)*",?)*\})?'
+    r" (-?[0-9.e+-]+|\+Inf|NaN)$"
+)
+LABEL_RE = re.compile(r'([a-zA-Z_][a-zA-Z0-9_]*)="((?:[^"\\\n]|\\.)*)"')
+
+
+def parse(text):
+    """Returns {metric: (type, help)} and [(sample name, {label: value}, value)],
+    asserting every line is valid exposition format."""
+    metrics, samples = {}, []
+    assert text.endswith("\n")
+    for line in text.splitlines():
+        if line.startswith("# HELP "):
+            name, help_text = line[7:].split(" ", 1)
+            metrics[name] = (None, help_text)
+        elif line.startswith("# TYPE "):
+            name, kind = line[7:].split(" ")
+            assert name in metrics and kind in ("counter", "histogram")
+            metrics[name] = (kind, metrics[name][1])
+        else:
+            match = SAMPLE_RE.match(line)
+            assert match, line
+            labels = dict(LABEL_RE.findall(match.group(2) or ""))
+            samples.append((match.group(1), labels, float(match.group(3))))
+    return metrics, samples
+
+
+def by_labels(samples):
+    """{(sample name, sorted label pairs): value}"""
+    return {(name, tuple(sorted(labels.items()))): value for name, labels, value in samples}
+
+
+def make_app():
+    app = Dash(__name__)
+    app.layout = html.Div([html.Div(id="in"), html.Div(id="out")])
+    app.figure_cache = FigureCache(cache_dir=None)
+    metrics = instrument(app)
+    metrics.watch_cache(app.figure_cache)
+
+    @app.callback(Output("out", "children"), Input("in", "children"))
+    def update(value):
+        if value == "prevent":
+            raise PreventUpdate
+        if value == "error":
+            raise ValueError(value)
+        with phase("figure"):
+            return app.figure_cache.get_or_build(value, lambda: {"value": value})
+
+    return app
+
+
+def call(client, value):
+    return client.post(
+        "/_dash-update-component",
+        json=callback_body([("out", "children")], [("in", "children", value)]),
+    )
+
+
+@pytest.fixture
+def client():
+    return make_app().server.test_client()
+
+
+def test_metrics_are_valid_exposition_format(client):
+    for value in ["a", "a", "b", "prevent"]:
+        call(client, value)
+    assert call(client, "error").status_code == 500
+
+    resp = client.get("/metrics")
+
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/plain"
+    metrics, samples = parse(resp.get_data(as_text=True))
+    assert metrics == {
+        "dash_callback_calls_total": ("counter", "Callback requests by outcome."),
+        "dash_callback_phase_seconds": ("histogram", "Callback time per phase."),
+        "dash_callback_request_bytes": ("histogram", "Size of the callback request body."),
+        "dash_callback_response_bytes": ("histogram", "Size of the callback response body."),
+        "figure_cache_lookups_total": ("counter", "Figure cache lookups by result."),
+    }
+    values = by_labels(samples)
+    calls = {
+        labels["outcome"]: value for name, labels, value in samples
+        if name == "dash_callback_calls_total"
+    }
+    assert calls == {"ok": 3, "prevented": 1, "error": 1}
+    assert values["figure_cache_lookups_total", (("result", "memory_hit"),)] == 1
+    assert values["figure_cache_lookups_total", (("result", "miss"),)] == 2
+
+    # Every phase of the successful and prevented calls is observed
+    for phase_name in ("prep", "figure", "serialize"):
+        labels = (("callback", "update"), ("phase", phase_name))
+        assert values["dash_callback_phase_seconds_count", labels] == 4
+        assert values["dash_callback_phase_seconds_sum", labels] >= 0
+
+
+def test_histogram_buckets_are_cumulative(client):
+    for value in ["a", "b", "c"]:
+        call(client, value)
+
+    _, samples = parse(client.get("/metrics").get_data(as_text=True))
+
+    series = {}
+    for name, labels, value in samples:
+        if name.endswith("_bucket"):
+            le = labels.pop("le")
+            key = (name[:-7], tuple(sorted(labels.items())))
+            series.setdefault(key, []).append((le, value))
+    assert series
+    for (name, labels), buckets in series.items():
+        bounds = [le for le, _ in buckets]
+        assert bounds[-1] == "+Inf"
+        assert [float(b) for b in bounds[:-1]] == sorted(float(b) for b in bounds[:-1])
+        counts = [count for _, count in buckets]
+        assert counts == sorted(counts)
+        count = [v for n, l, v in samples
+                 if n == name + "_count" and tuple(sorted(l.items())) == labels]
+        assert counts[-1] == count[0] == 3
+    phase_bounds = [
+        le for le, _ in series["dash_callback_phase_seconds",
+                               (("callback", "update"), ("phase", "prep"))]
+    ]
+    assert len(phase_bounds) == len(LATENCY_BUCKETS) + 1
+
+
+def test_label_values_are_escaped():
+    metrics = CallbackMetrics(shared_dir=None)
+    metrics.calls.inc('say "hi"\\\n', "ok")
+
+    _, samples = parse(metrics.render())
+
+    labels = {"callback": r'say \"hi\"\\\n', "outcome": "ok"}
+    assert ("dash_callback_calls_total", labels, 1) in samples
+
+
+def test_processes_are_summed(tmp_path):
+    workers = [CallbackMetrics(shared_dir=str(tmp_path)) for _ in range(3)]
+    for i, worker in enumerate(workers):
+        worker.calls.inc("update", "ok", amount=i + 1)
+        worker.phase_seconds.observe(0.003, "update", "prep")
+        worker.dump()
+
+    _, samples = parse(workers[0].render())
+
+    values = by_labels(samples)
+    assert values["dash_callback_calls_total", (("callback", "update"), ("outcome", "ok"))] == 6
+    prep = (("callback", "update"), ("phase", "prep"))
+    assert values["dash_callback_phase_seconds_count", prep] == 3
+    for le, count in [("0.0025", 0), ("0.005", 3), ("+Inf", 3)]:
+        labels = (("callback", "update"), ("le", le), ("phase", "prep"))
+        assert values["dash_callback_phase_seconds_bucket", labels] == count
+    assert values["dash_callback_phase_seconds_sum", prep] == pytest.approx(0.009)
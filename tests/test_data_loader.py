@@ -0,0 +1,149 @@
+# The columnar cache of data_loader.py on a slice of Input/Air_Quality.csv:
+# when it is reused, when it is rebuilt, and that rebuilds prune old versions.
+# Also the parsing of every Time Period format the data set uses.
+import os
+
+import pandas as pd
+import pytest
+
+import data_loader
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_CSV = os.path.join(ROOT, "Input", "Air_Quality.csv")
+
+
+@pytest.fixture
+def csv_path(tmp_path):
+    path = tmp_path / "Air_Quality.csv"
+    pd.read_csv(SAMPLE_CSV, nrows=300).to_csv(path, index=False)
+    return str(path)
+
+
+@pytest.fixture
+def parses(monkeypatch):
+    """Counts the times the CSV is parsed instead of read from the cache."""
+    calls = []
+    parse = data_loader.read_air_quality_csv
+
+    def counting(path):
+        calls.append(path)
+        return parse(path)
+
+    monkeypatch.setattr(data_loader, "read_air_quality_csv", counting)
+    return calls
+
+
+def cache_dirs(cache_dir):
+    return sorted(e.name for e in os.scandir(cache_dir) if e.is_dir())
+
+
+def test_unchanged_file_is_read_from_the_cache(csv_path, tmp_path, parses):
+    cache_dir = str(tmp_path / "cache")
+    first = data_loader.load_air_quality(csv_path, cache_dir)
+    second = data_loader.load_air_quality(csv_path, cache_dir, mmap=False)
+
+    assert len(parses) == 1
+    assert second.attrs["version"] == first.attrs["version"]
+    # The parsed frame's categories are strings, the cached frame's objects
+    pd.testing.assert_frame_equal(first, second, check_dtype=False, check_categorical=False)
+
+
+def test_touched_file_with_same_contents_is_not_parsed(csv_path, tmp_path, parses):
+    cache_dir = str(tmp_path / "cache")
+    data_loader.load_air_quality(csv_path, cache_dir)
+    stat = os.stat(csv_path)
+    os.utime(csv_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    data_loader.load_air_quality(csv_path, cache_dir)
+    data_loader.load_air_quality(csv_path, cache_dir)
+
+    assert len(parses) == 1
+    assert len(cache_dirs(cache_dir)) == 1
+
+
+def test_changed_contents_rebuild_and_prune(csv_path, tmp_path, parses):
+    cache_dir = str(tmp_path / "cache")
+    before = data_loader.load_air_quality(csv_path, cache_dir)
+    old_dirs = cache_dirs(cache_dir)
+
+    df = pd.read_csv(csv_path)
+    df["Data Value"] = -1.0
+    df.to_csv(csv_path, index=False)
+    after = data_loader.load_air_quality(csv_path, cache_dir)
+
+    assert len(parses) == 2
+    assert after.attrs["version"] != before.attrs["version"]
+    assert (after["Data Value"] == -1.0).all()
+    assert len(cache_dirs(cache_dir)) == 1 and cache_dirs(cache_dir) != old_dirs
+
+
+def test_schema_bump_rebuilds_and_prunes(csv_path, tmp_path, parses, monkeypatch):
+    cache_dir = str(tmp_path / "cache")
+    data_loader.load_air_quality(csv_path, cache_dir)
+    # Another file's cache in the same directory is left alone
+    other_dir = os.path.join(cache_dir, "Other-0123456789abcdef-v1")
+    os.makedirs(other_dir)
+
+    monkeypatch.setattr(data_loader, "SCHEMA_VERSION", data_loader.SCHEMA_VERSION + 1)
+    data_loader.load_air_quality(csv_path, cache_dir)
+
+    assert len(parses) == 2
+    assert cache_dirs(cache_dir) == [
+        "Air_Quality-{}-v{}".format(
+            data_loader.file_hash(csv_path)[:16], data_loader.SCHEMA_VERSION
+        ),
+        "Other-0123456789abcdef-v1",
+    ]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("2005", ("annual", "Annual", 2005, "2005-01-01", "2005-12-31")),
+    ("Summer 2012", ("seasonal", "Summer", 2012, "2012-06-01", "2012-08-31")),
+    ("Winter 2011-12", ("seasonal", "Winter", 2011, "2011-12-01", "2012-02-29")),
+    ("Winter 2012-13", ("seasonal", "Winter", 2012, "2012-12-01", "2013-02-28")),
+    ("2-Year Summer Average 2009-2010", ("multi-year", "Summer", 2009, "2009-06-01", "2010-08-31")),
+    ("2009-2011", ("multi-year", "Annual", 2009, "2009-01-01", "2011-12-31")),
+])
+def test_time_periods_are_parsed(text, expected):
+    kind, season, year, start, end = expected
+
+    assert data_loader._parse_time_period(text) == (
+        kind, season, year, pd.Timestamp(start), pd.Timestamp(end)
+    )
+
+
+def test_annual_averages_start_at_the_row_date():
+    df = pd.DataFrame({
+        "Time Period": ["Annual Average 2014", "Annual Average 2014", "Summer 2014",
+                        "Unknown 2014", None],
+        "Start_Date": pd.to_datetime(["2014-01-01", "2014-07-01", "2014-06-01",
+                                      "2014-03-01", "2014-04-01"]),
+    })
+    assert data_loader._parse_time_period("Annual Average 2014") == (
+        "annual", "Annual", 2014, None, None
+    )
+
+    df = data_loader.add_period_columns(df)
+
+    assert list(df["Period Kind"].astype(object).fillna("")) == [
+        "annual", "annual", "seasonal", "other", ""
+    ]
+    assert list(df["Season"].astype(object).fillna("")) == [
+        "Annual", "Annual", "Summer", "", ""
+    ]
+    assert list(df["Period Year"]) == [2014, 2014, 2014, -1, -1]
+    assert list(df["Period Start"]) == list(pd.to_datetime(
+        ["2014-01-01", "2014-07-01", "2014-06-01", None, None]
+    ))
+    assert list(df["Period End"]) == list(pd.to_datetime(
+        ["2014-12-31", "2015-06-30", "2014-08-31", None, None]
+    ))
+
+
+def test_every_time_period_of_the_sample_is_recognized():
+    df = data_loader.parse_air_quality(pd.read_csv(SAMPLE_CSV))
+
+    assert not (df["Period Kind"] == "other").any()
+    assert (df["Period Start"] <= df["Period End"]).all()
+    # Annual averages may start in the December before their year
+    assert (df["Period Start"].dt.year - df["Period Year"]).isin([-1, 0]).all()
@@ -0,0 +1,57 @@
+# Downsampling of downsample.py on synthetic series: the points kept, their
+# number and order, and series that need no downsampling.
+import numpy as np
+import pytest
+
+from downsample import METHODS, lttb, minmax
+
+
+def series(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = np.sort(rng.choice(10 * n, n, replace=False)).astype("int64")
+    return x, np.cumsum(rng.normal(size=n))
+
+
+@pytest.mark.parametrize("method", METHODS.values(), ids=METHODS.keys())
+@pytest.mark.parametrize("n, n_out", [(1000, 100), (1000, 101), (101, 100), (50, 4), (7, 2)])
+def test_endpoints_and_size(method, n, n_out):
+    x, y = series(n)
+
+    keep = method(x, y, n_out)
+
+    assert keep[0] == 0 and keep[-1] == n - 1
+    assert len(keep) <= n_out
+    assert np.all(np.diff(keep) > 0)
+
+
+@pytest.mark.parametrize("method", METHODS.values(), ids=METHODS.keys())
+@pytest.mark.parametrize("n", [0, 1, 5])
+def test_short_series_are_kept(method, n):
+    x, y = series(n)
+
+    assert list(method(x, y, 5)) == list(range(n))
+
+
+def test_lttb_keeps_exactly_n_out_points():
+    x, y = series(1000)
+
+    assert len(lttb(x, y, 100)) == 100
+
+
+def test_lttb_keeps_a_spike():
+    x, y = series(1000)
+    y[437] = y.max() + 100
+
+    assert 437 in lttb(x, y, 50)
+
+
+def test_minmax_keeps_every_bucket_extreme():
+    x, y = series(1000)
+    n_out = 100
+
+    keep = minmax(x, y, n_out)
+
+    assert np.argmin(y) in keep and np.argmax(y) in keep
+    for bucket in np.array_split(np.arange(1, 999), (n_out - 2) // 2):
+        assert bucket[np.argmin(y[bucket])] in keep
+        assert bucket[np.argmax(y[bucket])] in keep
@@ -0,0 +1,45 @@
+# The memory and disk layers of figure_cache.py.
+import os
+
+from figure_cache import FigureCache, make_key
+
+
+def figure(i, points=100):
+    return {"data": [{"type": "scatter", "y": list(range(i, i + points))}], "layout": {}}
+
+
+def cache_bytes(cache_dir):
+    return sum(e.stat().st_size for e in os.scandir(cache_dir) if e.name.endswith(".json"))
+
+
+def test_memory_hits_return_the_decoded_figure(tmp_path):
+    cache = FigureCache(str(tmp_path))
+    key = make_key("line", 1)
+    built = cache.set(key, figure(1))
+
+    assert cache.get(key) is built
+    # Another worker on the same directory reads it from disk once
+    other = FigureCache(str(tmp_path))
+    from_disk = other.get(key)
+    assert from_disk == built
+    assert other.get(key) is from_disk
+    assert (other.hits, other.disk_hits, other.misses) == (2, 1, 0)
+
+
+def test_disk_layer_stays_bounded(tmp_path):
+    probe = FigureCache(str(tmp_path / "probe"))
+    probe.set("probe", figure(0))
+    size = cache_bytes(tmp_path / "probe")
+    cache = FigureCache(str(tmp_path / "figures"), max_disk_bytes=20 * size)
+    tmp_path = tmp_path / "figures"
+    keys = [make_key("line", i) for i in range(100)]
+    for i, key in enumerate(keys):
+        cache.set(key, figure(i))
+        assert cache_bytes(tmp_path) <= cache.max_disk_bytes
+
+    # The newest figures are kept
+    assert os.path.exists(os.path.join(tmp_path, keys[-1] + ".json"))
+    assert not os.path.exists(os.path.join(tmp_path, keys[0] + ".json"))
+    # A worker started later counts what is already there
+    later = FigureCache(str(tmp_path), max_disk_bytes=20 * size)
+    assert later._disk_bytes == cache_bytes(tmp_path)
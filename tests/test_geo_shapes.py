@@ -0,0 +1,68 @@
+# Boundary download of geo_shapes.py, from a local server serving TopoJSON.
+import functools
+import json
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from geo_shapes import download, geometry, topojson_features
+
+# Two squares sharing their middle edge (arc 0), quantized and delta-encoded
+TOPOLOGY = {
+    "type": "Topology",
+    "transform": {"scale": [0.001, 0.001], "translate": [-74.0, 40.5]},
+    "arcs": [
+        [[10, 0], [0, 10]],
+        [[10, 10], [-10, 0], [0, -10], [10, 0]],
+        [[10, 0], [10, 0], [0, 10], [-10, 0]],
+    ],
+    "objects": {
+        "UHF42": {
+            "type": "GeometryCollection",
+            "geometries": [
+                {"type": "Polygon", "id": "a", "arcs": [[0, 1]], "properties": {"GEOCODE": 101}},
+                {"type": "Polygon", "id": "b", "arcs": [[2, ~0]], "properties": {"GEOCODE": 102}},
+            ],
+        }
+    },
+}
+
+
+def lonlat(x, y):
+    return [pytest.approx(-74.0 + x / 1000), pytest.approx(40.5 + y / 1000)]
+
+
+def test_topojson_features():
+    west, east = topojson_features(TOPOLOGY)
+
+    assert (west["id"], east["id"]) == ("101", "102")
+    assert west["geometry"]["coordinates"] == [[
+        [lonlat(10, 0), lonlat(10, 10), lonlat(0, 10), lonlat(0, 0), lonlat(10, 0)]
+    ]]
+    assert east["geometry"]["coordinates"] == [[
+        [lonlat(10, 0), lonlat(20, 0), lonlat(20, 10), lonlat(10, 10), lonlat(10, 0)]
+    ]]
+
+
+@pytest.fixture
+def source(tmp_path):
+    served = tmp_path / "served"
+    served.mkdir()
+    (served / "UHF42.topo.json").write_text(json.dumps(TOPOLOGY))
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(served))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_downloaded_boundaries_are_mapped(source, tmp_path):
+    geo_dir, cache_dir = str(tmp_path / "geo"), str(tmp_path / "geo-cache")
+
+    download(["UHF42"], geo_dir, source)
+
+    geojson, key = geometry("UHF42", geo_dir=geo_dir, cache_dir=cache_dir)
+    assert key is not None
+    assert [f["id"] for f in geojson["features"]] == ["101", "102"]
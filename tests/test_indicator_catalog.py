@@ -0,0 +1,71 @@
+# IndicatorCatalog search on the indicator list of fake_wb_server.py: exact,
+# prefix and misspelled queries, and a catalog downloaded from the fake API.
+import pytest
+
+from fake_wb_server import FakeWorldBank, INDICATOR_LIST
+from indicator_catalog import IndicatorCatalog, download_catalog, load_catalog
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    return IndicatorCatalog(INDICATOR_LIST)
+
+
+def ids(rows):
+    return [row["id"] for row in rows]
+
+
+def test_exact_words_rank_first(catalog):
+    assert ids(catalog.search("pm2.5 exposure", limit=2)) == [
+        "EN.ATM.PM25.MC.M3", "EN.ATM.PM25.MC.ZS"
+    ]
+    assert ids(catalog.search("internet", limit=1)) == ["IT.NET.USER.ZS"]
+
+
+def test_prefixes_match(catalog):
+    assert ids(catalog.search("parlia", limit=1)) == ["SG.GEN.PARL.ZS"]
+    assert ids(catalog.search("en.atm.pm", limit=None)) == [
+        "EN.ATM.PM25.MC.M3", "EN.ATM.PM25.MC.ZS"
+    ]
+
+
+def test_misspellings_match(catalog):
+    assert ids(catalog.search("emisions", limit=1)) == ["EN.ATM.CO2E.KT"]
+    assert ids(catalog.search("polution guidline", limit=1)) == ["EN.ATM.PM25.MC.ZS"]
+
+
+def test_exact_matches_beat_prefix_matches(catalog):
+    # "12" is also a prefix of 120, 1200, ... and of the ids 00012x
+    rows = catalog.search("synthetic indicator 12", limit=3)
+    assert rows[0]["id"] == "FAKE.00012"
+
+
+def test_no_match(catalog):
+    assert catalog.search("xyzzy") == []
+    assert catalog.search("") == []
+
+
+def test_find_and_get(catalog):
+    name = "CO2 emissions (kt)"
+    assert ids(catalog.find(name)) == ["EN.ATM.CO2E.KT"]
+    assert catalog.get("EN.ATM.CO2E.KT")["name"] == name
+    assert catalog.get("NOT.AN.ID") is None
+
+
+def test_downloaded_catalog_is_searchable(tmp_path):
+    server = FakeWorldBank(("127.0.0.1", 0))
+    url = server.start()
+    try:
+        path = str(tmp_path / "indicator_catalog.json")
+        download_catalog(path, base_url=url)
+        # An unchanged list is answered with 304 and the file kept
+        download_catalog(path, base_url=url)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    # Two pages of 20000, then one 304 for the first page
+    assert server.counts == {200: 2, 304: 1}
+    catalog = load_catalog(path, download=False)
+    assert len(catalog.indicators) == len(INDICATOR_LIST)
+    assert ids(catalog.search("co2", limit=1)) == ["EN.ATM.CO2E.KT"]
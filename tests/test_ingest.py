@@ -0,0 +1,114 @@
+# The partitioned store of ingest.py on a slice of Input/Air_Quality.csv.
+import os
+
+import json
+
+import pandas as pd
+import pytest
+
+import ingest
+from ingest import (
+    apply_delta, current_version, ingest_csv, read_part, read_store, store_names
+)
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_CSV = os.path.join(ROOT, "Input", "Air_Quality.csv")
+
+
+@pytest.fixture(scope="module")
+def sample():
+    return pd.read_csv(SAMPLE_CSV, nrows=2000)
+
+
+def write_csv(df, path):
+    df.to_csv(path, index=False)
+    return str(path)
+
+
+def read_version(store_dir, number):
+    with open(os.path.join(store_dir, "versions", f"{number}.json")) as f:
+        return json.load(f)
+
+
+def stored(store_dir):
+    return read_store(str(store_dir)).sort_values("Unique ID").reset_index(drop=True)
+
+
+def test_ingest_keeps_last_row_across_partitions(sample, tmp_path):
+    # the same readings again, a year later and with new values, in a later chunk
+    moved = sample.iloc[:5].copy()
+    moved["Start_Date"] = "01/01/2030"
+    moved["Data Value"] = -1.0
+    csv_path = write_csv(pd.concat([sample, moved]), tmp_path / "extract.csv")
+
+    ingest_csv(csv_path, str(tmp_path / "store"), chunksize=500)
+
+    df = stored(tmp_path / "store")
+    assert len(df) == df["Unique ID"].nunique() == sample["Unique ID"].nunique()
+    rows = df[df["Unique ID"].isin(moved["Unique ID"])]
+    assert (rows["Start_Date"].dt.year == 2030).all()
+    assert (rows["Data Value"] == -1.0).all()
+
+
+def test_delta_moves_row_out_of_partition_it_also_writes_to(sample, tmp_path):
+    store_dir = str(tmp_path / "store")
+    ingest_csv(write_csv(sample, tmp_path / "extract.csv"), store_dir)
+    before = stored(store_dir)
+
+    # 172653 moves from 2010 to 2030, and another reading of its 2010
+    # partition changes
+    dates = pd.to_datetime(sample["Start_Date"], format="%m/%d/%Y")
+    row = sample[sample["Unique ID"] == 172653]
+    moved = row.assign(Start_Date="01/01/2030")
+    other = sample[
+        (sample["Name"] == row["Name"].item())
+        & (dates.dt.year == 2010)
+        & (sample["Unique ID"] != 172653)
+    ].iloc[:1]
+    other = other.assign(**{"Data Value": -1.0})
+    apply_delta(write_csv(pd.concat([moved, other]), tmp_path / "delta.csv"), store_dir)
+
+    df = stored(store_dir)
+    assert len(df) == len(before) == df["Unique ID"].nunique()
+    row = df[df["Unique ID"] == 172653]
+    assert len(row) == 1 and row["Start_Date"].dt.year.item() == 2030
+    assert df.loc[df["Unique ID"] == other["Unique ID"].item(), "Data Value"].item() == -1.0
+
+
+def test_publish_keeps_the_last_versions(sample, tmp_path):
+    store_dir = str(tmp_path / "store")
+    ingest_csv(write_csv(sample, tmp_path / "extract.csv"), store_dir, keep_versions=2)
+    first = current_version(store_dir)
+    for value in (-1.0, -2.0, -3.0):
+        delta = sample.iloc[:5].assign(**{"Data Value": value})
+        apply_delta(write_csv(delta, tmp_path / "delta.csv"), store_dir, keep_versions=2)
+
+    assert sorted(os.listdir(os.path.join(store_dir, "versions"))) == ["3.json", "4.json"]
+    kept = {p["path"] for n in (3, 4) for p in read_version(store_dir, n)["partitions"]}
+    assert all(os.path.isdir(path) for path in kept)
+    # The rewritten partitions of versions 1 and 2 are gone, the shared ones stay
+    first_paths = {p["path"] for p in first["partitions"]}
+    assert any(not os.path.exists(path) for path in first_paths - kept)
+    assert all(os.path.isdir(path) for path in first_paths & kept)
+    on_disk = {
+        os.path.join(root, d) for root, dirs, _ in os.walk(os.path.join(store_dir, "partitions"))
+        for d in dirs if os.path.exists(os.path.join(root, d, "columns.json"))
+    }
+    assert {os.path.normpath(p) for p in on_disk} == {os.path.normpath(p) for p in kept}
+    assert len(read_store(store_dir, manifest=read_version(store_dir, 3))) == len(stored(store_dir))
+
+
+def test_read_store_reads_only_the_requested_partitions(sample, tmp_path, monkeypatch):
+    store_dir = str(tmp_path / "store")
+    manifest = ingest_csv(write_csv(sample, tmp_path / "extract.csv"), store_dir)
+    name = store_names(store_dir)[-1]
+    year = max(p["year"] for p in manifest["partitions"] if p["name"] == name)
+    read = []
+    monkeypatch.setattr(ingest, "read_part", lambda path: read.append(path) or read_part(path))
+
+    df = read_store(store_dir, names=[name], years=[year])
+
+    assert set(df["Name"]) == {name} and set(df["Start_Date"].dt.year) == {year}
+    assert read == [
+        p["path"] for p in manifest["partitions"] if p["name"] == name and p["year"] == year
+    ]
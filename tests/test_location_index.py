@@ -0,0 +1,68 @@
+# LocationIndex against the DataFrame filter it replaced, on a slice of
+# Input/Air_Quality.csv.
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from data_loader import parse_air_quality
+from location_index import LocationIndex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_CSV = os.path.join(ROOT, "Input", "Air_Quality.csv")
+
+
+@pytest.fixture(scope="module")
+def df():
+    return parse_air_quality(pd.read_csv(SAMPLE_CSV, nrows=5000))
+
+
+def filtered(df, names, start=None, end=None):
+    """The old filter: isin() over every row, in selection and date order."""
+    rows = df[df["Geo Place Name"].isin(names)]
+    if start is not None:
+        rows = rows[rows["Start_Date"] >= pd.Timestamp(start)]
+    if end is not None:
+        rows = rows[rows["Start_Date"] <= pd.Timestamp(end)]
+    order = {name: i for i, name in enumerate(names)}
+    rows = rows.assign(order=rows["Geo Place Name"].map(order).astype(int))
+    rows = rows.sort_values(["order", "Start_Date"], kind="stable")
+    return rows[["Geo Place Name", "Start_Date", "Data Value"]].reset_index(drop=True)
+
+
+def test_locations_match_the_frame(df):
+    index = LocationIndex(df)
+
+    assert index.locations() == sorted(df["Geo Place Name"].astype(str).unique())
+    assert sum(stop - start for start, stop in index.blocks.values()) == len(df)
+
+
+@pytest.mark.parametrize("start, end", [
+    (None, None), ("2012-01-01", None), ("2010-06-01", "2015-12-31"),
+])
+def test_select_matches_the_filter(df, start, end):
+    index = LocationIndex(df)
+    names = index.locations()
+    # An unordered selection, with a location that is not in the data
+    names = [names[5], names[0], "Atlantis", names[-1]]
+
+    selected = index.select(names, start=start, end=end).reset_index(drop=True)
+
+    expected = filtered(df, names, start, end)
+    pd.testing.assert_frame_equal(selected, expected, check_categorical=False)
+
+
+def test_only_longer_blocks_are_downsampled(df):
+    index = LocationIndex(df)
+    name = index.locations()[0]
+    lo, hi = index.blocks[name]
+
+    def first_and_last(x, y, max_points):
+        return np.array([0, len(x) - 1])
+
+    thinned = index.positions([name], max_points=hi - lo - 1, downsample=first_and_last)
+    whole = index.positions([name], max_points=hi - lo, downsample=first_and_last)
+
+    assert list(thinned) == [lo, hi - 1]
+    assert list(whole) == list(range(lo, hi))
@@ -0,0 +1,49 @@
+# PartitionStore on a slice of Input/Air_Quality.csv, and on the store of
+# ingest.py.
+import os
+
+import pandas as pd
+
+from data_loader import parse_air_quality
+from ingest import ingest_csv, read_store, store_names
+from partition_store import PartitionStore
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_CSV = os.path.join(ROOT, "Input", "Air_Quality.csv")
+
+
+def test_unparsed_time_periods_are_kept():
+    raw = pd.read_csv(SAMPLE_CSV, nrows=2000)
+    raw.loc[:19, "Time Period"] = "Unknown 2010"
+    raw.loc[20:29, "Time Period"] = None
+    df = parse_air_quality(raw)
+    assert df["Season"].isna().sum() == 30
+
+    store = PartitionStore(df)
+
+    assert sum(len(index.frame) for index in store.partitions.values()) == len(df)
+    other = [key for key in store.partitions if key[3:] == ("Other", "other")]
+    assert sum(len(store.partitions[key].frame) for key in other) == 30
+    for key in other:
+        assert store.partitions[key].frame["Period Start"].notna().all()
+        assert min(store.years[key]) > 0
+
+
+def test_store_built_one_pollutant_at_a_time(tmp_path):
+    csv_path = tmp_path / "extract.csv"
+    pd.read_csv(SAMPLE_CSV, nrows=5000).to_csv(csv_path, index=False)
+    store_dir = str(tmp_path / "store")
+    ingest_csv(str(csv_path), store_dir)
+
+    whole = PartitionStore(read_store(store_dir))
+    by_name = PartitionStore.from_frames(
+        read_store(store_dir, names=[name]) for name in store_names(store_dir)
+    )
+
+    assert by_name.partitions.keys() == whole.partitions.keys()
+    assert (by_name.years, by_name.units) == (whole.years, whole.units)
+    for key, index in whole.partitions.items():
+        assert by_name.partitions[key].blocks == index.blocks
+        pd.testing.assert_frame_equal(
+            by_name.partitions[key].frame, index.frame, check_categorical=False
+        )
@@ -0,0 +1,38 @@
+# Bounds on the snapshot event streams of snapshot_events.py.
+import json
+import time
+
+from snapshot_events import OVERFLOW_RETRY, VersionBroadcaster
+
+
+def broadcaster(tmp_path, **kwargs):
+    with open(tmp_path / "latest.json", "w") as f:
+        json.dump({"version": "v1", "hash": "v1", "path": ""}, f)
+    return VersionBroadcaster(str(tmp_path), poll_interval=0.05, heartbeat=0.1, **kwargs)
+
+
+def test_stream_ends_after_max_age(tmp_path):
+    events = broadcaster(tmp_path, max_age=0.5)
+
+    start = time.monotonic()
+    frames = list(events.stream())
+
+    assert time.monotonic() - start < 2
+    assert frames[:2] == ["retry: 5000\n\n", "event: snapshot\ndata: v1\n\n"]
+    assert frames[2:] and set(frames[2:]) == {": keep-alive\n\n"}
+    assert events.clients == 0
+
+
+def test_streams_over_the_limit_end_at_once(tmp_path):
+    events = broadcaster(tmp_path, max_age=60, max_streams=1)
+    held = events.stream()
+    assert next(held) == "retry: 5000\n\n"
+
+    assert list(events.stream()) == [
+        f"retry: {OVERFLOW_RETRY * 1000}\n\n", "event: snapshot\ndata: v1\n\n",
+    ]
+    assert events.clients == 1
+
+    held.close()
+    assert events.clients == 0
+    assert next(events.stream()) == "retry: 5000\n\n"
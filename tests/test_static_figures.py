@@ -0,0 +1,104 @@
+# The view route of static_figures.py on a bare Flask app: ETags, 304
+# answers, encodings and versions that are not served.
+import gzip
+import json
+
+import pytest
+from flask import Flask
+
+from static_figures import CACHE_CONTROL, StaticViews
+
+FIGURE = {"data": [{"type": "scatter", "x": [1, 2, 3], "y": [4, 5, 6]}], "layout": {}}
+
+
+@pytest.fixture
+def views(tmp_path):
+    server = Flask(__name__)
+    views = StaticViews(server, lambda: views.current, "json-lttb", str(tmp_path))
+    views.current = "v1"
+    views.client = server.test_client()
+    views.builds = []
+
+    @views.view("landing")
+    def landing(version):
+        views.builds.append(version)
+        return {"graph": {"figure": FIGURE}}
+
+    @views.view("empty")
+    def empty(version):
+        return None
+
+    return views
+
+
+def test_view_is_served_gzipped_with_an_etag(views):
+    resp = views.client.get(views.url("landing"), headers={"Accept-Encoding": "gzip"})
+
+    assert resp.status_code == 200
+    assert resp.headers["Content-Encoding"] == "gzip"
+    assert resp.headers["Cache-Control"] == CACHE_CONTROL
+    assert resp.headers["ETag"]
+    view = json.loads(gzip.decompress(resp.data))
+    assert view == {"version": "v1", "props": {"graph": {"figure": FIGURE}}}
+
+
+def test_matching_etag_is_answered_with_304(views):
+    first = views.client.get(views.url("landing"), headers={"Accept-Encoding": "gzip"})
+
+    resp = views.client.get(
+        views.url("landing"),
+        headers={"Accept-Encoding": "gzip", "If-None-Match": first.headers["ETag"]},
+    )
+
+    assert resp.status_code == 304
+    assert resp.data == b""
+    assert resp.headers["ETag"] == first.headers["ETag"]
+    assert resp.headers["Cache-Control"] == CACHE_CONTROL
+    # The view was built once, on the first request
+    assert views.builds == ["v1"]
+
+
+def test_rebuilt_view_keeps_its_etag(views):
+    first = views.client.get(views.url("landing"))
+    views.build("landing")
+
+    resp = views.client.get(views.url("landing"), headers={"If-None-Match": first.headers["ETag"]})
+
+    assert resp.status_code == 304
+
+
+def test_view_is_decompressed_for_clients_without_gzip(views):
+    resp = views.client.get(views.url("landing"), headers={"Accept-Encoding": "identity"})
+
+    assert resp.status_code == 200
+    assert "Content-Encoding" not in resp.headers
+    assert resp.get_json()["props"]["graph"]["figure"] == FIGURE
+
+
+def test_new_version_gets_a_new_url(views):
+    old_url = views.url("landing")
+    views.client.get(old_url)
+    views.current = "v2"
+
+    assert views.url("landing") == "/figures/landing/v2/json-lttb.json"
+    assert views.client.get(views.url("landing")).status_code == 200
+    # The old version is still served while its file exists
+    assert views.client.get(old_url).status_code == 200
+    assert views.builds == ["v1", "v2"]
+
+
+@pytest.mark.parametrize("url", [
+    "/figures/landing/v1/typed-lttb.json",
+    "/figures/unknown/v1/json-lttb.json",
+    "/figures/landing/v0/json-lttb.json",
+    "/figures/empty/v1/json-lttb.json",
+])
+def test_views_that_cannot_be_served(views, url):
+    assert views.client.get(url).status_code == 404
+    assert views.builds == []
+
+
+def test_no_url_without_a_version(views):
+    views.current = None
+
+    assert views.url("landing") is None
@@ -0,0 +1,61 @@
+# YearRangeCube of wb_cube.py against the groupby mean the choropleth ran
+# before, on a synthetic snapshot with gaps.
+import numpy as np
+import pandas as pd
+import pytest
+
+from wb_cube import YearRangeCube
+
+INDICATORS = ["IT.NET.USER.ZS", "EN.ATM.CO2E.KT"]
+
+
+def snapshot(seed=0):
+    rng = np.random.default_rng(seed)
+    countries = [(f"C{i:02d}", f"Country {i}") for i in range(30)]
+    df = pd.DataFrame(
+        [(iso3c, country, year) for iso3c, country in countries for year in range(2005, 2017)],
+        columns=["iso3c", "country", "year"],
+    )
+    for indicator in INDICATORS:
+        values = rng.uniform(0, 100, len(df))
+        # Missing years, and countries without any value
+        values[rng.random(len(df)) < 0.3] = np.nan
+        values[df["iso3c"].isin(["C03", "C17"]).to_numpy()] = np.nan
+        df[indicator] = values
+    # A country that only reports some of the years
+    return df[~((df["iso3c"] == "C05") & (df["year"] < 2010))]
+
+
+def groupby_mean(df, indicator, start_yr, end_yr):
+    dff = df[df["year"].between(start_yr, end_yr)]
+    return dff.groupby(["iso3c", "country"])[indicator].mean().reset_index()
+
+
+@pytest.mark.parametrize("start_yr, end_yr", [
+    (2005, 2006), (2005, 2016), (2010, 2010), (2007, 2013), (2000, 2008),
+])
+def test_mean_matches_groupby(start_yr, end_yr):
+    df = snapshot()
+    cube = YearRangeCube(df, INDICATORS)
+
+    for indicator in INDICATORS:
+        expected = groupby_mean(df, indicator, start_yr, end_yr)
+        got = cube.mean(indicator, start_yr, end_yr)
+        # The cube lists every country, the groupby only those in the range
+        got = got[got["iso3c"].isin(expected["iso3c"])].reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, expected)
+
+
+def test_refresh_recomputes_only_changed_indicators():
+    df = snapshot()
+    old = YearRangeCube(df, INDICATORS)
+    changed = df.assign(**{INDICATORS[1]: df[INDICATORS[1]] * 2})
+
+    cube = YearRangeCube(changed, INDICATORS, previous=old)
+
+    assert cube.sums[INDICATORS[0]] is old.sums[INDICATORS[0]]
+    assert cube.sums[INDICATORS[1]] is not old.sums[INDICATORS[1]]
+    pd.testing.assert_frame_equal(
+        cube.mean(INDICATORS[1], 2005, 2016).dropna().reset_index(drop=True),
+        groupby_mean(changed, INDICATORS[1], 2005, 2016).dropna().reset_index(drop=True),
+    )
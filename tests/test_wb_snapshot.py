@@ -0,0 +1,118 @@
+# SnapshotWriter of wb_snapshot.py against the fake API of fake_wb_server.py:
+# conditional requests, retries, batches that fail and inconsistent pages.
+import pytest
+import requests
+
+from fake_wb_server import COUNTRIES, FakeWorldBank
+from wb_fetch import fetch_pages
+from wb_snapshot import SnapshotWriter, get_snapshot, read_latest
+
+INDICATORS = {"EN.ATM.CO2E.KT": "CO2 emissions (kt)", "SG.GEN.PARL.ZS": "Women in parliament"}
+# The fake API has 198 countries, so 4 batches of 50 per indicator
+BATCHES = 4
+# URL path of the first batch of countries
+FIRST_BATCH = "/country/C001;"
+
+
+@pytest.fixture
+def server():
+    server = FakeWorldBank(("127.0.0.1", 0))
+    server.url = server.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def writer(server, tmp_path):
+    return SnapshotWriter(str(tmp_path / "wb"), base_url=server.url, indicators=INDICATORS)
+
+
+def snapshot(snapshot_dir):
+    return get_snapshot(read_latest(snapshot_dir)["version"], snapshot_dir)
+
+
+def test_unchanged_refresh_is_answered_with_304(server, tmp_path):
+    snapshots = writer(server, tmp_path)
+    version = snapshots.refresh()
+    requests_sent = sum(server.counts.values())
+    assert server.counts == {200: 1 + len(INDICATORS) * BATCHES}
+
+    assert snapshots.refresh() == version
+    assert sum(server.counts.values()) - requests_sent == server.counts[304]
+    assert server.counts[304] == 1 + len(INDICATORS) * BATCHES
+
+
+@pytest.mark.parametrize("status", [429, 503])
+def test_refresh_retries_failed_requests(server, tmp_path, status):
+    server.fail_status = status
+    server.fail_first = 2
+
+    snapshots = writer(server, tmp_path)
+    snapshots.refresh()
+
+    requests_sent = 1 + len(INDICATORS) * BATCHES
+    assert server.counts == {status: 2 * requests_sent, 200: requests_sent}
+    df = snapshot(snapshots.snapshot_dir)
+    assert df[list(INDICATORS.values())].notna().all().all()
+
+
+def test_failed_batch_is_left_out(server, tmp_path):
+    server.fail_paths = {FIRST_BATCH: 400}
+
+    snapshots = writer(server, tmp_path)
+    snapshots.refresh()
+
+    df = snapshot(snapshots.snapshot_dir)
+    first_batch = df["iso3c"] <= "C055"
+    assert df.loc[first_batch, list(INDICATORS.values())].isna().all().all()
+    assert df.loc[~first_batch, list(INDICATORS.values())].notna().all().all()
+
+
+def test_failed_batch_reuses_its_cached_copy(server, tmp_path):
+    snapshots = writer(server, tmp_path)
+    version = snapshots.refresh()
+
+    server.fail_paths = {FIRST_BATCH: 400}
+    assert snapshots.refresh() == version
+    df = snapshot(snapshots.snapshot_dir)
+    assert df[list(INDICATORS.values())].notna().all().all()
+
+
+def test_refresh_fails_when_every_batch_fails(server, tmp_path):
+    server.fail_paths = {"/indicator/": 400}
+
+    snapshots = writer(server, tmp_path)
+    with pytest.raises(requests.HTTPError):
+        snapshots.refresh()
+    assert read_latest(snapshots.snapshot_dir) is None
+
+
+class RewritingSession(requests.Session):
+    """Sends every request after the first with params changed by rewrite,
+    as a cache or proxy in between might."""
+
+    def __init__(self, rewrite):
+        super().__init__()
+        self.rewrite = rewrite
+        self.sent = 0
+
+    def get(self, url, params=None, **kwargs):
+        self.sent += 1
+        if self.sent > 1:
+            params = self.rewrite(dict(params))
+        return super().get(url, params=params, **kwargs)
+
+
+def test_every_page_is_fetched(server):
+    rows, _ = fetch_pages(requests.Session(), f"{server.url}/country", {"per_page": 40})
+
+    assert [r["id"] for r in rows] == [c["id"] for c in COUNTRIES]
+
+
+@pytest.mark.parametrize("rewrite", [
+    lambda params: dict(params, page=1),
+    lambda params: dict(params, per_page=100),
+], ids=["page", "pages"])
+def test_inconsistent_page_metadata_is_an_error(server, rewrite):
+    with pytest.raises(ValueError):
+        fetch_pages(RewritingSession(rewrite), f"{server.url}/country", {"per_page": 40})
@@ -0,0 +1,93 @@
+# Precomputed year-range aggregates for the World Bank choropleth.
+# For each indicator the snapshot is laid out as a countries x years matrix
+# and turned into prefix sums and prefix counts over the year axis. The mean
+# over any [y0, y1] range is then two column subtractions, no groupby needed.
+import threading
+
+import numpy as np
+import pandas as pd
+
+
+class YearRangeCube:
+    """Per-country prefix sums and counts for each indicator over the years."""
+
+    def __init__(self, df, indicators, previous=None):
+        self.countries = (
+            df[["iso3c", "country"]]
+            .drop_duplicates()
+            .sort_values(["iso3c", "country"])
+            .reset_index(drop=True)
+        )
+        self.years = np.sort(df["year"].unique())
+
+        rows = pd.MultiIndex.from_frame(self.countries).get_indexer(
+            pd.MultiIndex.from_frame(df[["iso3c", "country"]])
+        )
+        cols = np.searchsorted(self.years, df["year"].to_numpy())
+        shape = (len(self.countries), len(self.years))
+
+        # Indicators whose values did not change since the previous cube keep
+        # their prefix arrays, so a refresh only recomputes what changed
+        reuse = previous is not None and previous._same_axes(self)
+
+        self.values, self.sums, self.counts = {}, {}, {}
+        for indicator in indicators:
+            values = np.full(shape, np.nan)
+            values[rows, cols] = df[indicator].to_numpy(dtype=float)
+            self.values[indicator] = values
+            if (
+                reuse
+                and indicator in previous.values
+                and np.array_equal(previous.values[indicator], values, equal_nan=True)
+            ):
+                self.sums[indicator] = previous.sums[indicator]
+                self.counts[indicator] = previous.counts[indicator]
+                continue
+            present = ~np.isnan(values)
+            zeros = np.zeros((shape[0], 1))
+            self.sums[indicator] = np.hstack(
+                [zeros, np.cumsum(np.where(present, values, 0.0), axis=1)]
+            )
+            self.counts[indicator] = np.hstack([zeros, np.cumsum(present, axis=1)])
+
+    def _same_axes(self, other):
+        return np.array_equal(self.years, other.years) and self.countries.equals(
+            other.countries
+        )
+
+    def mean(self, indicator, start_yr, end_yr):
+        """Returns iso3c, country and the indicator's mean over the years.
+
+        Matches groupby(["iso3c", "country"]).mean(): missing values are
+        skipped and a country with no values in the range gets NaN.
+        """
+        i0 = np.searchsorted(self.years, start_yr, side="left")
+        i1 = np.searchsorted(self.years, end_yr, side="right")
+        sums = self.sums[indicator][:, i1] - self.sums[indicator][:, i0]
+        counts = self.counts[indicator][:, i1] - self.counts[indicator][:, i0]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(counts > 0, sums / counts, np.nan)
+        dff = self.countries.copy()
+        dff[indicator] = means
+        return dff
+
+
+# Cubes built by this process, keyed by snapshot version. Callbacks run on
+# several threads, so the check, build, insert and eviction hold the lock.
+_cubes = {}
+_cubes_lock = threading.Lock()
+
+
+def get_cube(version, dff, indicators, keep=3):
+    """Returns the cube for a snapshot version, building it on first use.
+
+    A new version is built incrementally from the most recent cube.
+    """
+    with _cubes_lock:
+        cube = _cubes.get(version)
+        if cube is None:
+            previous = _cubes[list(_cubes)[-1]] if _cubes else None
+            cube = _cubes[version] = YearRangeCube(dff, indicators, previous)
+            for old in list(_cubes)[:-keep]:
+                _cubes.pop(old, None)
+    return cube
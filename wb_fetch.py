@@ -0,0 +1,121 @@
+# HTTP plumbing for the World Bank refresher.
+# Downloads are split into small jobs (one indicator for one batch of
+# countries) that run concurrently on a bounded thread pool over one pooled
+# session. Each request is retried with exponential backoff, and a job that
+# still fails is reported back instead of failing the whole refresh.
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+WB_API_URL = os.environ.get("WB_API_URL", "https://api.worldbank.org/v2")
+
+MAX_WORKERS = 8
+RETRIES = 4
+BACKOFF = 0.5
+# Status codes worth another try; anything else is raised at once
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+def make_session(pool_size=MAX_WORKERS):
+    """Returns a session keeping up to pool_size connections per host open."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_with_retry(session, url, retries=RETRIES, backoff=BACKOFF, **kwargs):
+    """session.get with exponential backoff (and jitter) on connection
+    errors, timeouts and RETRY_STATUS responses."""
+    for attempt in range(retries + 1):
+        try:
+            resp = session.get(url, **kwargs)
+            if resp.status_code not in RETRY_STATUS or attempt == retries:
+                return resp
+            # Hand the connection back to the pool before sleeping
+            resp.close()
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == retries:
+                raise
+        time.sleep(backoff * 2**attempt * (0.5 + random.random()))
+
+
+def fetch_pages(session, url, params, validators=None, timeout=30):
+    """Fetches every page of a World Bank API query.
+
+    Returns (rows, validators). rows is None when the server answered the
+    conditional request with 304 Not Modified.
+    """
+    headers = {}
+    validators = validators or {}
+    if validators.get("etag"):
+        headers["If-None-Match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["If-Modified-Since"] = validators["last_modified"]
+
+    params = dict(params, format="json", page=1)
+    resp = get_with_retry(session, url, params=params, headers=headers, timeout=timeout)
+    if resp.status_code == 304:
+        return None, validators
+    resp.raise_for_status()
+    new_validators = {
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    }
+
+    pages, rows = page_rows(resp, url, 1)
+    for page in range(2, pages + 1):
+        params["page"] = page
+        resp = get_with_retry(session, url, params=params, timeout=timeout)
+        resp.raise_for_status()
+        rows.extend(page_rows(resp, url, page, pages)[1])
+    return rows, new_validators
+
+
+def page_rows(resp, url, page, pages=None):
+    """Returns (pages, rows) of one page of a World Bank API response.
+
+    Raises ValueError for an error payload, or when the page metadata does
+    not match the page requested or the page count of the first page.
+    """
+    payload = resp.json()
+    if not isinstance(payload, list) or len(payload) < 2 or not isinstance(payload[0], dict):
+        raise ValueError(f"World Bank API error for {url}: {payload}")
+    meta = payload[0]
+    try:
+        got_page, got_pages = int(meta.get("page", page)), int(meta.get("pages", 1))
+    except (TypeError, ValueError):
+        raise ValueError(f"Bad page metadata for {url}: {meta}") from None
+    if got_page != page or (pages is not None and got_pages != pages):
+        raise ValueError(
+            f"Page {got_page} of {got_pages} returned for page {page} of "
+            f"{pages or got_pages} of {url}"
+        )
+    return got_pages, list(payload[1] or [])
+
+
+def batches(items, size):
+    """Splits a list into consecutive batches of at most size items."""
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_jobs(jobs, max_workers=MAX_WORKERS):
+    """Runs {name: callable} concurrently.
+
+    Returns ({name: result}, {name: exception}) for the jobs that succeeded
+    and failed.
+    """
+    results, errors = {}, {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {name: pool.submit(job) for name, job in jobs.items()}
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except (requests.RequestException, ValueError) as e:
+                errors[name] = e
+    return results, errors
@@ -0,0 +1,305 @@
+# Background refresher for the World Bank data used by api_application.py.
+# One refresher process downloads the indicators on a schedule and writes a
+# versioned snapshot to disk; the Dash callbacks only ever read the latest
+# snapshot. Each request is conditional (ETag / Last-Modified), so a refresh
+# where nothing changed costs a handful of 304 responses.
+#
+# Run it next to the app:
+#     python wb_snapshot.py --interval 3600
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import pandas as pd
+import requests
+
+from indicator_catalog import load_indicators
+from wb_fetch import (
+    MAX_WORKERS,
+    WB_API_URL,
+    batches,
+    fetch_pages,
+    make_session,
+    run_jobs,
+)
+
+SNAPSHOT_DIR = os.environ.get("WB_SNAPSHOT_DIR", "cache/wb")
+REFRESH_INTERVAL = int(os.environ.get("WB_REFRESH_INTERVAL", 6 * 60 * 60))
+
+START_YEAR = 2005
+END_YEAR = 2016
+# Countries per indicator request; every batch is fetched and cached on its own
+COUNTRY_BATCH = 50
+
+# Indicators to download, {id: name}, and short colour bar labels by name;
+# edit indicators.json to change them
+INDICATORS, INDICATOR_LABELS = load_indicators()
+
+
+def _write_atomic(path, write):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    write(tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _write_json(path, data):
+    def write(tmp_path):
+        with open(tmp_path, "w") as f:
+            json.dump(data, f, indent=1)
+    _write_atomic(path, write)
+
+
+def _read_json(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+
+
+def clean_countries(rows):
+    """Keeps real countries (those with a capital city), as country/iso3c."""
+    countries = pd.DataFrame(
+        [(r["name"], r["id"], r.get("capitalCity", "")) for r in rows],
+        columns=["country", "iso3c", "capitalCity"],
+    )
+    countries = countries[countries["capitalCity"].fillna("") != ""]
+    countries = countries[countries["country"] != "Kosovo"]
+    return countries[["country", "iso3c"]].reset_index(drop=True)
+
+
+def indicator_frame(rows, indicator):
+    """Converts API rows for one indicator to an iso3c/year/value frame."""
+    df = pd.DataFrame(
+        [(r["countryiso3code"], r["date"], r["value"]) for r in rows],
+        columns=["iso3c", "year", indicator],
+    )
+    df["year"] = df["year"].astype(int)
+    df[indicator] = df[indicator].astype(float)
+    return df
+
+
+def merge_snapshot(countries, frames, indicators=INDICATORS):
+    """Builds the frame the app works with: country, year, indicators, iso3c."""
+    df = None
+    for frame in frames:
+        df = frame if df is None else df.merge(frame, on=["iso3c", "year"], how="outer")
+    df = df.merge(countries, on="iso3c")
+    # Indicators whose every batch failed are kept as empty columns
+    df = df.reindex(columns=["country", "year", *indicators, "iso3c"])
+    df = df.sort_values(["country", "year"], ascending=[True, False])
+    df = df.rename(columns=indicators).reset_index(drop=True)
+    return df
+
+
+class SnapshotWriter:
+    """Downloads the World Bank data and publishes versioned snapshots."""
+
+    def __init__(
+        self,
+        snapshot_dir=SNAPSHOT_DIR,
+        base_url=WB_API_URL,
+        indicators=INDICATORS,
+        start=START_YEAR,
+        end=END_YEAR,
+        keep=3,
+        session=None,
+        batch_size=COUNTRY_BATCH,
+        max_workers=MAX_WORKERS,
+    ):
+        self.snapshot_dir = snapshot_dir
+        self.base_url = base_url.rstrip("/")
+        self.indicators = indicators
+        self.start = start
+        self.end = end
+        self.keep = keep
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.session = session or make_session(max_workers)
+        os.makedirs(os.path.join(snapshot_dir, "parts"), exist_ok=True)
+        os.makedirs(os.path.join(snapshot_dir, "snapshots"), exist_ok=True)
+
+    def _part(self, name, url, params, state, parse):
+        """Fetches one part, reusing the cached copy on 304.
+
+        If the part cannot be fetched its last cached copy is used, when
+        there is one.
+        """
+        path = os.path.join(self.snapshot_dir, "parts", name + ".pkl")
+        validators = state["validators"].get(name) if os.path.exists(path) else None
+        try:
+            rows, validators = fetch_pages(self.session, url, params, validators)
+        except (requests.RequestException, ValueError):
+            if validators is None:
+                raise
+            state["stale"].append(name)
+            return pd.read_pickle(path)
+        state["validators"][name] = validators
+        if rows is None:
+            return pd.read_pickle(path)
+        df = parse(rows)
+        _write_atomic(path, df.to_pickle)
+        return df
+
+    def refresh(self):
+        """Runs one refresh and returns the published version.
+
+        A new version is only written when the downloaded data changed.
+        """
+        state_path = os.path.join(self.snapshot_dir, "state.json")
+        state = _read_json(state_path, {"validators": {}})
+        state["stale"] = []
+
+        countries = self._part(
+            "countries",
+            f"{self.base_url}/country",
+            {"per_page": 1000},
+            state,
+            clean_countries,
+        )
+        # One job per indicator and batch of countries, run concurrently.
+        # Part names include a digest of the batch, so a changed country list
+        # never reuses another batch's cached rows.
+        jobs = {}
+        for indicator in self.indicators:
+            for batch in batches(list(countries["iso3c"]), self.batch_size):
+                codes = ";".join(batch)
+                name = f"{indicator}-{hashlib.sha1(codes.encode()).hexdigest()[:10]}"
+                jobs[name] = lambda indicator=indicator, codes=codes, name=name: (
+                    self._part(
+                        name,
+                        f"{self.base_url}/country/{codes}/indicator/{indicator}",
+                        {"date": f"{self.start}:{self.end}", "per_page": 20000},
+                        state,
+                        lambda rows: indicator_frame(rows, indicator),
+                    )
+                )
+        parts, errors = run_jobs(jobs, self.max_workers)
+        if errors and not parts:
+            raise next(iter(errors.values()))
+        state["failed"] = sorted(errors)
+        if errors or state["stale"]:
+            print(
+                f"World Bank refresh incomplete: {len(errors)} parts failed, "
+                f"{len(state['stale'])} stale parts reused"
+            )
+        self._prune_parts(["countries", *jobs])
+
+        # Batches that failed without a cached copy are left out (NaN)
+        frames = []
+        for indicator in self.indicators:
+            batch_frames = [
+                df for name, df in parts.items() if name.startswith(indicator + "-")
+            ]
+            if batch_frames:
+                frames.append(pd.concat(batch_frames, ignore_index=True))
+        df = merge_snapshot(countries, frames, self.indicators)
+
+        content_hash = hashlib.sha1(
+            pd.util.hash_pandas_object(df, index=False).values.tobytes()
+        ).hexdigest()[:12]
+        latest = read_latest(self.snapshot_dir)
+        state["checked_at"] = datetime.now(timezone.utc).isoformat()
+        if latest and latest["hash"] == content_hash:
+            _write_json(state_path, state)
+            return latest["version"]
+
+        version = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S") + "-" + content_hash
+        path = os.path.join(self.snapshot_dir, "snapshots", version + ".pkl")
+        _write_atomic(path, df.to_pickle)
+        _write_json(
+            os.path.join(self.snapshot_dir, "latest.json"),
+            {"version": version, "hash": content_hash, "path": path},
+        )
+        _write_json(state_path, state)
+        self._prune()
+        return version
+
+    def _prune_parts(self, names):
+        # Cached parts of batches that no longer exist
+        parts_dir = os.path.join(self.snapshot_dir, "parts")
+        for file_name in os.listdir(parts_dir):
+            if os.path.splitext(file_name)[0] not in names:
+                os.remove(os.path.join(parts_dir, file_name))
+
+    def _prune(self):
+        # Keep a few old versions for readers that are mid-load
+        snapshots = sorted(os.listdir(os.path.join(self.snapshot_dir, "snapshots")))
+        for name in snapshots[: -self.keep]:
+            os.remove(os.path.join(self.snapshot_dir, "snapshots", name))
+
+    def run_forever(self, interval=REFRESH_INTERVAL):
+        """Refreshes on a fixed schedule; only one refresher runs per directory."""
+        lock = open(os.path.join(self.snapshot_dir, "refresher.lock"), "w")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            print(f"Another refresher is already writing to {self.snapshot_dir}")
+            return
+        while True:
+            try:
+                print(f"Published World Bank snapshot {self.refresh()}")
+            except (requests.RequestException, ValueError) as e:
+                print(f"World Bank refresh failed, keeping last snapshot: {e}")
+            time.sleep(interval)
+
+
+def read_latest(snapshot_dir=SNAPSHOT_DIR):
+    """Returns the latest snapshot pointer, or None if nothing is published."""
+    return _read_json(os.path.join(snapshot_dir, "latest.json"))
+
+
+# Snapshots already read by this process, keyed by (snapshot_dir, version).
+# Callbacks run on several threads, so reads and evictions hold the lock.
+_loaded = {}
+_loaded_lock = threading.Lock()
+
+
+def get_snapshot(version, snapshot_dir=SNAPSHOT_DIR, keep=3):
+    """Returns the frame for a published snapshot version, or None.
+
+    Frames are kept in process, so callbacks holding only a version ID never
+    re-read or re-parse the data.
+    """
+    key = (snapshot_dir, version)
+    with _loaded_lock:
+        dff = _loaded.get(key)
+        if dff is None:
+            path = os.path.join(snapshot_dir, "snapshots", f"{version}.pkl")
+            if not os.path.exists(path):
+                return None
+            dff = _loaded[key] = pd.read_pickle(path)
+            # Drop the oldest versions held by this process
+            for old in [k for k in _loaded if k[0] == snapshot_dir][:-keep]:
+                _loaded.pop(old, None)
+    return dff
+
+
+def load_snapshot(snapshot_dir=SNAPSHOT_DIR):
+    """Returns (version, frame) for the latest snapshot, or (None, None)."""
+    latest = read_latest(snapshot_dir)
+    if latest is None:
+        return None, None
+    return latest["version"], get_snapshot(latest["version"], snapshot_dir)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refresh the World Bank snapshot.")
+    parser.add_argument("--interval", type=int, default=REFRESH_INTERVAL,
+                        help="seconds between refreshes")
+    parser.add_argument("--once", action="store_true", help="refresh once and exit")
+    parser.add_argument("--base-url", default=WB_API_URL,
+                        help="World Bank API root, e.g. a local stub server")
+    parser.add_argument("--snapshot-dir", default=SNAPSHOT_DIR)
+    args = parser.parse_args()
+
+    writer = SnapshotWriter(args.snapshot_dir, base_url=args.base_url)
+    if args.once:
+        print(f"Published World Bank snapshot {writer.refresh()}")
+    else:
+        writer.run_forever(args.interval)